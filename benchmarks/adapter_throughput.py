@@ -0,0 +1,234 @@
+"""
+Throughput and latency of `RamalamaInferenceAdapter` at several concurrency
+levels, against the stand-in server of `stub_server.py` (started in a
+separate process, so the CPU time reported is the adapter's own) or
+against a running `ramalama serve`.
+
+    python benchmarks/adapter_throughput.py --concurrency 1,8,32 --stream
+    python benchmarks/adapter_throughput.py --endpoint embeddings \\
+        --config '{"embedding_batch_window_ms": 5}'
+    python benchmarks/adapter_throughput.py --url http://localhost:8080 --model llama3.2:3b
+
+Every stub server option (`--ttft`, `--tokens-per-second`, `--slots`,
+`--error-rate`) can be given too; see `stub_server.py --help`.
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_stack.apis.inference import SamplingParams, UserMessage
+from llama_stack.apis.models import Model, ModelType
+
+from ramalama_stack.config import RamalamaImplConfig
+from ramalama_stack.ramalama_adapter import RamalamaInferenceAdapter
+from stub_server import start_stub_server
+
+
+class _ModelStore:
+    """
+    Stands in for the Llama Stack model registry, which the adapter asks
+    for the provider id of a model.
+    """
+
+    def __init__(self, model: str, model_type: ModelType) -> None:
+        self.model = Model(
+            identifier=model,
+            provider_resource_id=model,
+            provider_id="ramalama",
+            model_type=model_type,
+        )
+
+    async def get_model(self, model_id: str) -> Model:
+        return self.model
+
+
+def _stub_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    return start_stub_server(
+        model=args.model,
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        slots=args.slots,
+        error_rate=args.error_rate,
+        max_tokens=args.max_tokens,
+    )
+
+
+async def _one_request(
+    adapter: RamalamaInferenceAdapter, args: argparse.Namespace, i: int
+) -> Dict[str, Any]:
+    # distinct prompts, so that no cache answers in place of the server
+    text = f"request {i}" if not args.same_prompt else "request"
+    started = time.perf_counter()
+    first_token = None
+    if args.endpoint == "embeddings":
+        await adapter.embeddings(args.model, [text])
+    elif args.endpoint == "completion":
+        response = await adapter.completion(
+            args.model,
+            text,
+            sampling_params=SamplingParams(max_tokens=args.max_tokens),
+            stream=args.stream,
+        )
+        if args.stream:
+            async for chunk in response:
+                if first_token is None and chunk.delta:
+                    first_token = time.perf_counter()
+    else:
+        response = await adapter.chat_completion(
+            args.model,
+            [UserMessage(content=text)],
+            sampling_params=SamplingParams(max_tokens=args.max_tokens),
+            stream=args.stream,
+        )
+        if args.stream:
+            async for chunk in response:
+                if first_token is None and getattr(chunk.event.delta, "text", None):
+                    first_token = time.perf_counter()
+    ended = time.perf_counter()
+    return {
+        "latency": ended - started,
+        "ttft": first_token - started if first_token is not None else None,
+    }
+
+
+async def run_level(
+    adapter: RamalamaInferenceAdapter, args: argparse.Namespace, concurrency: int
+) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i: int) -> Any:
+        async with semaphore:
+            try:
+                return await _one_request(adapter, args, i)
+            except Exception as e:
+                return e
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(bounded(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    ok = [r for r in results if not isinstance(r, Exception)]
+    errors = [r for r in results if isinstance(r, Exception)]
+    latencies = sorted(r["latency"] for r in ok)
+    ttfts = sorted(r["ttft"] for r in ok if r["ttft"] is not None)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(errors),
+        "first_error": repr(errors[0]) if errors else None,
+        "throughput": len(ok) / elapsed,
+        "p50": _percentile(latencies, 0.50),
+        "p99": _percentile(latencies, 0.99),
+        "ttft_p50": _percentile(ttfts, 0.50),
+        "cpu_ms_per_request": cpu * 1000 / len(results),
+    }
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+async def main(args: argparse.Namespace) -> int:
+    """
+    Run the benchmark, returning 1 if requests failed that the stub server
+    was not asked to fail, since the figures then measure the error path.
+    """
+    status = 0
+    process = None
+    url = args.url
+    if url is None:
+        process, url = _stub_server(args)
+    try:
+        config = RamalamaImplConfig(url=url, **json.loads(args.config))
+        adapter = RamalamaInferenceAdapter(config)
+        adapter.model_store = _ModelStore(
+            args.model,
+            ModelType.embedding if args.endpoint == "embeddings" else ModelType.llm,
+        )
+        await adapter.initialize()
+        try:
+            print(
+                f"{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} "
+                f"{'p50 ms':>8} {'p99 ms':>8} {'ttft ms':>8} {'cpu ms/req':>10}"
+            )
+            for level in args.concurrency:
+                r = await run_level(adapter, args, level)
+                print(
+                    f"{r['concurrency']:>11} {r['requests']:>8} {r['errors']:>6} "
+                    f"{r['throughput']:>8.1f} {_ms(r['p50']):>8} {_ms(r['p99']):>8} "
+                    f"{_ms(r['ttft_p50']):>8} {r['cpu_ms_per_request']:>10.2f}"
+                )
+                if r["errors"] and not args.error_rate:
+                    print(
+                        f"{r['errors']} requests failed, first: {r['first_error']}",
+                        file=sys.stderr,
+                    )
+                    status = 1
+            if args.stats:
+                print(json.dumps(adapter.get_stats(), indent=2, default=str))
+        finally:
+            await adapter.shutdown()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return status
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--url", help="benchmark a running server instead of the stub server"
+    )
+    parser.add_argument("--model", default="stub")
+    parser.add_argument(
+        "--endpoint", choices=("chat", "completion", "embeddings"), default="chat"
+    )
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(c) for c in s.split(",")],
+        default=[1, 4, 16],
+        help="comma-separated concurrency levels",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=64, help="requests per concurrency level"
+    )
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument(
+        "--same-prompt",
+        action="store_true",
+        help="send the same prompt every time, e.g. to measure caches",
+    )
+    parser.add_argument(
+        "--config",
+        default="{}",
+        help="adapter options as a JSON object, e.g. '{\"response_cache_size\": 128}'",
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="print the adapter's get_stats()"
+    )
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
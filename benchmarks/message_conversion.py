@@ -0,0 +1,80 @@
+"""
+Per-turn cost of converting a growing agent conversation into an OpenAI
+chat completion request, with and without the message conversion cache.
+
+    python benchmarks/message_conversion.py [--turns N]
+"""
+
+import argparse
+import asyncio
+import time
+
+from llama_stack.apis.inference import (
+    ChatCompletionRequest,
+    CompletionMessage,
+    StopReason,
+    SystemMessage,
+    ToolResponseMessage,
+    UserMessage,
+)
+from llama_stack.models.llama.datatypes import ToolCall
+
+from ramalama_stack.conversion_cache import MessageConversionCache
+from ramalama_stack.openai_compat import convert_chat_completion_request
+
+
+def turn_messages(i):
+    """
+    The messages one agent turn adds: a question, a tool call, its result
+    and the answer.
+    """
+    call_id = f"call-{i}"
+    return [
+        UserMessage(content=f"Question {i}: what is the weather in city {i}?"),
+        CompletionMessage(
+            content="",
+            stop_reason=StopReason.end_of_turn,
+            tool_calls=[
+                ToolCall(
+                    call_id=call_id,
+                    tool_name="get_weather",
+                    arguments={"city": f"city {i}", "unit": "celsius"},
+                )
+            ],
+        ),
+        ToolResponseMessage(
+            call_id=call_id, content=f"Sunny, {i % 30} degrees, light wind."
+        ),
+        CompletionMessage(
+            content=f"It is sunny in city {i}, {i % 30} degrees.",
+            stop_reason=StopReason.end_of_turn,
+        ),
+    ]
+
+
+async def run(turns, cache):
+    history = [SystemMessage(content="You are a helpful assistant.")]
+    timings = []
+    for i in range(turns):
+        history.extend(turn_messages(i))
+        request = ChatCompletionRequest(model="bench", messages=list(history))
+        started = time.perf_counter()
+        await convert_chat_completion_request(request, message_cache=cache)
+        timings.append((len(history), time.perf_counter() - started))
+    return timings
+
+
+async def main(turns):
+    uncached = await run(turns, None)
+    cached = await run(turns, MessageConversionCache(max_size=4096))
+    print(f"{'messages':>8}{'uncached':>14}{'cached':>14}")
+    step = max(1, turns // 10)
+    for (n, old), (_, new) in list(zip(uncached, cached))[step - 1 :: step]:
+        print(f"{n:>8}{old * 1e3:>11.3f} ms{new * 1e3:>11.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.turns))
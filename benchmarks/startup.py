@@ -0,0 +1,153 @@
+"""
+Cold import time of the provider and start-up time of `get_adapter_impl`,
+each measured in fresh interpreters.
+
+    python benchmarks/startup.py [--runs N] [--importtime] [--max-import-ms MS]
+                                 [--baseline SRC]
+
+Start-up runs against the stand-in server of `stub_server.py`. With
+`--max-import-ms`, the script exits with an error when importing the
+adapter takes longer, so a CI job can catch import-time regressions.
+`--importtime` lists the modules that take longest to import.
+`--baseline` times the `src` directory of another checkout the same way
+and prints the difference, e.g. against a worktree of the main branch:
+
+    git worktree add /tmp/main main
+    python benchmarks/startup.py --baseline /tmp/main/src
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+from stub_server import start_stub_server
+
+IMPORT_PROVIDER = "import ramalama_stack"
+IMPORT_ADAPTER = "import ramalama_stack.ramalama_adapter"
+START_ADAPTER = """
+import asyncio, sys, time
+started = time.perf_counter()
+from ramalama_stack import get_adapter_impl
+from ramalama_stack.config import RamalamaImplConfig
+async def main():
+    impl = await get_adapter_impl(RamalamaImplConfig(url=sys.argv[1]), {})
+    print(time.perf_counter() - started)
+    await impl.shutdown()
+asyncio.run(main())
+"""
+
+
+def _env(src: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    The environment of an interpreter importing the provider from `src`,
+    or from where this one does when None.
+    """
+    if src is None:
+        return None
+    path = os.environ.get("PYTHONPATH")
+    return {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src, path]))}
+
+
+def _time_import(statement: str, src: Optional[str] = None) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True, env=_env(src))
+    return time.perf_counter() - started
+
+
+def _time_start(url: str, src: Optional[str] = None) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", START_ADAPTER, url],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=_env(src),
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure(url: str, runs: int, src: Optional[str] = None) -> Dict[str, float]:
+    """
+    Median timings in milliseconds, with the start-up time of the
+    interpreter itself subtracted from the import timings.
+    """
+    baseline = statistics.median(_time_import("pass", src) for _ in range(runs))
+    provider = statistics.median(
+        _time_import(IMPORT_PROVIDER, src) for _ in range(runs)
+    )
+    adapter = statistics.median(_time_import(IMPORT_ADAPTER, src) for _ in range(runs))
+    start = statistics.median(_time_start(url, src) for _ in range(runs))
+    return {
+        "import ramalama_stack": (provider - baseline) * 1000,
+        "import ramalama_adapter": (adapter - baseline) * 1000,
+        "get_adapter_impl (cold)": start * 1000,
+    }
+
+
+def slowest_imports(statement: str, count: int = 15) -> list:
+    """
+    The modules with the largest cumulative import time, from `-X importtime`.
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    timings = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if m:
+            timings.append((int(m.group(2)), m.group(4)))
+    return sorted(timings, reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument(
+        "--baseline", metavar="SRC", help="source directory to compare with"
+    )
+    args = parser.parse_args()
+
+    process, url = start_stub_server()
+    try:
+        timings = measure(url, args.runs)
+        if args.baseline:
+            baseline = measure(url, args.runs, args.baseline)
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.baseline:
+        print(f"{'':30} {'baseline':>11} {'current':>11} {'change':>8}")
+        for name, ms in timings.items():
+            was = baseline[name]
+            print(f"{name:30} {was:8.1f} ms {ms:8.1f} ms {(ms - was) / was:+8.1%}")
+    else:
+        for name, ms in timings.items():
+            print(f"{name:30} {ms:8.1f} ms")
+
+    if args.importtime:
+        print("\nslowest imports of ramalama_adapter (cumulative):")
+        for us, module in slowest_imports(IMPORT_ADAPTER):
+            print(f"  {us / 1000:8.1f} ms  {module}")
+
+    adapter = timings["import ramalama_adapter"]
+    if args.max_import_ms is not None and adapter > args.max_import_ms:
+        sys.exit(
+            f"importing the adapter took {adapter:.1f} ms, "
+            f"more than {args.max_import_ms} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-chunk cost of converting upstream OpenAI stream chunks into Llama Stack
+stream chunks, with the plain Llama Stack conversion and with the adapter's
+converters, which also close the upstream stream when the client goes away.
+
+    python benchmarks/stream_conversion.py [--chunks N] [--repeat R]
+"""
+
+import argparse
+import asyncio
+import time
+
+from llama_stack.apis.inference import CompletionResponseStreamChunk
+from llama_stack.providers.utils.inference.openai_compat import (
+    _convert_openai_finish_reason,
+    convert_openai_chat_completion_stream as plain_chat_stream,
+)
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk,
+    Choice as ChunkChoice,
+    ChoiceDelta,
+)
+from openai.types.completion import Completion
+from openai.types.completion_choice import CompletionChoice
+
+from ramalama_stack.openai_compat import (
+    _convert_openai_completion_logprobs,
+    convert_openai_chat_completion_stream,
+    convert_openai_completion_stream,
+)
+
+
+def chat_chunks(n):
+    chunks = [
+        ChatCompletionChunk(
+            id="chatcmpl-bench",
+            created=0,
+            model="bench",
+            object="chat.completion.chunk",
+            choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=f" tok{i}"))],
+        )
+        for i in range(n)
+    ]
+    chunks[-1].choices[0].finish_reason = "stop"
+    return chunks
+
+
+def completion_chunks(n):
+    chunks = [
+        Completion(
+            id="cmpl-bench",
+            created=0,
+            model="bench",
+            object="text_completion",
+            choices=[CompletionChoice(index=0, text=f" tok{i}", finish_reason="stop")],
+        )
+        for i in range(n)
+    ]
+    for chunk in chunks[:-1]:
+        chunk.choices[0].finish_reason = None
+    return chunks
+
+
+async def _iterate(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def plain_completion_stream(stream):
+    # the conversion without closing the upstream stream
+    async for chunk in stream:
+        choice = chunk.choices[0]
+        yield CompletionResponseStreamChunk(
+            delta=choice.text,
+            stop_reason=_convert_openai_finish_reason(choice.finish_reason),
+            logprobs=_convert_openai_completion_logprobs(choice.logprobs),
+        )
+
+
+async def _drain(stream):
+    async for _ in stream:
+        pass
+
+
+async def measure(convert, chunks, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await _drain(convert(_iterate(chunks)))
+        best = min(best, time.perf_counter() - started)
+    return best / len(chunks)
+
+
+async def main(n, repeat):
+    cases = [
+        (
+            "chat",
+            chat_chunks(n),
+            lambda s: plain_chat_stream(s, enable_incremental_tool_calls=True),
+            lambda s: convert_openai_chat_completion_stream(
+                s, enable_incremental_tool_calls=True
+            ),
+        ),
+        (
+            "completion",
+            completion_chunks(n),
+            plain_completion_stream,
+            convert_openai_completion_stream,
+        ),
+    ]
+    print(f"{'stream':<12}{'plain':>14}{'adapter':>14}{'ratio':>10}")
+    for name, chunks, plain, adapter in cases:
+        base = await measure(plain, chunks, repeat)
+        ours = await measure(adapter, chunks, repeat)
+        print(
+            f"{name:<12}{base * 1e6:>11.2f} us{ours * 1e6:>11.2f} us{ours / base:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.chunks, args.repeat))
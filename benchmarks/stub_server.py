@@ -0,0 +1,320 @@
+"""
+A stand-in for `ramalama serve`: answers llama.cpp's OpenAI-compatible
+endpoints with generated text, at a configurable speed, so the adapter can
+be exercised on a CPU-only machine with no model and no network.
+
+    python benchmarks/stub_server.py --port 8080 --ttft 0.2 --tokens-per-second 50
+
+Endpoints: `/chat/completions`, `/completions`, `/embeddings` and
+`/models`, also under `/v1` like llama.cpp, and `/tokenize`, `/health` and
+`/props`. Like llama.cpp, the
+server decodes at most `--slots` requests at once and queues the others,
+and refuses prompts longer than `--context-length` tokens. Words count as
+tokens.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from typing import Optional, Tuple
+
+import httpx
+from aiohttp import web
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(
+    port: Optional[int] = None, **options
+) -> Tuple[subprocess.Popen, str]:
+    """
+    Run the stub server in a separate process, on `port` or a free port,
+    taking the command line options as keyword arguments. Returns the
+    process and the server URL once it answers its health check.
+    """
+    if port is None:
+        port = free_port()
+    command = [sys.executable, __file__, "--port", str(port)]
+    for name, value in options.items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("the stub server did not start")
+        time.sleep(0.1)
+
+
+class StubServer:
+    def __init__(
+        self,
+        model: str = "stub",
+        ttft: float = 0.05,
+        tokens_per_second: float = 100.0,
+        slots: int = 4,
+        error_rate: float = 0.0,
+        max_tokens: int = 64,
+        embedding_dim: int = 384,
+        context_length: int = 4096,
+        seed: int = 0,
+    ) -> None:
+        self.model = model
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.slots = slots
+        self.error_rate = error_rate
+        self.max_tokens = max_tokens
+        self.embedding_dim = embedding_dim
+        self.context_length = context_length
+        self._slots = asyncio.Semaphore(slots)
+        self._random = random.Random(seed)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/health", self.health)
+        app.router.add_get("/props", self.props)
+        app.router.add_post("/tokenize", self.tokenize)
+        # like llama.cpp, the OpenAI endpoints are served with and without `/v1`
+        for prefix in ("", "/v1"):
+            app.router.add_get(f"{prefix}/models", self.models)
+            app.router.add_post(f"{prefix}/chat/completions", self.chat_completions)
+            app.router.add_post(f"{prefix}/completions", self.completions)
+            app.router.add_post(f"{prefix}/embeddings", self.embeddings)
+        return app
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def props(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "total_slots": self.slots,
+                "default_generation_settings": {"n_ctx": self.context_length},
+            }
+        )
+
+    async def tokenize(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        words = str(body.get("content", "")).split()
+        return web.json_response({"tokens": list(range(len(words)))})
+
+    async def models(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "object": "list",
+                "data": [
+                    {
+                        "id": self.model,
+                        "object": "model",
+                        "created": 0,
+                        "owned_by": "llamacpp",
+                    }
+                ],
+            }
+        )
+
+    def _failure(self) -> Optional[web.Response]:
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.json_response(
+                {"error": {"code": 500, "message": "simulated failure"}}, status=500
+            )
+        return None
+
+    def _token_count(self, body: dict) -> int:
+        # llama.cpp reads either field, the second one from the chat API
+        requested = body.get("max_tokens") or body.get("max_completion_tokens")
+        return min(requested or self.max_tokens, self.max_tokens)
+
+    def _prompt_tokens(self, body: dict) -> int:
+        if "messages" in body:
+            text = " ".join(str(m.get("content", "")) for m in body["messages"])
+        else:
+            text = str(body.get("prompt", ""))
+        return max(1, len(text.split()))
+
+    async def _tokens(self, count: int):
+        await asyncio.sleep(self.ttft)
+        for i in range(count):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield f" tok{i}"
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        return await self._generate(request, chat=True)
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        return await self._generate(request, chat=False)
+
+    async def _generate(self, request: web.Request, chat: bool) -> web.StreamResponse:
+        body = await request.json()
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        prompt_tokens = self._prompt_tokens(body)
+        if prompt_tokens >= self.context_length:
+            return web.json_response(
+                {
+                    "error": {
+                        "code": 400,
+                        "message": "the request exceeds the available context size",
+                        "type": "exceed_context_size_error",
+                    }
+                },
+                status=400,
+            )
+        count = self._token_count(body)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count,
+            "total_tokens": prompt_tokens + count,
+        }
+        common = {
+            "id": f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": body.get("model", self.model),
+        }
+
+        async with self._slots:
+            if not body.get("stream"):
+                text = "".join([token async for token in self._tokens(count)])
+                if chat:
+                    choice = {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "length",
+                    }
+                else:
+                    choice = {"index": 0, "text": text, "finish_reason": "length"}
+                return web.json_response(
+                    {
+                        **common,
+                        "object": "chat.completion" if chat else "text_completion",
+                        "choices": [choice],
+                        "usage": usage,
+                    }
+                )
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            obj = "chat.completion.chunk" if chat else "text_completion"
+            i = 0
+            async for token in self._tokens(count):
+                i += 1
+                last = i == count
+                if chat:
+                    choice = {
+                        "index": 0,
+                        "delta": {"content": token},
+                        "finish_reason": "length" if last else None,
+                    }
+                else:
+                    choice = {
+                        "index": 0,
+                        "text": token,
+                        "finish_reason": "length" if last else None,
+                    }
+                chunk = {**common, "object": obj, "choices": [choice]}
+                if last:
+                    chunk["usage"] = usage
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        async with self._slots:
+            await asyncio.sleep(self.ttft)
+        return web.json_response(
+            {
+                "object": "list",
+                "model": body.get("model", self.model),
+                "data": [
+                    {
+                        "object": "embedding",
+                        "index": i,
+                        "embedding": self._embedding(str(text)),
+                    }
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            }
+        )
+
+    def _embedding(self, text: str) -> list:
+        # deterministic, unit-length vector derived from the text
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0, 1) for _ in range(self.embedding_dim)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model", default="stub")
+    parser.add_argument(
+        "--ttft", type=float, default=0.05, help="seconds to the first token"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument(
+        "--slots", type=int, default=4, help="requests decoded in parallel"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of requests failing"
+    )
+    parser.add_argument(
+        "--max-tokens", type=int, default=64, help="tokens generated per request"
+    )
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument(
+        "--context-length", type=int, default=4096, help="context of a slot"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    server = StubServer(
+        model=args.model,
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        slots=args.slots,
+        error_rate=args.error_rate,
+        max_tokens=args.max_tokens,
+        embedding_dim=args.embedding_dim,
+        context_length=args.context_length,
+    )
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import time
+from typing import Any, AsyncIterator, Deque, Dict, Hashable, Optional
+
+from .metrics import error_code
+from .streams import GuardedStream
+
+# upstream answers meaning "too much load", as opposed to a broken request
+_CONGESTION_CODES = {"timeout", "429", "503"}
+
+# weight of a new sample in the long-term latency average
+_BASELINE_WEIGHT = 0.05
+
+
+class OverloadedError(TimeoutError):
+    """
+    The request was turned away because the Ramalama servers are saturated.
+
+    A `TimeoutError`, which the Llama Stack server answers with a 504, so
+    clients can tell shed requests from faults (500) and retry them later;
+    it has no mapping to 429 or 503.
+    """
+
+
+def is_congestion(error: BaseException) -> bool:
+    return error_code(error) in _CONGESTION_CODES
+
+
+class AdaptiveLimiter:
+    """
+    Admission control in front of the Ramalama servers.
+
+    The number of requests sent upstream at once is capped by a limit
+    adjusted with AIMD: it grows by one every `limit` requests completing
+    close to their usual latency, and shrinks by `backoff` when a request
+    is much slower than usual (`tolerance` times the long-term average of
+    its kind) or times out. Requests over the limit wait in a bounded queue;
+    when the queue is full, or a request waited `queue_timeout` seconds,
+    it fails right away with `OverloadedError` instead of piling up until
+    the client timeout.
+    """
+
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        initial_limit: int,
+        max_queue_size: int,
+        queue_timeout: Optional[float],
+        tolerance: float,
+        backoff: float = 0.7,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(max_limit, initial_limit)))
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._baselines: Dict[Hashable, float] = {}
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.decreases = 0
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free place under the limit. Returns the admission time,
+        to be handed back to `release()`.
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return time.monotonic()
+        if len(self._waiters) >= self.max_queue_size:
+            self.rejected += 1
+            raise OverloadedError(
+                f"Ramalama is overloaded: {self.in_flight} requests in flight "
+                f"and {len(self._waiters)} waiting"
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # a place was handed over just as the caller gave up
+                self._leave()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise OverloadedError(
+                    f"Ramalama is overloaded: no request slot freed up "
+                    f"within {self.queue_timeout}s"
+                ) from None
+            raise
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(
+        self,
+        started: float,
+        kind: Hashable,
+        latency: Optional[float] = None,
+        congested: bool = False,
+    ) -> None:
+        """
+        Give back the place taken by `acquire()`, adjusting the limit from
+        the `latency` of the request, a request of `kind`, if it completed,
+        or from whether it failed because of `congested` servers.
+        """
+        if congested:
+            self._decrease(started)
+        elif latency is not None:
+            baseline = self._baselines.get(kind, latency)
+            if latency > baseline * self.tolerance:
+                self._decrease(started)
+            else:
+                if self.in_flight >= int(self.limit):
+                    # only grow a limit that is actually reached
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._baselines[kind] = (
+                    baseline + (latency - baseline) * _BASELINE_WEIGHT
+                )
+        self._leave()
+
+    def _decrease(self, started: float) -> None:
+        # requests sent before the last decrease saw the old limit, they
+        # must not shrink it again
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._last_decrease = time.monotonic()
+        self.decreases += 1
+
+    def _leave(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def release_after_stream(
+        self,
+        stream: AsyncIterator[Any],
+        started: float,
+        kind: Hashable,
+        latency: float,
+    ) -> GuardedStream:
+        """
+        Re-yield an upstream stream, keeping its place until the stream is
+        exhausted or closed.
+        """
+
+        def done(error: Optional[BaseException]) -> None:
+            congested = isinstance(error, Exception) and is_congestion(error)
+            self.release(started, kind, None if congested else latency, congested)
+
+        return GuardedStream(stream, done=done)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "decreases": self.decreases,
+        }
@@ -0,0 +1,101 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from .backends import Backend, BackendPool
+from .hashing import digest
+from .lru import LRUCache
+
+
+def prefix_fingerprint(payload: Dict[str, Any]) -> Optional[str]:
+    """
+    Identify the conversation a chat completion request belongs to by the
+    part of its prompt that stays the same from one turn to the next: the
+    model, the tools, the leading system messages and the first message
+    after them.
+    """
+    messages = payload.get("messages")
+    if not messages:
+        return None
+    leading = []
+    for message in messages:
+        leading.append(message)
+        role = (
+            message.get("role")
+            if isinstance(message, dict)
+            else getattr(message, "role", None)
+        )
+        if role != "system":
+            break
+    return digest([payload.get("model"), payload.get("tools"), leading])
+
+
+class PrefixAffinity:
+    """
+    Send the turns of a conversation to the backend, and the llama.cpp
+    slot, that already holds its prompt in its KV cache.
+
+    New conversations go to the least loaded backend and are spread over
+    its slots round-robin. A conversation is moved elsewhere only when its
+    backend has no free slot left while another one does.
+    """
+
+    def __init__(self, pool: BackendPool, max_size: int) -> None:
+        self.pool = pool
+        self._routes: LRUCache[Tuple[str, Optional[int]]] = LRUCache(max_size)
+        self._next_slot: Dict[str, int] = {}
+        self.reroutes = 0
+
+    def route(
+        self, payload: Dict[str, Any], among: Optional[List[Backend]] = None
+    ) -> Tuple[Optional[Backend], Optional[int]]:
+        """
+        Pick the backend and slot for a chat completion request. The slot
+        is None when it is unknown or busy with another request.
+        """
+        fingerprint = prefix_fingerprint(payload)
+        if fingerprint is None:
+            return None, None
+        candidates = [b for b in among or self.pool.backends if b.breaker.available]
+        if not candidates:
+            return None, None
+
+        backend, slot = None, None
+        route = self._routes.get(fingerprint)
+        if route is not None:
+            url, slot = route
+            backend = next((b for b in candidates if b.url == url), None)
+            if backend is not None and _is_full(backend):
+                if any(not _is_full(b) for b in candidates if b is not backend):
+                    self.reroutes += 1
+                    backend = None
+
+        if backend is None:
+            free = [b for b in candidates if not _is_full(b)]
+            backend = self.pool.select(among=free or candidates)
+            slot = None
+            if backend.slots:
+                slot = self._next_slot.get(backend.url, 0) % backend.slots
+                self._next_slot[backend.url] = slot + 1
+            self._routes.put(fingerprint, (backend.url, slot))
+
+        if slot is not None and slot in backend.busy_slots:
+            # let llama.cpp pick a free slot rather than queue behind another request
+            slot = None
+        return backend, slot
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._routes.stats(), "reroutes": self.reroutes}
+
+
+def _is_full(backend: Backend) -> bool:
+    return backend.slots is not None and backend.in_flight >= backend.slots
+
+
+def with_slot(payload: Dict[str, Any], slot: Optional[int]) -> Dict[str, Any]:
+    """
+    Ask llama.cpp to reuse the cached prompt, from `slot` if given.
+    """
+    extra_body = dict(payload.get("extra_body") or {})
+    extra_body["cache_prompt"] = True
+    if slot is not None:
+        extra_body["id_slot"] = slot
+    return {**payload, "extra_body": extra_body}
@@ -0,0 +1,341 @@
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    TYPE_CHECKING,
+)
+
+import httpx
+
+from llama_stack.log import get_logger
+
+from .config import RamalamaImplConfig
+from .metrics import error_code
+from .streams import GuardedStream
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = get_logger(name=__name__, category="inference")
+
+
+class BackendUnavailableError(ConnectionError):
+    """
+    Every Ramalama server that could take the request is known to be down.
+    """
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """
+    Whether `error` says the server is unhealthy, rather than the request
+    being wrong.
+    """
+    from openai import APIStatusError
+
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return error_code(error) in ("timeout", "connection") or isinstance(
+        error, httpx.TransportError
+    )
+
+
+def build_http_client(config: RamalamaImplConfig) -> httpx.AsyncClient:
+    """
+    Build a connection pool, shared by the clients of the replicas using it.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout),
+        http2=config.http2,
+    )
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a server after `failure_threshold`
+    consecutive failures. Once `reset_timeout` seconds have passed, a
+    single probe is let through: its success closes the breaker again, its
+    failure keeps it open for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether a request may be sent now, without claiming the probe.
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self._probing:
+            return False
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def try_acquire(self) -> bool:
+        """
+        Claim the right to send a request, which is the probe when the
+        breaker is not closed. Every successful call must be followed by
+        `record()` or one of the `record_*()` methods.
+        """
+        if not self.available:
+            return False
+        if self.state != self.CLOSED:
+            self.state = self.HALF_OPEN
+            self._probing = True
+        return True
+
+    def try_probe(self) -> bool:
+        """
+        Like `try_acquire()`, but claims the probe of a breaker that is not
+        closed without waiting for `reset_timeout`. Meant for health
+        checks, which cost the server nothing, so a server is back in
+        rotation as soon as it answers.
+        """
+        if self._probing:
+            return False
+        if self.state != self.CLOSED:
+            self.state = self.HALF_OPEN
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state != self.CLOSED or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def record_cancel(self) -> None:
+        # the probe gave no answer, let the next request probe instead
+        if self._probing:
+            self._probing = False
+            self.state = self.OPEN
+
+    def record(self, error: BaseException) -> None:
+        """
+        Record the outcome of a request that raised `error`.
+        """
+        if is_backend_failure(error):
+            self.record_failure()
+        elif isinstance(error, Exception):
+            # the server answered, the request was at fault
+            self.record_success()
+        else:
+            self.record_cancel()
+
+    def trip(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class Backend:
+    """
+    A single Ramalama server together with the counters used to route
+    requests to it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        client: "AsyncOpenAI",
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.url = url
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.slots: Optional[int] = None
+        self.context_length: Optional[int] = None
+        self.busy_slots: Set[int] = set()
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def server_url(self) -> str:
+        """
+        The root of the llama.cpp server, where its non-OpenAI endpoints
+        (`/health`, `/props`, ...) live.
+        """
+        url = self.url.rstrip("/")
+        return url[: -len("/v1")] if url.endswith("/v1") else url
+
+    async def fetch_slots(self, http_client: httpx.AsyncClient) -> Optional[int]:
+        """
+        Ask the server how many requests it decodes in parallel
+        (`--parallel N`). Returns None if the server does not say.
+        """
+        try:
+            response = await http_client.get(f"{self.server_url}/props")
+            response.raise_for_status()
+            props = response.json()
+            self.slots = int(props["total_slots"])
+        except (httpx.HTTPError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Could not read the slot count of `{self.url}`: {e}")
+            self.slots = None
+            return None
+        try:
+            # the context of a single slot, `--ctx-size` split over the slots
+            self.context_length = int(props["default_generation_settings"]["n_ctx"])
+        except (KeyError, TypeError, ValueError):
+            self.context_length = None
+        return self.slots
+
+    async def check_health(
+        self, http_client: httpx.AsyncClient, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Whether the server answers its `/health` endpoint with 200, which
+        llama.cpp only does once the model is loaded.
+        """
+        try:
+            response = await http_client.get(
+                f"{self.server_url}/health", timeout=timeout
+            )
+        except httpx.HTTPError as e:
+            logger.debug(f"Health check of `{self.url}` failed: {e}")
+            return False
+        return response.status_code == 200
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "state": self.breaker.state,
+            "slots": self.slots,
+            "context_length": self.context_length,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+        }
+
+
+class BackendPool:
+    """
+    A set of Ramalama replicas serving the same model.
+
+    Requests are routed to the replica with the fewest outstanding
+    requests; ties are broken round-robin so an idle pool still spreads
+    load evenly. Replicas whose circuit breaker is open are skipped.
+    """
+
+    def __init__(self, backends: List[Backend]) -> None:
+        if not backends:
+            raise ValueError("At least one Ramalama backend must be configured")
+        self.backends = backends
+        self._next = 0
+
+    def select(
+        self,
+        exclude: Iterable[Backend] = (),
+        among: Optional[List[Backend]] = None,
+    ) -> Backend:
+        """
+        Pick the least loaded available backend, out of `among` if given,
+        avoiding the `exclude`d ones unless nothing else is left. Raises
+        `BackendUnavailableError` when every candidate is down.
+        """
+        allowed = [b for b in among or self.backends if b.breaker.available]
+        if not allowed:
+            raise BackendUnavailableError(
+                "No Ramalama server is available: "
+                + ", ".join(b.url for b in among or self.backends)
+            )
+        excluded = set(exclude)
+        candidates = [b for b in allowed if b not in excluded] or allowed
+        start = self._next % len(candidates)
+        self._next += 1
+        rotated = candidates[start:] + candidates[:start]
+        return min(rotated, key=lambda b: b.in_flight)
+
+    def acquire(
+        self,
+        backend: Optional[Backend] = None,
+        among: Optional[List[Backend]] = None,
+        slot: Optional[int] = None,
+        exclude: Iterable[Backend] = (),
+    ) -> Backend:
+        """
+        Pick a backend (unless one is given) and count a new outstanding
+        request against it, pinned to `slot` if given. Every call must be
+        paired with `release()`, and the outcome of the request recorded
+        on the backend's breaker. Raises `BackendUnavailableError` when the
+        backend cannot take the request, like a breaker already probed.
+        """
+        if backend is None:
+            backend = self.select(exclude=exclude, among=among)
+        if not backend.breaker.try_acquire():
+            # another request is probing the server already
+            raise BackendUnavailableError(
+                f"Ramalama at `{backend.url}` is out of rotation"
+            )
+        backend.in_flight += 1
+        backend.requests += 1
+        if slot is not None:
+            backend.busy_slots.add(slot)
+        return backend
+
+    def release(
+        self, backend: Backend, failed: bool = False, slot: Optional[int] = None
+    ) -> None:
+        backend.in_flight -= 1
+        if failed:
+            backend.errors += 1
+        if slot is not None:
+            backend.busy_slots.discard(slot)
+
+    def release_after_stream(
+        self, backend: Backend, stream: AsyncIterator[Any], slot: Optional[int] = None
+    ) -> GuardedStream:
+        """
+        Re-yield an upstream stream, keeping the request counted as
+        outstanding until the stream is exhausted or closed.
+        """
+        return GuardedStream(
+            stream,
+            done=lambda error: self.release(
+                backend, failed=isinstance(error, Exception), slot=slot
+            ),
+        )
+
+    async def total_slots(self, http_client: httpx.AsyncClient) -> int:
+        """
+        The number of requests the pool can decode in parallel, counting
+        one slot for replicas that do not report their slot count.
+        """
+        total = 0
+        for backend in self.backends:
+            if backend.slots is None:
+                await backend.fetch_slots(http_client)
+            total += backend.slots or 1
+        return total
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [backend.stats() for backend in self.backends]
@@ -0,0 +1,28 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Sequence, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def map_bounded(
+    fn: Callable[[T], Awaitable[R]],
+    items: Sequence[T],
+    limit: int,
+) -> List[Union[R, Exception]]:
+    """
+    Run `fn` over `items` with at most `limit` calls in flight.
+
+    Results are returned in input order; an item whose call raised gets
+    the exception in its position instead of failing the whole batch.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item: T) -> Any:
+        async with semaphore:
+            try:
+                return await fn(item)
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(run(item) for item in items))
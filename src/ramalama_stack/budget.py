@@ -0,0 +1,228 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import httpx
+
+from llama_stack.log import get_logger
+
+from .backends import Backend
+from .hashing import canonical_json, digest
+from .lru import LRUCache
+
+logger = get_logger(name=__name__, category="inference")
+
+# tokens a chat template adds around every message, like the role header
+# and end-of-turn marker of Llama 3
+MESSAGE_OVERHEAD = 5
+
+# the request fields bounding the completion length, the second one from
+# the OpenAI chat completion API
+_MAX_TOKENS_FIELDS = ("max_tokens", "max_completion_tokens")
+
+
+class PromptTooLongError(ValueError):
+    pass
+
+
+class TokenCounter:
+    """
+    Count the tokens of texts with the `/tokenize` endpoint of a Ramalama
+    server, caching the counts by model and content hash. Agents resend
+    their conversation every turn, so each message is tokenized once.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, max_size: int) -> None:
+        self.http_client = http_client
+        self.entries: LRUCache[int] = LRUCache(max_size)
+        self.requests = 0
+
+    async def count(self, backend: Backend, model: str, text: str) -> int:
+        key = digest([model, text])
+        count = self.entries.get(key)
+        if count is None:
+            response = await self.http_client.post(
+                f"{backend.server_url}/tokenize", json={"content": text}
+            )
+            response.raise_for_status()
+            count = len(response.json()["tokens"])
+            self.requests += 1
+            self.entries.put(key, count)
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.entries.stats(), "tokenize_requests": self.requests}
+
+
+def _message_texts(message: Any) -> List[str]:
+    if not isinstance(message, dict):
+        return []
+    content = message.get("content")
+    texts = []
+    if isinstance(content, str):
+        texts.append(content)
+    elif isinstance(content, list):
+        texts.extend(
+            part["text"]
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    if message.get("tool_calls"):
+        texts.append(canonical_json(message["tool_calls"]))
+    return texts
+
+
+def prompt_texts(endpoint: str, params: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    The texts making up the prompt of a chat completion or completion
+    request, None if it cannot be counted (a tokenized prompt, a batch).
+    Images are not counted.
+    """
+    if endpoint == "chat":
+        texts = [
+            text for message in params["messages"] for text in _message_texts(message)
+        ]
+        if params.get("tools"):
+            texts.append(canonical_json(params["tools"]))
+        return texts
+    prompt = params.get("prompt")
+    return [prompt] if isinstance(prompt, str) else None
+
+
+class ContextBudget:
+    """
+    Fit requests into the context window of their model before sending
+    them: prompts that cannot fit are rejected, and `max_tokens` is lowered
+    to what the prompt leaves, instead of having the server tokenize, and
+    partly prefill, a request it then refuses.
+
+    The context length of a model is the smallest of the `context_length`
+    of its metadata and the per-slot context of the servers running it.
+    Prompts are only tokenized when they are close enough to the limit to
+    matter, since a token is at least one byte long.
+    """
+
+    def __init__(self, counter: TokenCounter) -> None:
+        self.counter = counter
+        self._context_lengths: Dict[str, int] = {}
+        self._probed: Set[str] = set()
+        self.skipped = 0
+        self.counted = 0
+        self.clamped = 0
+        self.rejected = 0
+
+    def register(self, model: str, context_length: int) -> None:
+        self._context_lengths[model] = context_length
+
+    async def context_length(
+        self, model: str, backends: Sequence[Backend]
+    ) -> Optional[int]:
+        lengths = []
+        if model in self._context_lengths:
+            lengths.append(self._context_lengths[model])
+        for backend in backends:
+            if backend.url not in self._probed:
+                # the context is read from `/props` along with the slot count
+                self._probed.add(backend.url)
+                if backend.context_length is None:
+                    await backend.fetch_slots(self.counter.http_client)
+            if backend.context_length is not None:
+                lengths.append(backend.context_length)
+        return min(lengths) if lengths else None
+
+    async def _count(
+        self, model: str, texts: List[str], backends: Sequence[Backend]
+    ) -> Optional[List[int]]:
+        backend = next((b for b in backends if b.breaker.available), backends[0])
+        try:
+            return await asyncio.gather(
+                *(self.counter.count(backend, model, text) for text in texts)
+            )
+        except (httpx.HTTPError, KeyError, TypeError, ValueError) as e:
+            logger.debug(f"Could not count tokens with `{backend.url}`: {e}")
+            return None
+
+    async def fit(
+        self, endpoint: str, params: Dict[str, Any], backends: Sequence[Backend]
+    ) -> Tuple[Dict[str, Any], Optional[int]]:
+        """
+        Return `params` with `max_tokens`, or `max_completion_tokens`,
+        lowered to what the context has left after the prompt, and the
+        prompt token count if the prompt was counted. Raises
+        `PromptTooLongError` for a prompt that does not fit.
+        """
+        model = params["model"]
+        texts = prompt_texts(endpoint, params)
+        if texts is None or not backends:
+            return params, None
+        context_length = await self.context_length(model, backends)
+        if context_length is None:
+            return params, None
+        overhead = MESSAGE_OVERHEAD * len(params.get("messages", ()))
+        max_tokens = max((params.get(f) or 0 for f in _MAX_TOKENS_FIELDS), default=0)
+        if sum(len(t.encode()) for t in texts) + overhead + max_tokens <= (
+            context_length
+        ):
+            self.skipped += 1
+            return params, None
+
+        counts = await self._count(model, texts, backends)
+        if counts is None:
+            return params, None
+        self.counted += 1
+        prompt_tokens = sum(counts) + overhead
+        if prompt_tokens >= context_length:
+            self.rejected += 1
+            raise PromptTooLongError(
+                f"The prompt has {prompt_tokens} tokens, it does not fit in the "
+                f"{context_length} token context of model {model}"
+            )
+        if max_tokens and prompt_tokens + max_tokens > context_length:
+            self.clamped += 1
+            left = context_length - prompt_tokens
+            params = {
+                **params,
+                **{
+                    f: min(params[f], left) for f in _MAX_TOKENS_FIELDS if params.get(f)
+                },
+            }
+        return params, prompt_tokens
+
+    async def check_inputs(
+        self, model: str, inputs: List[Any], backends: Sequence[Backend]
+    ) -> None:
+        """
+        Raise `PromptTooLongError` if an embeddings input does not fit in
+        the context of `model`.
+        """
+        if not backends:
+            return
+        context_length = await self.context_length(model, backends)
+        if context_length is None:
+            return
+        texts = [
+            text
+            for text in inputs
+            if isinstance(text, str) and len(text.encode()) > context_length
+        ]
+        if not texts:
+            self.skipped += 1
+            return
+        counts = await self._count(model, texts, backends)
+        if counts is None:
+            return
+        self.counted += 1
+        if max(counts) > context_length:
+            self.rejected += 1
+            raise PromptTooLongError(
+                f"An input has {max(counts)} tokens, it does not fit in the "
+                f"{context_length} token context of model {model}"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "skipped": self.skipped,
+            "counted": self.counted,
+            "clamped": self.clamped,
+            "rejected": self.rejected,
+            "token_counts": self.counter.stats(),
+        }
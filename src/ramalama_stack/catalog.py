@@ -0,0 +1,134 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from llama_stack.log import get_logger
+
+from .backends import Backend, BackendPool
+
+logger = get_logger(name=__name__, category="inference")
+
+
+def _basename(model_id: str) -> str:
+    return model_id.split("/")[-1]
+
+
+class ModelCatalog:
+    """
+    The models served by a pool of Ramalama servers, fetched once and then
+    refreshed in the background every `ttl` seconds.
+
+    Models are indexed both by their full id and by its basename, since
+    Ramalama reports model paths differently on macOS and Linux.
+
+    Models given a route of their own are served by the backends of their
+    route, whatever the servers report; the other models by the backends
+    outside of any route that list them.
+    """
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        ttl: float,
+        routes: Optional[Dict[str, List[Backend]]] = None,
+    ) -> None:
+        self.pool = pool
+        self.ttl = ttl
+        self.routes: Dict[str, List[Backend]] = routes or {}
+        routed = {backend for backends in self.routes.values() for backend in backends}
+        self._unrouted = [b for b in pool.backends if b not in routed]
+        self._served: Dict[str, List[str]] = {}
+        self._models: List[str] = []
+        self._index: Dict[str, List[Backend]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def models(self) -> List[str]:
+        return self._models
+
+    async def refresh(self) -> None:
+        listings = await asyncio.gather(
+            *(self._list(backend) for backend in self.pool.backends)
+        )
+        models: List[str] = []
+        index: Dict[str, List[Backend]] = {}
+        for backend, model_ids in zip(self.pool.backends, listings):
+            if model_ids is None:
+                # keep what an unreachable backend served last time
+                model_ids = self._served.get(backend.url, [])
+            self._served[backend.url] = model_ids
+            for model_id in model_ids:
+                if model_id not in models:
+                    models.append(model_id)
+                for key in {model_id, _basename(model_id)}:
+                    backends = index.setdefault(key, [])
+                    if backend not in backends:
+                        backends.append(backend)
+        self._models = models
+        self._index = index
+
+    async def _list(self, backend: Backend) -> Optional[List[str]]:
+        try:
+            page = await backend.client.models.list()
+            return [m.id async for m in page]
+        except Exception as e:
+            logger.warning(f"Could not list the models served by `{backend.url}`: {e}")
+            return None
+
+    def lookup(self, model_id: str) -> List[Backend]:
+        """
+        The backends serving `model_id`, empty if no backend serves it.
+        """
+        routed = self.route(model_id)
+        if routed:
+            return routed
+        backends = self._index.get(model_id) or self._index.get(_basename(model_id), [])
+        if self.routes:
+            # the servers of routed models only serve their own models
+            backends = [b for b in backends if b in self._unrouted]
+        return backends
+
+    def route(self, model_id: str) -> Optional[List[Backend]]:
+        return self.routes.get(model_id) or self.routes.get(_basename(model_id))
+
+    def alias(self, model_id: str, identifier: str) -> None:
+        """
+        Route `model_id` like `identifier`, the id a model was registered
+        under, when only that one has a route of its own.
+        """
+        routed = self.route(identifier)
+        if routed and not self.route(model_id):
+            self.routes[model_id] = routed
+
+    def serves(self, model_id: str) -> bool:
+        """
+        Whether `model_id` can be served: by a reachable server of its
+        route if it has one, else by a server listing it.
+        """
+        routed = self.route(model_id)
+        if routed:
+            return any(self.served_by(backend) for backend in routed)
+        return bool(self.lookup(model_id))
+
+    def served_by(self, backend: Backend) -> List[str]:
+        """
+        The models `backend` listed the last time it could be reached.
+        """
+        return self._served.get(backend.url, [])
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl)
+            await self.refresh()
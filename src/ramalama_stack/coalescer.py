@@ -0,0 +1,150 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from llama_stack.log import get_logger
+
+from .hashing import canonical_json
+
+logger = get_logger(name=__name__, category="inference")
+
+Embeddings = List[List[float]]
+EmbedFn = Callable[[str, List[str], Dict[str, Any]], Awaitable[Embeddings]]
+
+
+class _PendingBatch:
+    def __init__(self, model: str, extra_body: Dict[str, Any]) -> None:
+        self.model = model
+        self.extra_body = extra_body
+        self.requests: List[Tuple[List[str], asyncio.Future, float]] = []
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingCoalescer:
+    """
+    Merge concurrent embedding requests into one upstream request.
+
+    Requests for the same model and options are held for at most
+    `window` seconds, or until `max_batch_size` inputs are waiting, then
+    sent together; every caller gets back the slice matching its inputs.
+    """
+
+    def __init__(self, embed: EmbedFn, window: float, max_batch_size: int) -> None:
+        self._embed = embed
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._tasks: set = set()
+        self.batches = 0
+        self.requests = 0
+        self.inputs = 0
+        self.max_batch_inputs = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    async def embed(
+        self, model: str, inputs: List[str], extra_body: Dict[str, Any]
+    ) -> Embeddings:
+        key = canonical_json([model, extra_body])
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch(model, extra_body)
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush, key
+            )
+        future = asyncio.get_running_loop().create_future()
+        batch.requests.append((inputs, future, time.monotonic()))
+        batch.size += len(inputs)
+        if batch.size >= self.max_batch_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: str) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: _PendingBatch) -> None:
+        now = time.monotonic()
+        requests = [r for r in batch.requests if not r[1].done()]
+        if not requests:
+            return
+        for _, _, enqueued in requests:
+            delay = now - enqueued
+            self.queue_delay_total += delay
+            self.queue_delay_max = max(self.queue_delay_max, delay)
+        inputs = [text for texts, _, _ in requests for text in texts]
+        self.batches += 1
+        self.requests += len(requests)
+        self.inputs += len(inputs)
+        self.max_batch_inputs = max(self.max_batch_inputs, len(inputs))
+
+        try:
+            embeddings = await self._embed(batch.model, inputs, batch.extra_body)
+        except Exception as e:
+            if len(requests) == 1 or not _is_bad_input(e):
+                # an unreachable or overloaded server would only get more
+                # requests from retrying each caller's inputs apart
+                for _, future, _ in requests:
+                    _set_exception(future, e)
+                return
+            # don't let one caller's bad input fail everybody else's request
+            logger.debug(f"Coalesced embeddings request failed, retrying apart: {e}")
+            await asyncio.gather(
+                *(self._send_alone(batch, texts, fut) for texts, fut, _ in requests)
+            )
+            return
+
+        offset = 0
+        for texts, future, _ in requests:
+            if not future.done():
+                future.set_result(embeddings[offset : offset + len(texts)])
+            offset += len(texts)
+
+    async def _send_alone(
+        self, batch: _PendingBatch, inputs: List[str], future: asyncio.Future
+    ) -> None:
+        try:
+            embeddings = await self._embed(batch.model, inputs, batch.extra_body)
+        except Exception as e:
+            _set_exception(future, e)
+        else:
+            if not future.done():
+                future.set_result(embeddings)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "mean_batch_inputs": self.inputs / self.batches if self.batches else 0.0,
+            "max_batch_inputs": self.max_batch_inputs,
+            "mean_queue_delay": self.queue_delay_total / self.requests
+            if self.requests
+            else 0.0,
+            "max_queue_delay": self.queue_delay_max,
+        }
+
+
+def _is_bad_input(error: Exception) -> bool:
+    """
+    Whether a failed request may be the fault of one of its inputs, like
+    an input the server rejected or one too long for the model, rather
+    than of the server.
+    """
+    from openai import APIStatusError
+
+    if isinstance(error, APIStatusError):
+        return 400 <= error.status_code < 500 and error.status_code not in (408, 429)
+    return isinstance(error, ValueError)
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
@@ -1,12 +1,253 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 DEFAULT_RAMALAMA_URL = "http://localhost:8080"
 
 
+def _split_urls(urls: str) -> List[str]:
+    return [url.strip() for url in urls.split(",") if url.strip()]
+
+
 class RamalamaImplConfig(BaseModel):
-    url: str = DEFAULT_RAMALAMA_URL
+    url: str = Field(
+        default=DEFAULT_RAMALAMA_URL,
+        description="The URL of the Ramalama server. Several replicas of the same model "
+        "can be given as a comma-separated list.",
+    )
+    urls: List[str] = Field(
+        default_factory=list,
+        description="The URLs of several Ramalama replicas serving the same model. "
+        "Takes precedence over `url` when set.",
+    )
+    model_urls: Dict[str, Union[str, List[str]]] = Field(
+        default_factory=dict,
+        description="Routes models to their own Ramalama servers: maps a model id or "
+        "provider resource id to the URL (or comma-separated URLs, or list of URLs) "
+        "of the servers running it. Every model gets its own connection pool; other "
+        "models are sent to `url` or `urls`, which are not used by default when this "
+        "is set.",
+    )
+    max_connections: int = Field(
+        default=100,
+        description="Maximum number of concurrent connections to the Ramalama servers.",
+    )
+    max_keepalive_connections: int = Field(
+        default=20,
+        description="Maximum number of idle connections kept open for reuse.",
+    )
+    keepalive_expiry: float = Field(
+        default=30.0,
+        description="Seconds an idle connection is kept open before being closed.",
+    )
+    connect_timeout: float = Field(
+        default=5.0,
+        description="Seconds allowed to establish a connection to a Ramalama server.",
+    )
+    read_timeout: float = Field(
+        default=120.0,
+        description="Seconds allowed between two reads from a Ramalama server.",
+    )
+    first_byte_timeout: Optional[float] = Field(
+        default=None,
+        description="Seconds allowed for a streaming response to start. "
+        "Unlimited (bounded only by `read_timeout`) when unset.",
+    )
+    health_check_interval: Optional[float] = Field(
+        default=10.0,
+        description="Seconds between two background checks of the `/health` endpoint "
+        "of every Ramalama server. Disabled when unset.",
+    )
+    circuit_failure_threshold: int = Field(
+        default=3,
+        description="Consecutive failed requests or health checks after which no more "
+        "requests are sent to a Ramalama server.",
+    )
+    circuit_reset_timeout: float = Field(
+        default=30.0,
+        description="Seconds before a single request is let through to a Ramalama "
+        "server taken out of rotation, to find out if it recovered. Health checks "
+        "probe it at every `health_check_interval`.",
+    )
+    http2: bool = Field(
+        default=False,
+        description="Use HTTP/2 to talk to the Ramalama servers. Requires the `h2` package.",
+    )
+    model_catalog_ttl: float = Field(
+        default=60.0,
+        description="Seconds between two background refreshes of the list of models "
+        "served by the Ramalama servers.",
+    )
+    prefix_affinity: bool = Field(
+        default=False,
+        description="Send the turns of a conversation (same system prompt, tools and "
+        "first message) to the same server and slot, with `cache_prompt` enabled, so "
+        "llama.cpp reuses the KV cache of the shared prompt prefix.",
+    )
+    prefix_affinity_size: int = Field(
+        default=4096,
+        description="Number of conversations whose server and slot are remembered.",
+    )
+    metrics_port: Optional[int] = Field(
+        default=None,
+        description="Port of an HTTP endpoint serving request metrics at `/metrics` "
+        "in the Prometheus text format. Disabled when unset.",
+    )
+    metrics_host: str = Field(
+        default="127.0.0.1",
+        description="Address the metrics endpoint listens on.",
+    )
+    batch_concurrency: Optional[int] = Field(
+        default=None,
+        description="Maximum number of requests of a batch sent upstream at once. "
+        "Defaults to the total slot count reported by the Ramalama servers.",
+    )
+    context_budget: bool = Field(
+        default=False,
+        description="Count the prompt tokens of requests close to the context length "
+        "of their model before sending them, rejecting prompts that do not fit and "
+        "lowering `max_tokens` or `max_completion_tokens` to the room left.",
+    )
+    token_count_cache_size: int = Field(
+        default=4096,
+        description="Number of prompt token counts kept, keyed by model and content "
+        "hash, when `context_budget` is enabled.",
+    )
+    max_concurrency: Optional[int] = Field(
+        default=None,
+        description="Upper bound of the adaptive limit on requests sent to the Ramalama "
+        "servers at once. The limit starts at their total slot count and follows their "
+        "latency. Admission control is disabled when unset.",
+    )
+    min_concurrency: int = Field(
+        default=1,
+        description="Lower bound of the adaptive concurrency limit.",
+    )
+    max_queue_size: int = Field(
+        default=64,
+        description="Number of requests allowed to wait for admission. Further requests "
+        "fail immediately as overloaded.",
+    )
+    queue_timeout: Optional[float] = Field(
+        default=10.0,
+        description="Seconds a request may wait for admission before failing as "
+        "overloaded. Unlimited when unset.",
+    )
+    latency_tolerance: float = Field(
+        default=2.0,
+        description="A request slower than this many times the average latency of its "
+        "kind is taken as a sign of overload and lowers the concurrency limit.",
+    )
+    hedge_percentile: Optional[float] = Field(
+        default=None,
+        description="Percentile of the recent latency (e.g. 95) after which a "
+        "non-streaming request is sent again to another Ramalama server, keeping "
+        "whichever response comes first. Hedging is disabled when unset.",
+    )
+    hedge_budget: float = Field(
+        default=0.05,
+        description="Largest fraction of requests that may be hedged.",
+    )
+    message_cache_size: int = Field(
+        default=4096,
+        description="Number of chat messages whose conversion to the OpenAI format is "
+        "memoized, so resent conversation histories are not converted again. "
+        "Disabled when 0.",
+    )
+    tool_cache_size: int = Field(
+        default=256,
+        description="Number of converted tool sets kept for reuse, so the tools sent "
+        "every turn are converted once and serialized identically. Disabled when 0.",
+    )
+    grammar_cache_size: int = Field(
+        default=256,
+        description="Number of grammars compiled from structured output schemas kept "
+        "for reuse, keyed by a hash of the schema. Disabled when 0.",
+    )
+    image_max_size: Optional[int] = Field(
+        default=None,
+        description="Downscale the images of chat messages so that neither side is "
+        "longer than this many pixels before sending them to a vision model. Images "
+        "are kept at their size when unset.",
+    )
+    image_cache_size: int = Field(
+        default=0,
+        description="Number of fetched and encoded images kept in a cache keyed by URL "
+        "and content hash. Images given by URL are fetched by the adapter and inlined "
+        "when either this or `image_max_size` is set.",
+    )
+    embedding_batch_window_ms: Optional[float] = Field(
+        default=None,
+        description="Merge concurrent embedding requests for the same model arriving "
+        "within this many milliseconds into one upstream request. Disabled when unset.",
+    )
+    embedding_max_batch_size: int = Field(
+        default=64,
+        description="Maximum number of inputs of a merged embedding request.",
+    )
+    embedding_cache_size: int = Field(
+        default=0,
+        description="Number of embeddings kept in an in-memory LRU cache. Disabled when 0.",
+    )
+    embedding_cache_db_path: Optional[str] = Field(
+        default=None,
+        description="Path of an SQLite database persisting cached embeddings across "
+        "restarts, e.g. `${env.SQLITE_STORE_DIR:=~/.llama/distributions/ramalama}/"
+        "ramalama_embeddings.db`. Requires `embedding_cache_size` > 0.",
+    )
+    response_cache_size: int = Field(
+        default=0,
+        description="Number of chat completion and completion responses kept in an "
+        "exact-match cache. Only greedy or seeded requests are cached. Disabled when 0.",
+    )
+    response_cache_ttl: Optional[float] = Field(
+        default=300.0,
+        description="Seconds a cached response stays valid. Never expires when unset.",
+    )
+    single_flight: bool = Field(
+        default=False,
+        description="Share one upstream request between identical requests in flight "
+        "at the same time: greedy or seeded chat completions and completions, and "
+        "embeddings. Streams are fanned out to every caller.",
+    )
+    semantic_cache_size: int = Field(
+        default=0,
+        description="Number of chat completions kept in a semantic cache, which answers "
+        "a request whose last user turn means the same as a cached one, with the same "
+        "system prompt, history, tools and parameters. Entries expire after "
+        "`response_cache_ttl`. Disabled when 0.",
+    )
+    semantic_cache_threshold: float = Field(
+        default=0.95,
+        description="Cosine similarity the embeddings of two user turns must reach for "
+        "the semantic cache to answer one with the response to the other.",
+    )
+    semantic_cache_model: str = Field(
+        default="all-minilm:latest",
+        description="Embedding model served by Ramalama used by the semantic cache, "
+        "e.g. `all-minilm:latest` or `nomic-embed-text`.",
+    )
+
+    def endpoints(self) -> List[str]:
+        """
+        The URLs of the servers of the models that have no route of their
+        own in `model_urls`.
+        """
+        if self.urls:
+            return list(self.urls)
+        if self.model_urls and "url" not in self.model_fields_set:
+            # only the routed servers were configured
+            return []
+        return _split_urls(self.url)
+
+    def routes(self) -> Dict[str, List[str]]:
+        """
+        The URLs of the servers of every model routed in `model_urls`.
+        """
+        return {
+            model: _split_urls(urls) if isinstance(urls, str) else list(urls)
+            for model, urls in self.model_urls.items()
+        }
 
     @classmethod
     def sample_run_config(
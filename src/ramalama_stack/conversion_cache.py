@@ -0,0 +1,103 @@
+import hashlib
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from pydantic import BaseModel
+
+from llama_stack.apis.inference import Message, ToolDefinition
+
+from .hashing import digest
+from .lru import LRUCache
+
+if TYPE_CHECKING:
+    from .images import ImageProcessor
+
+
+def content_key(obj: Any) -> str:
+    """
+    The content hash of a Llama Stack message or tool definition, or of a
+    list of them. Pydantic models are serialized by pydantic's own
+    serializer, which is much cheaper than converting them; plain dicts go
+    through canonical JSON.
+    """
+    if isinstance(obj, list) and all(isinstance(o, BaseModel) for o in obj):
+        sha = hashlib.sha256()
+        for o in obj:
+            sha.update(bytes.fromhex(content_key(o)))
+        return sha.hexdigest()
+    if isinstance(obj, BaseModel):
+        data = type(obj).__name__.encode() + obj.model_dump_json().encode()
+        return hashlib.sha256(data).hexdigest()
+    return digest(obj)
+
+
+async def convert_message(
+    message: Message, image_processor: Optional["ImageProcessor"] = None
+) -> Dict[str, Any]:
+    """
+    Convert a Llama Stack message into an OpenAI message, preparing its
+    images with `image_processor` if given.
+    """
+    from llama_stack.providers.utils.inference.openai_compat import (
+        convert_message_to_openai_dict_new,
+    )
+
+    if image_processor is not None:
+        message = await image_processor.process_message(message)
+    return await convert_message_to_openai_dict_new(message)
+
+
+class MessageConversionCache:
+    """
+    Memoize the conversion of Llama Stack messages into OpenAI messages by
+    content hash. Agent loops resend their whole conversation every turn,
+    so only the messages added since the last turn get converted.
+
+    Converted messages are shared between requests and must not be
+    modified.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.entries: LRUCache[Dict[str, Any]] = LRUCache(max_size)
+
+    async def convert(
+        self, message: Message, image_processor: Optional["ImageProcessor"] = None
+    ) -> Dict[str, Any]:
+        key = content_key(message)
+        converted = self.entries.get(key)
+        if converted is None:
+            converted = await convert_message(message, image_processor)
+            self.entries.put(key, converted)
+        return converted
+
+    def stats(self) -> Dict[str, Any]:
+        return self.entries.stats()
+
+
+class ToolConversionCache:
+    """
+    Memoize the conversion of tool definitions into OpenAI tools by a hash
+    of the whole tool set. Agents send the same tools every turn, they are
+    converted once and then sent as the very same objects, so the tool
+    block of the prompt stays byte-identical and llama.cpp can reuse its
+    cached prefix.
+
+    Converted tools are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.entries: LRUCache[List[Dict[str, Any]]] = LRUCache(max_size)
+
+    def convert(self, tools: List[ToolDefinition]) -> List[Dict[str, Any]]:
+        key = content_key(tools)
+        converted = self.entries.get(key)
+        if converted is None:
+            from llama_stack.providers.utils.inference.openai_compat import (
+                convert_tooldef_to_openai_tool,
+            )
+
+            converted = [convert_tooldef_to_openai_tool(tool) for tool in tools]
+            self.entries.put(key, converted)
+        return converted
+
+    def stats(self) -> Dict[str, Any]:
+        return self.entries.stats()
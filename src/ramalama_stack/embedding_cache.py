@@ -0,0 +1,101 @@
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, TYPE_CHECKING
+
+from .hashing import digest
+from .lru import LRUCache
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+Embedding = List[float]
+
+_MAX_QUERY_KEYS = 500
+
+
+def embedding_key(model: str, content: Any, options: Dict[str, Any]) -> str:
+    """
+    The cache key of the embedding of `content` computed by `model`.
+    `options` holds everything else that changes the vector: truncation,
+    output dimension and task type.
+    """
+    return digest([model, digest(content), options])
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: a bounded in-memory LRU in front of
+    an optional, unbounded SQLite table that survives restarts.
+    """
+
+    table_name = "embeddings"
+
+    def __init__(self, max_size: int, db_path: Optional[str] = None) -> None:
+        self.memory: LRUCache[Embedding] = LRUCache(max_size)
+        self.db_path = os.path.expanduser(db_path) if db_path else None
+        self._db: Optional["aiosqlite.Connection"] = None
+        self.db_hits = 0
+
+    async def initialize(self) -> None:
+        if self.db_path is None:
+            return
+        import aiosqlite
+
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._db = await aiosqlite.connect(self.db_path)
+        await self._db.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                key TEXT PRIMARY KEY,
+                embedding BLOB
+            )
+            """
+        )
+        await self._db.commit()
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[Embedding]]:
+        found: List[Optional[Embedding]] = [self.memory.get(key) for key in keys]
+        missing = list({key for key, value in zip(keys, found) if value is None})
+        if self._db is None or not missing:
+            return found
+
+        stored: Dict[str, Embedding] = {}
+        # stay below SQLite's limit on the number of bound parameters
+        for start in range(0, len(missing), _MAX_QUERY_KEYS):
+            chunk = missing[start : start + _MAX_QUERY_KEYS]
+            placeholders = ",".join("?" * len(chunk))
+            async with self._db.execute(
+                f"SELECT key, embedding FROM {self.table_name} WHERE key IN ({placeholders})",
+                chunk,
+            ) as cursor:
+                async for key, blob in cursor:
+                    stored[key] = array("d", blob).tolist()
+        for key, embedding in stored.items():
+            self.memory.put(key, embedding)
+        self.db_hits += len(stored)
+        return [
+            value if value is not None else stored.get(key)
+            for key, value in zip(keys, found)
+        ]
+
+    async def put_many(self, embeddings: Dict[str, Embedding]) -> None:
+        for key, embedding in embeddings.items():
+            self.memory.put(key, embedding)
+        if self._db is None or not embeddings:
+            return
+        await self._db.executemany(
+            f"INSERT OR REPLACE INTO {self.table_name} (key, embedding) VALUES (?, ?)",
+            [
+                (key, array("d", embedding).tobytes())
+                for key, embedding in embeddings.items()
+            ],
+        )
+        await self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.memory.stats(), "db_hits": self.db_hits}
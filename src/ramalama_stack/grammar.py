@@ -0,0 +1,308 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .hashing import digest
+from .lru import LRUCache
+
+# JSON primitives in GBNF, after llama.cpp's `json_schema_to_grammar`
+_SPACE_RULE = '| " " | "\\n" [ \\t]{0,20}'
+_PRIMITIVE_RULES = {
+    "boolean": '("true" | "false") space',
+    "null": '"null" space',
+    "integer": '("-"? ([0-9] | [1-9] [0-9]{0,15})) space',
+    "number": '("-"? ([0-9] | [1-9] [0-9]{0,15})) ("." [0-9]+)? '
+    "([eE] [-+]? [0-9]+)? space",
+    "char": '[^"\\\\\\x7F\\x00-\\x1F] | [\\\\] (["\\\\/bfnrt] | "u" [0-9a-fA-F]{4})',
+    "string": '"\\"" char* "\\"" space',
+    "value": "object | array | string | number | boolean | null",
+    "object": '"{" space ( string ":" space value ("," space string ":" space '
+    'value)* )? "}" space',
+    "array": '"[" space ( value ("," space value)* )? "]" space',
+}
+_PRIMITIVE_DEPENDENCIES = {
+    "string": ("char",),
+    "value": ("object", "array", "string", "number", "boolean", "null"),
+    "object": ("string", "value"),
+    "array": ("value",),
+}
+_RESERVED_NAMES = set(_PRIMITIVE_RULES) | {"space", "root"}
+
+# schema keywords that only carry documentation
+_IGNORED_KEYWORDS = {
+    "$schema",
+    "$id",
+    "$defs",
+    "definitions",
+    "title",
+    "description",
+    "examples",
+    "default",
+    "additionalProperties",
+}
+_SUPPORTED_KEYWORDS = {
+    "type",
+    "properties",
+    "required",
+    "items",
+    "minItems",
+    "maxItems",
+    "minLength",
+    "maxLength",
+    "enum",
+    "const",
+    "anyOf",
+    "oneOf",
+    "$ref",
+} | _IGNORED_KEYWORDS
+
+
+class UnsupportedSchemaError(ValueError):
+    pass
+
+
+def _literal(text: str) -> str:
+    escaped = (
+        text.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+    )
+    return f'"{escaped}"'
+
+
+def _repeat(item: str, min_count: int, max_count: Optional[int]) -> str:
+    if max_count is None:
+        return f"{item}{{{min_count},}}"
+    return f"{item}{{{min_count},{max_count}}}"
+
+
+class _SchemaCompiler:
+    """
+    Compile a JSON schema into a GBNF grammar. Covers the schemas of
+    structured output: objects (properties are produced in schema order,
+    no additional ones), arrays, strings, numbers, booleans, null, enums,
+    constants, unions and local `$ref`s. Anything else raises
+    `UnsupportedSchemaError`.
+    """
+
+    def __init__(self, schema: Dict[str, Any]) -> None:
+        self.schema = schema
+        self.rules: Dict[str, str] = {"space": _SPACE_RULE}
+        self._refs: Dict[str, str] = {}
+
+    def compile(self) -> str:
+        self.rules["root"] = self.visit(self.schema, "root")
+        return "\n".join(f"{name} ::= {body}" for name, body in self.rules.items())
+
+    def _add_rule(self, name: str, body: str) -> str:
+        name = re.sub(r"[^a-zA-Z0-9-]+", "-", name).strip("-") or "rule"
+        key, i = name, 0
+        while key in _RESERVED_NAMES or (key in self.rules and self.rules[key] != body):
+            i += 1
+            key = f"{name}{i}"
+        self.rules[key] = body
+        return key
+
+    def _primitive(self, name: str) -> str:
+        if name not in self.rules:
+            self.rules[name] = _PRIMITIVE_RULES[name]
+            for dependency in _PRIMITIVE_DEPENDENCIES.get(name, ()):
+                self._primitive(dependency)
+        return name
+
+    def _resolve(self, ref: str) -> str:
+        if ref in self._refs:
+            return self._refs[ref]
+        if not ref.startswith("#/"):
+            raise UnsupportedSchemaError(f"Unsupported remote $ref: {ref}")
+        target: Any = self.schema
+        for part in ref[2:].split("/"):
+            target = target[part.replace("~1", "/").replace("~0", "~")]
+        name = self._add_rule(ref.rsplit("/", 1)[-1], "")
+        # reserved before visiting, so recursive schemas refer to it
+        self._refs[ref] = name
+        self.rules[name] = self.visit(target, name)
+        return name
+
+    def visit(self, schema: Any, name: str) -> str:
+        """
+        Return the body of the rule matching `schema`.
+        """
+        if schema is True or schema == {}:
+            return self._primitive("value")
+        if not isinstance(schema, dict):
+            raise UnsupportedSchemaError(f"Unsupported schema: {schema!r}")
+        unsupported = set(schema) - _SUPPORTED_KEYWORDS
+        if unsupported:
+            raise UnsupportedSchemaError(
+                f"Unsupported schema keywords: {sorted(unsupported)}"
+            )
+
+        if "$ref" in schema:
+            return self._resolve(schema["$ref"])
+        if "const" in schema:
+            return f"{_literal(json.dumps(schema['const']))} space"
+        if "enum" in schema:
+            return (
+                "("
+                + " | ".join(_literal(json.dumps(v)) for v in schema["enum"])
+                + ") space"
+            )
+        for union in ("anyOf", "oneOf"):
+            if union in schema:
+                return " | ".join(
+                    self._add_rule(f"{name}-{i}", self.visit(s, f"{name}-{i}"))
+                    for i, s in enumerate(schema[union])
+                )
+
+        schema_type = schema.get("type")
+        if isinstance(schema_type, list):
+            return " | ".join(
+                self._add_rule(f"{name}-{t}", self.visit({**schema, "type": t}, name))
+                for t in schema_type
+            )
+        if schema_type == "object" or (schema_type is None and "properties" in schema):
+            return self._object(schema, name)
+        if schema_type == "array":
+            return self._array(schema, name)
+        if schema_type == "string":
+            return self._string(schema)
+        if schema_type in ("integer", "number", "boolean", "null"):
+            return self._primitive(schema_type)
+        if schema_type is None:
+            return self._primitive("value")
+        raise UnsupportedSchemaError(f"Unsupported schema type: {schema_type}")
+
+    def _object(self, schema: Dict[str, Any], name: str) -> str:
+        properties = schema.get("properties")
+        if not properties:
+            return self._primitive("object")
+        required = set(schema.get("required", []))
+        pairs: List[Tuple[str, bool]] = []
+        for key, value in properties.items():
+            value_rule = self._add_rule(
+                f"{name}-{key}", self.visit(value, f"{name}-{key}")
+            )
+            pair = self._add_rule(
+                f"{name}-{key}-kv",
+                f'{_literal(json.dumps(key))} space ":" space {value_rule}',
+            )
+            pairs.append((pair, key in required))
+
+        mandatory = [pair for pair, is_required in pairs if is_required]
+        optional = [pair for pair, is_required in pairs if not is_required]
+        # required properties first, then any ordered subset of the others
+        if mandatory:
+            body = ' "," space '.join(mandatory)
+            body += "".join(f' ( "," space {pair} )?' for pair in optional)
+        else:
+            body = (
+                "( "
+                + " | ".join(
+                    pair + "".join(f' ( "," space {p} )?' for p in optional[i + 1 :])
+                    for i, pair in enumerate(optional)
+                )
+                + " )?"
+            )
+        return f'"{{" space {body} "}}" space'
+
+    def _array(self, schema: Dict[str, Any], name: str) -> str:
+        items = schema.get("items", {})
+        item = self._add_rule(f"{name}-item", self.visit(items, f"{name}-item"))
+        min_items = schema.get("minItems", 0)
+        max_items = schema.get("maxItems")
+        if max_items == 0:
+            return '"[" space "]" space'
+        rest = _repeat(
+            f'("," space {item})',
+            max(min_items - 1, 0),
+            None if max_items is None else max_items - 1,
+        )
+        elements = f"{item} {rest}"
+        if min_items == 0:
+            elements = f"( {elements} )?"
+        return f'"[" space {elements} "]" space'
+
+    def _string(self, schema: Dict[str, Any]) -> str:
+        if "minLength" not in schema and "maxLength" not in schema:
+            return self._primitive("string")
+        self._primitive("string")
+        chars = _repeat("char", schema.get("minLength", 0), schema.get("maxLength"))
+        return f'"\\"" {chars} "\\"" space'
+
+
+def json_schema_to_grammar(schema: Dict[str, Any]) -> str:
+    """
+    Compile a JSON schema into a llama.cpp GBNF grammar.
+    """
+    return _SchemaCompiler(schema).compile()
+
+
+def bnf_to_grammar(bnf: Dict[str, Any]) -> str:
+    """
+    Render the grammar of a `GrammarResponseFormat`: either a GBNF string
+    under `"grammar"`, or a mapping of rule names to rule bodies with a
+    `root` rule.
+    """
+    if isinstance(bnf.get("grammar"), str):
+        return bnf["grammar"]
+    if "root" not in bnf:
+        raise ValueError("A grammar response format needs a `root` rule")
+    return "\n".join(f"{name} ::= {body}" for name, body in bnf.items())
+
+
+class GrammarCache:
+    """
+    Turn response formats into llama.cpp-native constrained decoding
+    parameters, caching them by a hash of the schema or grammar so that
+    repeated structured requests skip compilation.
+
+    JSON schemas are compiled to a GBNF `grammar`; schemas using keywords
+    the compiler does not cover are sent as `json_schema`, which llama.cpp
+    compiles itself.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.entries: LRUCache[Dict[str, Any]] = LRUCache(max_size)
+        self.compiled = 0
+        self.passed_through = 0
+
+    def json_schema(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        key = "json_schema:" + digest(schema)
+        params = self.entries.get(key)
+        if params is None:
+            params = compile_json_schema(schema)
+            if "grammar" in params:
+                self.compiled += 1
+            else:
+                self.passed_through += 1
+            self.entries.put(key, params)
+        return params
+
+    def grammar(self, bnf: Dict[str, Any]) -> Dict[str, Any]:
+        key = "grammar:" + digest(bnf)
+        params = self.entries.get(key)
+        if params is None:
+            params = {"grammar": bnf_to_grammar(bnf)}
+            self.compiled += 1
+            self.entries.put(key, params)
+        return params
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.entries.stats(),
+            "compiled": self.compiled,
+            "passed_through": self.passed_through,
+        }
+
+
+def compile_json_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The llama.cpp request parameters constraining the output to `schema`.
+    """
+    try:
+        return {"grammar": json_schema_to_grammar(schema)}
+    except UnsupportedSchemaError:
+        return {"json_schema": schema}
@@ -0,0 +1,43 @@
+import hashlib
+import json
+from enum import Enum
+from typing import Any
+
+from pydantic import BaseModel
+
+# transport-only fields of a converted request, they never change the response
+_IGNORED_PAYLOAD_KEYS = ("extra_headers",)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not hashable as JSON")
+
+
+def canonical_json(obj: Any) -> str:
+    """
+    Serialize `obj` to JSON with sorted keys and no whitespace, so equal
+    values always produce equal strings.
+    """
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=_json_default)
+
+
+def digest(obj: Any) -> str:
+    """
+    A stable content hash of `obj`.
+    """
+    data = obj if isinstance(obj, str) else canonical_json(obj)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def payload_digest(payload: dict) -> str:
+    """
+    A stable content hash of a request payload converted for the OpenAI
+    client, ignoring the fields that only affect transport.
+    """
+    return digest({k: v for k, v in payload.items() if k not in _IGNORED_PAYLOAD_KEYS})
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Optional
+
+import httpx
+
+from llama_stack.log import get_logger
+
+from .backends import Backend, BackendPool
+
+logger = get_logger(name=__name__, category="inference")
+
+
+class HealthProber:
+    """
+    Polls the `/health` endpoint of every Ramalama server of a pool every
+    `interval` seconds and feeds the result to its circuit breaker, so a
+    dead server is taken out of rotation before a user request hits it and
+    put back as soon as it answers again.
+    """
+
+    def __init__(
+        self,
+        pool: BackendPool,
+        http_client: httpx.AsyncClient,
+        interval: Optional[float],
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.pool = pool
+        self.http_client = http_client
+        self.interval = interval
+        self.timeout = timeout
+        self._task: Optional[asyncio.Task] = None
+
+    async def check_all(self) -> None:
+        """
+        Check every server once at startup. Servers that are not healthy,
+        like those still loading their model, are left in rotation: the
+        background checks, or the requests failing, take them out.
+        """
+        healthy = await asyncio.gather(
+            *(
+                backend.check_health(self.http_client, self.timeout)
+                for backend in self.pool.backends
+            )
+        )
+        for backend, ok in zip(self.pool.backends, healthy):
+            if ok:
+                logger.info(f"successfully connected to Ramalama at `{backend.url}`")
+            else:
+                logger.warning(f"Ramalama at `{backend.url}` is not healthy yet")
+
+    async def probe(self) -> None:
+        await asyncio.gather(*(self._probe(backend) for backend in self.pool.backends))
+
+    async def _probe(self, backend: Backend) -> None:
+        breaker = backend.breaker
+        was_closed = breaker.state == breaker.CLOSED
+        if not breaker.try_probe():
+            # a request is probing the server already
+            return
+        try:
+            healthy = await backend.check_health(self.http_client, self.timeout)
+        except BaseException:
+            breaker.record_cancel()
+            raise
+        if healthy:
+            if not was_closed:
+                logger.info(f"Ramalama at `{backend.url}` is healthy again")
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+            if was_closed and breaker.state == breaker.OPEN:
+                logger.warning(f"Ramalama at `{backend.url}` is down")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _probe_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.probe()
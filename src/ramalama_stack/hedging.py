@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import math
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+# latencies needed before a percentile is trusted to trigger hedges
+MIN_SAMPLES = 20
+# recent latencies kept per endpoint
+WINDOW = 1000
+# recompute the percentile every this many new samples
+REFRESH_EVERY = 50
+
+
+class Hedger:
+    """
+    Hedged requests: when a request has not completed within the
+    `percentile`th percentile of the recent latency of its endpoint, send
+    a duplicate elsewhere and keep whichever answers first.
+
+    Hedges are capped to `budget`, a fraction of all hedgeable requests, so
+    a slow pool is never flooded with duplicates.
+    """
+
+    def __init__(self, percentile: float, budget: float) -> None:
+        self.percentile = percentile
+        self.budget = budget
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._delays: Dict[str, Optional[float]] = {}
+        self._since_refresh: Dict[str, int] = {}
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def delay(self, endpoint: str) -> Optional[float]:
+        """
+        Seconds to wait for a request before hedging it, None until enough
+        latencies were recorded.
+        """
+        return self._delays.get(endpoint)
+
+    def record(self, endpoint: str, latency: float) -> None:
+        latencies = self._latencies.setdefault(
+            endpoint, collections.deque(maxlen=WINDOW)
+        )
+        latencies.append(latency)
+        count = self._since_refresh.get(endpoint, 0) + 1
+        if len(latencies) >= MIN_SAMPLES and (
+            count >= REFRESH_EVERY or self._delays.get(endpoint) is None
+        ):
+            ordered = sorted(latencies)
+            index = math.ceil(self.percentile / 100 * len(ordered)) - 1
+            self._delays[endpoint] = ordered[max(0, min(index, len(ordered) - 1))]
+            count = 0
+        self._since_refresh[endpoint] = count
+
+    def try_hedge(self) -> bool:
+        """
+        Take a hedge out of the budget, if any is left.
+        """
+        if self.hedges + 1 > self.budget * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+    async def run(
+        self,
+        endpoint: str,
+        send: Callable[[bool], Awaitable[Any]],
+        can_hedge: Callable[[], bool],
+    ) -> Any:
+        """
+        Run `send(False)`, and `send(True)` for the hedge if the first call
+        is too slow and `can_hedge()`. The first successful result wins and
+        the other call is cancelled; if both fail, the first error is raised.
+        """
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        started = {}
+        primary = asyncio.ensure_future(send(False))
+        started[primary] = loop.time()
+        pending = {primary}
+        try:
+            delay = self.delay(endpoint)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and can_hedge() and self.try_hedge():
+                    hedge = asyncio.ensure_future(send(True))
+                    started[hedge] = loop.time()
+                    pending.add(hedge)
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self.record(endpoint, loop.time() - started[task])
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            "delays": dict(self._delays),
+        }
@@ -0,0 +1,167 @@
+import asyncio
+import base64
+import hashlib
+import io
+from typing import Any, Dict, Optional
+
+import httpx
+from PIL import Image as PIL_Image
+
+from llama_stack.apis.common.content_types import URL, ImageContentItem
+from llama_stack.apis.inference import Message
+
+from .lru import LRUCache
+
+# formats sent as they are when they need no downscaling
+_PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+# what Pillow raises for images it cannot or will not decode: unknown or
+# truncated files, broken chunks, and images too large to be safe to open
+_INVALID_IMAGE_ERRORS = (
+    OSError,
+    SyntaxError,
+    ValueError,
+    PIL_Image.DecompressionBombError,
+)
+
+
+def _decode_data_url(uri: str) -> bytes:
+    _, _, data = uri.partition(",")
+    return base64.b64decode(data)
+
+
+def _has_alpha(image: PIL_Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def _encode(content: bytes, max_size: Optional[int], quality: int) -> str:
+    """
+    Turn image bytes into a data URL, downscaled so that neither side is
+    longer than `max_size` pixels.
+    """
+    image = PIL_Image.open(io.BytesIO(content))
+    fmt = image.format or "PNG"
+    if max_size is None or max(image.size) <= max_size:
+        if fmt in _PASSTHROUGH_FORMATS:
+            return f"data:image/{fmt.lower()};base64," + base64.b64encode(
+                content
+            ).decode("utf-8")
+    else:
+        image.thumbnail((max_size, max_size), PIL_Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    if _has_alpha(image):
+        fmt = "PNG"
+        image.save(out, format=fmt, optimize=True)
+    else:
+        fmt = "JPEG"
+        image.convert("RGB").save(out, format=fmt, quality=quality)
+    return f"data:image/{fmt.lower()};base64," + base64.b64encode(
+        out.getvalue()
+    ).decode("utf-8")
+
+
+class ImageProcessor:
+    """
+    Prepare the images of chat messages for a vision model: fetch remote
+    images, downscale them to `max_size` pixels and inline them as data
+    URLs, which is what llama.cpp accepts.
+
+    Results are cached by image URL and by content hash, so an image seen
+    before is neither fetched nor encoded again.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int],
+        cache_size: int,
+        quality: int = 90,
+        fetch_timeout: float = 30.0,
+    ) -> None:
+        self.max_size = max_size
+        self.quality = quality
+        self.fetch_timeout = fetch_timeout
+        self.entries: LRUCache[str] = LRUCache(cache_size)
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self.fetches = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def close(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def process_message(self, message: Message) -> Message:
+        """
+        Return `message` with its images inlined and downscaled, or
+        `message` itself if it holds no image.
+        """
+        content = getattr(message, "content", None)
+        if isinstance(content, ImageContentItem):
+            return message.model_copy(update={"content": await self.process(content)})
+        if isinstance(content, list) and any(
+            isinstance(item, ImageContentItem) for item in content
+        ):
+            items = [
+                await self.process(item) if isinstance(item, ImageContentItem) else item
+                for item in content
+            ]
+            return message.model_copy(update={"content": items})
+        return message
+
+    async def process(self, item: ImageContentItem) -> ImageContentItem:
+        return ImageContentItem(image={"url": URL(uri=await self.to_data_url(item))})
+
+    async def to_data_url(self, item: ImageContentItem) -> str:
+        image = item.image
+        url = image.url.uri if image.url else None
+        if url is not None and not url.startswith("data:"):
+            cached = self.entries.get(url)
+            if cached is not None:
+                return cached
+            content = await self._fetch(url)
+        elif url is not None:
+            content = _decode_data_url(url)
+        else:
+            content = base64.b64decode(image.data)
+
+        key = hashlib.sha256(content).hexdigest()
+        data_url = self.entries.get(key)
+        if data_url is None:
+            # decoding and resizing are CPU-bound, keep them off the event loop
+            try:
+                data_url = await asyncio.to_thread(
+                    _encode, content, self.max_size, self.quality
+                )
+            except _INVALID_IMAGE_ERRORS as e:
+                raise ValueError(f"Invalid image: {e}") from e
+            self.entries.put(key, data_url)
+            self.bytes_in += len(content)
+            self.bytes_out += len(data_url)
+        if url is not None and not url.startswith("data:"):
+            self.entries.put(url, data_url)
+        return data_url
+
+    async def _fetch(self, url: str) -> bytes:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=self.fetch_timeout, follow_redirects=True
+            )
+        response = await self._http_client.get(url)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise ValueError(f"Failed to fetch image from {url}: {e}") from e
+        self.fetches += 1
+        return response.content
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.entries.stats(),
+            "fetches": self.fetches,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
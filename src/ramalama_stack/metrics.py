@@ -0,0 +1,421 @@
+import asyncio
+import bisect
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from llama_stack.log import get_logger
+
+from .streams import GuardedStream
+
+logger = get_logger(name=__name__, category="inference")
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INTER_TOKEN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = (
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), value: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            )
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, labels: Labels = (), value: float = 1) -> None:
+        self.inc(labels, -value)
+
+    def set(self, labels: Labels, value: float) -> None:
+        self.values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: bucket counts (the last one is +Inf), sum
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        counts, total = self.values.setdefault(
+            labels, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                label_str = _format_labels(self.labelnames + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total[0]}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+def error_code(error: BaseException) -> str:
+    """
+    A low-cardinality label for an upstream failure: the HTTP status code,
+    or the kind of transport error.
+    """
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(error, APIStatusError):
+        return str(error.status_code)
+    if isinstance(error, APITimeoutError):
+        return "timeout"
+    if isinstance(error, APIConnectionError):
+        return "connection"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    return type(error).__name__
+
+
+class InferenceMetrics:
+    """
+    Latency, token and error metrics of the requests sent to Ramalama,
+    labelled by model and endpoint, rendered in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        labels = ("model", "endpoint")
+        self.requests = Counter(
+            "ramalama_requests_total", "Requests sent to Ramalama.", labels
+        )
+        self.errors = Counter(
+            "ramalama_request_errors_total",
+            "Failed requests to Ramalama by error code.",
+            labels + ("code",),
+        )
+        self.in_flight = Gauge(
+            "ramalama_requests_in_flight", "Requests waiting for Ramalama.", labels
+        )
+        self.latency = Histogram(
+            "ramalama_request_duration_seconds",
+            "Time from sending a request to receiving its last token.",
+            labels,
+        )
+        self.time_to_first_token = Histogram(
+            "ramalama_time_to_first_token_seconds",
+            "Time from sending a streaming request to receiving its first token.",
+            labels,
+        )
+        self.inter_token_latency = Histogram(
+            "ramalama_inter_token_latency_seconds",
+            "Time between two consecutive chunks of a stream.",
+            labels,
+            buckets=INTER_TOKEN_BUCKETS,
+        )
+        self.prompt_tokens = Histogram(
+            "ramalama_prompt_tokens",
+            "Prompt tokens per request.",
+            labels,
+            buckets=TOKEN_BUCKETS,
+        )
+        self.completion_tokens = Histogram(
+            "ramalama_completion_tokens",
+            "Completion tokens per request.",
+            labels,
+            buckets=TOKEN_BUCKETS,
+        )
+        self.tokens_per_second = Histogram(
+            "ramalama_completion_tokens_per_second",
+            "Completion tokens generated per second, per request.",
+            labels,
+            buckets=TOKENS_PER_SECOND_BUCKETS,
+        )
+        self.streams_cancelled = Counter(
+            "ramalama_streams_cancelled_total",
+            "Streams closed upstream because the client stopped reading them.",
+            labels,
+        )
+        self.tokens_saved = Counter(
+            "ramalama_tokens_saved_total",
+            "Estimated completion tokens not generated because the stream was "
+            "closed early.",
+            labels,
+        )
+        self._metrics: List[Any] = [
+            self.requests,
+            self.errors,
+            self.in_flight,
+            self.latency,
+            self.time_to_first_token,
+            self.inter_token_latency,
+            self.prompt_tokens,
+            self.completion_tokens,
+            self.tokens_per_second,
+            self.streams_cancelled,
+            self.tokens_saved,
+        ]
+
+    def start(self, model: str, endpoint: str) -> "RequestTimer":
+        return RequestTimer(self, (model, endpoint))
+
+    def mean_completion_tokens(self, labels: Labels) -> Optional[float]:
+        counts, total = self.completion_tokens.values.get(labels, ((), (0.0,)))
+        count = sum(counts)
+        return total[0] / count if count else None
+
+    def cancellation_stats(self) -> Dict[str, Any]:
+        return {
+            "streams_cancelled": int(sum(self.streams_cancelled.values.values())),
+            "tokens_saved": int(sum(self.tokens_saved.values.values())),
+        }
+
+    def render(
+        self,
+        backends: Sequence[Dict[str, Any]] = (),
+        admission: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        if backends:
+            for kind, name, key, help in (
+                (
+                    Gauge,
+                    "ramalama_backend_in_flight",
+                    "in_flight",
+                    "Requests in flight",
+                ),
+                (Counter, "ramalama_backend_requests_total", "requests", "Requests"),
+                (Counter, "ramalama_backend_errors_total", "errors", "Failed requests"),
+            ):
+                metric = kind(name, f"{help} per Ramalama server.", ("backend",))
+                for backend in backends:
+                    metric.values[(backend["url"],)] = backend[key]
+                lines.extend(metric.render())
+        if admission is not None:
+            for kind, name, key, help in (
+                (
+                    Gauge,
+                    "ramalama_admission_queued",
+                    "queued",
+                    "Requests waiting for a place under the concurrency limit.",
+                ),
+                (
+                    Gauge,
+                    "ramalama_admission_limit",
+                    "limit",
+                    "Current adaptive concurrency limit.",
+                ),
+                (
+                    Counter,
+                    "ramalama_admission_rejected_total",
+                    "rejected",
+                    "Requests turned away because the servers are saturated.",
+                ),
+            ):
+                metric = kind(name, help)
+                metric.values[()] = admission[key]
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """
+    Measures one upstream request. Streams report every chunk with
+    `chunk()`; every request ends with exactly one `finish()` or `fail()`.
+    """
+
+    def __init__(self, metrics: InferenceMetrics, labels: Labels) -> None:
+        self.metrics = metrics
+        self.labels = labels
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.chunks = 0
+        # counted by the adapter, for servers that do not report usage
+        self.prompt_tokens: Optional[int] = None
+        metrics.requests.inc(labels)
+        metrics.in_flight.inc(labels)
+
+    def chunk(self) -> None:
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+            self.metrics.time_to_first_token.observe(self.labels, now - self.started)
+        else:
+            self.metrics.inter_token_latency.observe(
+                self.labels, now - self.last_token_at
+            )
+        self.last_token_at = now
+        self.chunks += 1
+
+    def finish(self, usage: Any = None) -> None:
+        now = time.monotonic()
+        self.metrics.in_flight.dec(self.labels)
+        self.metrics.latency.observe(self.labels, now - self.started)
+
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or self.prompt_tokens
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if completion_tokens is None and self.chunks:
+            # without usage, count one token per streamed chunk
+            completion_tokens = self.chunks
+        if prompt_tokens is not None:
+            self.metrics.prompt_tokens.observe(self.labels, prompt_tokens)
+        if completion_tokens:
+            self.metrics.completion_tokens.observe(self.labels, completion_tokens)
+            generation_started = self.first_token_at or self.started
+            if now > generation_started:
+                self.metrics.tokens_per_second.observe(
+                    self.labels, completion_tokens / (now - generation_started)
+                )
+
+    def fail(self, error: BaseException) -> None:
+        self.metrics.in_flight.dec(self.labels)
+        self.metrics.errors.inc(self.labels + (error_code(error),))
+
+    def cancel(self) -> None:
+        """
+        The caller gave up on the request; it neither failed nor completed.
+        """
+        self.metrics.in_flight.dec(self.labels)
+
+    def abandon(self) -> None:
+        """
+        The client stopped reading a stream, which was closed upstream.
+        The tokens it would still have produced are estimated from the
+        mean length of the completions seen so far.
+        """
+        self.cancel()
+        self.metrics.streams_cancelled.inc(self.labels)
+        mean = self.metrics.mean_completion_tokens(self.labels)
+        if mean is not None and mean > self.chunks:
+            self.metrics.tokens_saved.inc(self.labels, round(mean - self.chunks))
+
+
+def instrument_stream(stream: AsyncIterator[Any], timer: RequestTimer) -> GuardedStream:
+    """
+    Re-yield an upstream stream, timing its chunks. The usage of the
+    stream is taken from its last chunk, where servers report it. The
+    upstream response is closed as soon as the stream is.
+    """
+    usage = None
+
+    def chunk(chunk: Any) -> None:
+        nonlocal usage
+        timer.chunk()
+        usage = getattr(chunk, "usage", None) or usage
+
+    def done(error: Optional[BaseException]) -> None:
+        if error is None:
+            timer.finish(usage)
+        elif isinstance(error, Exception):
+            timer.fail(error)
+        else:
+            # the consumer went away, the request did not fail
+            timer.abandon()
+
+    return GuardedStream(stream, on_chunk=chunk, done=done)
+
+
+class MetricsServer:
+    """
+    A minimal HTTP server answering `GET /metrics` for Prometheus.
+    """
+
+    def __init__(self, render: Any, host: str, port: int) -> None:
+        self.render = render
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(
+            f"serving Ramalama metrics on http://{self.host}:{self.port}/metrics"
+        )
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if (
+                len(parts) >= 2
+                and parts[0] == "GET"
+                and parts[1].split("?")[0] == "/metrics"
+            ):
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -3,32 +3,25 @@ import warnings
 from typing import (
     Any,
     AsyncGenerator,
+    AsyncIterator,
     Dict,
     List,
     Optional,
+    TYPE_CHECKING,
 )
-from llama_stack.providers.utils.inference.openai_compat import (
-    convert_message_to_openai_dict_new,
-    convert_tooldef_to_openai_tool,
-    _convert_openai_finish_reason,
-    convert_message_to_openai_dict,
-    get_sampling_options,
-)
-from openai import AsyncStream
-from openai.types.chat.chat_completion import (
-    Choice as OpenAIChoice,
-)
-from openai.types.completion_choice import Logprobs as OpenAICompletionLogprobs
+
 from pydantic import BaseModel
 
 from llama_stack.apis.inference import (
     ChatCompletionRequest,
+    ChatCompletionResponseStreamChunk,
     CompletionRequest,
     CompletionResponse,
     CompletionResponseStreamChunk,
     GrammarResponseFormat,
     GreedySamplingStrategy,
     Message,
+    SamplingParams,
     TokenLogProbs,
     ToolChoice,
     TopKSamplingStrategy,
@@ -38,8 +31,34 @@ from llama_stack.apis.inference import (
 from llama_stack.apis.inference.inference import (
     JsonSchemaResponseFormat,
     OpenAICompletion,
+    ResponseFormat,
 )
 
+from .conversion_cache import (
+    MessageConversionCache,
+    ToolConversionCache,
+    convert_message,
+)
+from .grammar import GrammarCache, bnf_to_grammar, compile_json_schema
+from .streams import GuardedStream
+
+# Pillow, the OpenAI client and llama-stack's OpenAI helpers, which pull
+# in its prompt formatting code, are imported where used so the provider
+# imports fast
+if TYPE_CHECKING:
+    from openai import AsyncStream
+    from openai.types.chat.chat_completion import (
+        Choice as OpenAIChoice,
+    )
+    from openai.types.chat.chat_completion_chunk import (
+        ChatCompletionChunk as OpenAIChatCompletionChunk,
+    )
+    from openai.types.completion_choice import (
+        Logprobs as OpenAICompletionLogprobs,
+    )
+
+    from .images import ImageProcessor
+
 logger = logging.getLogger(__name__)
 
 
@@ -71,10 +90,22 @@ class OpenAICompatCompletionResponse(BaseModel):
 async def convert_chat_completion_request(
     request: ChatCompletionRequest,
     n: int = 1,
+    message_cache: Optional[MessageConversionCache] = None,
+    image_processor: Optional["ImageProcessor"] = None,
+    tool_cache: Optional[ToolConversionCache] = None,
+    grammar_cache: Optional[GrammarCache] = None,
 ) -> dict:
     """
     Convert a ChatCompletionRequest to an OpenAI API-compatible dictionary.
+    Messages and tool sets already converted for a previous request are
+    taken from `message_cache` and `tool_cache` if given; images are
+    inlined and downscaled by `image_processor` if given, and compiled
+    grammars taken from `grammar_cache`.
     """
+    from llama_stack.providers.utils.inference.openai_compat import (
+        convert_tooldef_to_openai_tool,
+    )
+
     # model -> model
     # messages -> messages
     # sampling_params  TODO(mattf): review strategy
@@ -86,26 +117,20 @@ async def convert_chat_completion_request(
     #  top_k -> nvext.top_k
     #  max_tokens -> max_tokens
     #  repetition_penalty -> nvext.repetition_penalty
-    # response_format -> GrammarResponseFormat TODO(mf)
-    # response_format -> JsonSchemaResponseFormat: response_format = "json_object" & nvext["guided_json"] = json_schema
+    # response_format -> grammar (GBNF) or json_schema, see _constrained_decoding
     # tools -> tools
     # tool_choice ("auto", "required") -> tool_choice
     # tool_prompt_format -> TBD
     # stream -> stream
     # logprobs -> logprobs
 
-    if request.response_format and not isinstance(
-        request.response_format, JsonSchemaResponseFormat
-    ):
-        raise ValueError(
-            f"Unsupported response format: {request.response_format}. Only JsonSchemaResponseFormat is supported."
-        )
-
     nvext = {}
     payload: Dict[str, Any] = dict(
         model=request.model,
         messages=[
-            await convert_message_to_openai_dict_new(message)
+            await message_cache.convert(message, image_processor)
+            if message_cache is not None
+            else await convert_message(message, image_processor)
             for message in request.messages
         ],
         stream=request.stream,
@@ -117,14 +142,16 @@ async def convert_chat_completion_request(
     )
 
     if request.response_format:
-        # server bug - setting guided_json changes the behavior of response_format resulting in an error
-        # payload.update(response_format="json_object")
-        nvext.update(guided_json=request.response_format.json_schema)
+        payload["extra_body"].update(
+            _constrained_decoding(request.response_format, grammar_cache)
+        )
 
     if request.tools:
-        payload.update(
-            tools=[convert_tooldef_to_openai_tool(tool) for tool in request.tools]
-        )
+        if tool_cache is not None:
+            tools = tool_cache.convert(request.tools)
+        else:
+            tools = [convert_tooldef_to_openai_tool(tool) for tool in request.tools]
+        payload.update(tools=tools)
         if request.tool_config.tool_choice:
             payload.update(
                 tool_choice=request.tool_config.tool_choice.value
@@ -151,6 +178,7 @@ async def convert_chat_completion_request(
             nvext.update(top_k=strategy.top_k)
         elif isinstance(strategy, GreedySamplingStrategy):
             nvext.update(top_k=-1)
+            payload.update(temperature=0.0)
         else:
             raise ValueError(f"Unsupported sampling strategy: {strategy}")
 
@@ -160,6 +188,7 @@ async def convert_chat_completion_request(
 def convert_completion_request(
     request: CompletionRequest,
     n: int = 1,
+    grammar_cache: Optional[GrammarCache] = None,
 ) -> dict:
     """
     Convert a ChatCompletionRequest to an OpenAI API-compatible dictionary.
@@ -175,7 +204,7 @@ def convert_completion_request(
     #  top_k -> nvext.top_k
     #  max_tokens -> max_tokens
     #  repetition_penalty -> nvext.repetition_penalty
-    # response_format -> nvext.guided_json
+    # response_format -> grammar (GBNF) or json_schema, see _constrained_decoding
     # stream -> stream
     # logprobs.top_k -> logprobs
 
@@ -192,8 +221,9 @@ def convert_completion_request(
     )
 
     if request.response_format:
-        # this is not openai compliant, it is a nim extension
-        nvext.update(guided_json=request.response_format.json_schema)
+        payload["extra_body"].update(
+            _constrained_decoding(request.response_format, grammar_cache)
+        )
 
     if request.logprobs:
         payload.update(logprobs=request.logprobs.top_k)
@@ -204,25 +234,64 @@ def convert_completion_request(
         if request.sampling_params.max_tokens:
             payload.update(max_tokens=request.sampling_params.max_tokens)
 
-        if request.sampling_params.strategy == "top_p":
+        strategy = request.sampling_params.strategy
+        if isinstance(strategy, TopPSamplingStrategy):
             nvext.update(top_k=-1)
-            payload.update(top_p=request.sampling_params.top_p)
-        elif request.sampling_params.strategy == "top_k":
-            if (
-                request.sampling_params.top_k != -1
-                and request.sampling_params.top_k < 1
-            ):
+            payload.update(top_p=strategy.top_p)
+            payload.update(temperature=strategy.temperature)
+        elif isinstance(strategy, TopKSamplingStrategy):
+            if strategy.top_k != -1 and strategy.top_k < 1:
                 warnings.warn("top_k must be -1 or >= 1", stacklevel=2)
-            nvext.update(top_k=request.sampling_params.top_k)
-        elif request.sampling_params.strategy == "greedy":
+            nvext.update(top_k=strategy.top_k)
+        elif isinstance(strategy, GreedySamplingStrategy):
             nvext.update(top_k=-1)
-            payload.update(temperature=request.sampling_params.temperature)
+            payload.update(temperature=0.0)
 
     return payload
 
 
+def _constrained_decoding(
+    response_format: ResponseFormat, grammar_cache: Optional[GrammarCache]
+) -> Dict[str, Any]:
+    """
+    The llama.cpp parameters constraining the output to `response_format`:
+    a GBNF `grammar`, or a `json_schema` for schemas llama.cpp has to
+    compile itself.
+    """
+    if isinstance(response_format, JsonSchemaResponseFormat):
+        if grammar_cache is not None:
+            return grammar_cache.json_schema(response_format.json_schema)
+        return compile_json_schema(response_format.json_schema)
+    if isinstance(response_format, GrammarResponseFormat):
+        if grammar_cache is not None:
+            return grammar_cache.grammar(response_format.bnf)
+        return {"grammar": bnf_to_grammar(response_format.bnf)}
+    raise ValueError(f"Unsupported response format: {response_format}")
+
+
+def is_deterministic_sampling(sampling_params: Optional[SamplingParams]) -> bool:
+    """
+    Whether sampling with these parameters always yields the same output
+    for the same input.
+    """
+    if sampling_params is None:
+        return False
+    strategy = sampling_params.strategy
+    return isinstance(strategy, GreedySamplingStrategy) or (
+        isinstance(strategy, TopKSamplingStrategy) and strategy.top_k == 1
+    )
+
+
+def is_deterministic_request(payload: Dict[str, Any]) -> bool:
+    """
+    Whether an OpenAI-compatible request payload always yields the same
+    output: greedy decoding (temperature 0) or a fixed seed.
+    """
+    return payload.get("temperature") == 0 or payload.get("seed") is not None
+
+
 def _convert_openai_completion_logprobs(
-    logprobs: Optional[OpenAICompletionLogprobs],
+    logprobs: Optional["OpenAICompletionLogprobs"],
 ) -> Optional[List[TokenLogProbs]]:
     """
     Convert an OpenAI CompletionLogprobs into a list of TokenLogProbs.
@@ -236,11 +305,15 @@ def _convert_openai_completion_logprobs(
 
 
 def convert_openai_completion_choice(
-    choice: OpenAIChoice,
+    choice: "OpenAIChoice",
 ) -> CompletionResponse:
     """
     Convert an OpenAI Completion Choice into a CompletionResponse.
     """
+    from llama_stack.providers.utils.inference.openai_compat import (
+        _convert_openai_finish_reason,
+    )
+
     return CompletionResponse(
         content=choice.text,
         stop_reason=_convert_openai_finish_reason(choice.finish_reason),
@@ -248,13 +321,24 @@ def convert_openai_completion_choice(
     )
 
 
-async def convert_openai_completion_stream(
-    stream: AsyncStream[OpenAICompletion],
-) -> AsyncGenerator[CompletionResponse, None]:
+def convert_openai_completion_stream(
+    stream: "AsyncStream[OpenAICompletion]",
+) -> AsyncIterator[CompletionResponseStreamChunk]:
     """
     Convert a stream of OpenAI Completions into a stream
-    of ChatCompletionResponseStreamChunks.
+    of ChatCompletionResponseStreamChunks, closing the upstream stream as
+    soon as the converted one is closed.
     """
+    return GuardedStream(_convert_openai_completion_chunks(stream), upstream=stream)
+
+
+async def _convert_openai_completion_chunks(
+    stream: "AsyncStream[OpenAICompletion]",
+) -> AsyncGenerator[CompletionResponseStreamChunk, None]:
+    from llama_stack.providers.utils.inference.openai_compat import (
+        _convert_openai_finish_reason,
+    )
+
     async for chunk in stream:
         choice = chunk.choices[0]
         yield CompletionResponseStreamChunk(
@@ -264,6 +348,24 @@ async def convert_openai_completion_stream(
         )
 
 
+def convert_openai_chat_completion_stream(
+    stream: "AsyncStream[OpenAIChatCompletionChunk]",
+    enable_incremental_tool_calls: bool,
+) -> AsyncIterator[ChatCompletionResponseStreamChunk]:
+    """
+    Convert a stream of OpenAI chat completion chunks into a stream
+    of ChatCompletionResponseStreamChunk with the Llama Stack converter,
+    closing the upstream stream as soon as the converted one is closed.
+    """
+    from llama_stack.providers.utils.inference.openai_compat import (
+        convert_openai_chat_completion_stream as convert,
+    )
+
+    return GuardedStream(
+        convert(stream, enable_incremental_tool_calls), upstream=stream
+    )
+
+
 def _merge_context_into_content(message: Message) -> Message:  # type: ignore
     """
     Merge the ``context`` field of a Llama Stack ``Message`` object into
@@ -288,23 +390,32 @@ def _merge_context_into_content(message: Message) -> Message:  # type: ignore
 
 async def llama_stack_chat_completion_to_openai_chat_completion_dict(
     request: ChatCompletionRequest,
+    image_processor: Optional["ImageProcessor"] = None,
 ) -> dict:
     """
     Convert a chat completion request in Llama Stack format into an
     equivalent set of arguments to pass to an OpenAI-compatible
     chat completions API.
     :param request: Bundled request parameters in Llama Stack format.
+    :param image_processor: If given, inlines and downscales images in
+     place of downloading them on every request.
     :returns: Dictionary of key-value pairs to use as an initializer
      for a dataclass or to be converted directly to JSON and sent
      over the wire.
     """
 
+    from llama_stack.providers.utils.inference.openai_compat import (
+        convert_message_to_openai_dict,
+        get_sampling_options,
+    )
+
+    messages = [_merge_context_into_content(m) for m in request.messages]
+    if image_processor is not None:
+        messages = [await image_processor.process_message(m) for m in messages]
     converted_messages = [
         # This mystery async call makes the parent function also be async
-        await convert_message_to_openai_dict(
-            _merge_context_into_content(m), download=True
-        )
-        for m in request.messages
+        await convert_message_to_openai_dict(m, download=True)
+        for m in messages
     ]
     # converted_tools = _llama_stack_tools_to_openai_tools(request.tools)
 
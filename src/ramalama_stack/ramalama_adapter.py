@@ -1,18 +1,35 @@
-from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Union
-
-from openai import AsyncOpenAI, BadRequestError
-from openai.types.chat.chat_completion_chunk import (
-    ChatCompletionChunk as OpenAIChatCompletionChunk,
+import asyncio
+import time
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    TYPE_CHECKING,
+    Tuple,
+    Union,
 )
 
+import httpx
+
 from llama_stack.apis.common.content_types import (
     InterleavedContent,
     InterleavedContentItem,
     TextContentItem,
 )
 from llama_stack.apis.inference import (
+    BatchChatCompletionResponse,
+    BatchCompletionResponse,
     ChatCompletionRequest,
+    ChatCompletionResponse,
+    CompletionMessage,
     CompletionRequest,
+    CompletionResponse,
     EmbeddingsResponse,
     EmbeddingTaskType,
     Inference,
@@ -20,6 +37,7 @@ from llama_stack.apis.inference import (
     Message,
     ResponseFormat,
     SamplingParams,
+    StopReason,
     TextTruncation,
     ToolChoice,
     ToolConfig,
@@ -34,40 +52,560 @@ from llama_stack.apis.inference.inference import (
     OpenAIResponseFormatParam,
 )
 from llama_stack.apis.models import Model
+from llama_stack.apis.telemetry import MetricInResponse
 from llama_stack.log import get_logger
 from llama_stack.providers.datatypes import ModelsProtocolPrivate
-from llama_stack.providers.utils.inference.model_registry import (
-    ModelRegistryHelper,
-)
-from llama_stack.providers.utils.inference.openai_compat import (
-    convert_openai_chat_completion_choice,
-    convert_openai_chat_completion_stream,
-    prepare_openai_completion_params,
-)
 
+from .admission import AdaptiveLimiter, is_congestion
+from .affinity import PrefixAffinity, with_slot
+from .backends import (
+    Backend,
+    BackendPool,
+    BackendUnavailableError,
+    CircuitBreaker,
+    build_http_client,
+)
+from .batching import map_bounded
+from .budget import ContextBudget, TokenCounter
+from .catalog import ModelCatalog
+from .coalescer import EmbeddingCoalescer
+from .config import RamalamaImplConfig
+from .conversion_cache import MessageConversionCache, ToolConversionCache
+from .embedding_cache import EmbeddingCache, embedding_key
+from .grammar import GrammarCache
+from .health import HealthProber
+from .hashing import digest, payload_digest
+from .hedging import Hedger
 from .openai_compat import (
     convert_chat_completion_request,
     convert_completion_request,
+    convert_openai_chat_completion_stream,
     convert_openai_completion_choice,
     convert_openai_completion_stream,
+    is_deterministic_request,
+    is_deterministic_sampling,
 )
-from .models import model_entries
+from .metrics import InferenceMetrics, MetricsServer, instrument_stream
+from .response_cache import ResponseCache, response_cache_key
+from .singleflight import SingleFlight
+
+# the OpenAI client, slow to import, is only loaded by `initialize()`
+if TYPE_CHECKING:
+    from llama_stack.providers.utils.inference.model_registry import (
+        ModelRegistryHelper,
+    )
+    from openai import AsyncOpenAI
+    from openai.types.chat.chat_completion_chunk import (
+        ChatCompletionChunk as OpenAIChatCompletionChunk,
+    )
+
+    from .images import ImageProcessor
+    from .semantic_cache import SemanticCache
 
 logger = get_logger(name=__name__, category="inference")
 
 
+def _error_metrics(error: Exception) -> List[MetricInResponse]:
+    """
+    Mark the response standing in for a failed item of a batch, keeping
+    the error type and message, like `APIConnectionError: Connection error.`
+    """
+    return [
+        MetricInResponse(
+            metric="error", value=1, unit=f"{type(error).__name__}: {error}"
+        )
+    ]
+
+
 class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
-    def __init__(self, url: str) -> None:
-        self.register_helper = ModelRegistryHelper(model_entries)
-        self.url = url
+    def __init__(self, config: RamalamaImplConfig) -> None:
+        self._register_helper: Optional["ModelRegistryHelper"] = None
+        self.config = config
+        self.url = config.url
+        self._total_slots: Optional[int] = None
+        self._embedding_coalescer: Optional[EmbeddingCoalescer] = None
+        self._embedding_cache: Optional[EmbeddingCache] = None
+        self._response_cache: Optional[ResponseCache] = None
+        self._budget: Optional[ContextBudget] = None
+        self._single_flight: Optional[SingleFlight] = None
+        if config.single_flight:
+            self._single_flight = SingleFlight()
+        self._semantic_cache: Optional["SemanticCache"] = None
+        if config.semantic_cache_size > 0:
+            # NumPy is only loaded when the semantic cache is used
+            from .semantic_cache import SemanticCache
+
+            self._semantic_cache = SemanticCache(
+                config.semantic_cache_size,
+                config.semantic_cache_threshold,
+                config.response_cache_ttl,
+            )
+        self._affinity: Optional[PrefixAffinity] = None
+        self._message_cache: Optional[MessageConversionCache] = None
+        if config.message_cache_size > 0:
+            self._message_cache = MessageConversionCache(config.message_cache_size)
+        self._tool_cache: Optional[ToolConversionCache] = None
+        if config.tool_cache_size > 0:
+            self._tool_cache = ToolConversionCache(config.tool_cache_size)
+        self._grammar_cache: Optional[GrammarCache] = None
+        if config.grammar_cache_size > 0:
+            self._grammar_cache = GrammarCache(config.grammar_cache_size)
+        self._image_processor: Optional["ImageProcessor"] = None
+        if config.image_max_size is not None or config.image_cache_size > 0:
+            # Pillow is only loaded when images are processed
+            from .images import ImageProcessor
+
+            self._image_processor = ImageProcessor(
+                config.image_max_size, config.image_cache_size
+            )
+        self._limiter: Optional[AdaptiveLimiter] = None
+        self._hedger: Optional[Hedger] = None
+        if config.hedge_percentile is not None:
+            self._hedger = Hedger(config.hedge_percentile, config.hedge_budget)
+        self.metrics = InferenceMetrics()
+        self._metrics_server: Optional[MetricsServer] = None
+        # started by `initialize()`; `shutdown()` only stops what it got to
+        self._http_clients: List[httpx.AsyncClient] = []
+        self._health: Optional[HealthProber] = None
+        self.catalog: Optional[ModelCatalog] = None
+
+    @property
+    def register_helper(self) -> "ModelRegistryHelper":
+        # the model registry pulls in the whole Llama model catalog, only
+        # load it when it is asked for
+        if self._register_helper is None:
+            from llama_stack.providers.utils.inference.model_registry import (
+                ModelRegistryHelper,
+            )
+
+            from .models import get_model_entries
+
+            self._register_helper = ModelRegistryHelper(get_model_entries())
+        return self._register_helper
 
     async def initialize(self) -> None:
-        logger.info(f"checking connectivity to Ramalama at `{self.url}`...")
-        self.client = AsyncOpenAI(base_url=self.url, api_key="NO KEY")
-        logger.info(f"successfully connected to Ramalama at `{self.url}`...")
+        self._http_client = build_http_client(self.config)
+        self._http_clients.append(self._http_client)
+        backends: Dict[str, Backend] = {}
+        for url in self.config.endpoints():
+            if url not in backends:
+                backends[url] = self._backend(url, self._http_client)
+        # every routed model gets servers with a connection pool of their own
+        routes: Dict[str, List[Backend]] = {}
+        for model, urls in self.config.routes().items():
+            http_client = build_http_client(self.config)
+            self._http_clients.append(http_client)
+            for url in urls:
+                if url not in backends:
+                    backends[url] = self._backend(url, http_client)
+            routes[model] = [backends[url] for url in urls]
+        self.pool = BackendPool(list(backends.values()))
+        self._health = HealthProber(
+            self.pool,
+            self._http_client,
+            self.config.health_check_interval,
+            timeout=self.config.connect_timeout,
+        )
+        await self._health.check_all()
+        if self.config.health_check_interval is not None:
+            self._health.start()
+        self.catalog = ModelCatalog(self.pool, self.config.model_catalog_ttl, routes)
+        await self.catalog.refresh()
+        self.catalog.start()
+        if self.config.metrics_port is not None:
+            self._metrics_server = MetricsServer(
+                self.render_metrics, self.config.metrics_host, self.config.metrics_port
+            )
+            await self._metrics_server.start()
+        if self.config.prefix_affinity:
+            # slot counts are needed up front to spread conversations over slots
+            self._total_slots = await self.pool.total_slots(self._http_client)
+            self._affinity = PrefixAffinity(self.pool, self.config.prefix_affinity_size)
+        if self.config.context_budget:
+            self._budget = ContextBudget(
+                TokenCounter(self._http_client, self.config.token_count_cache_size)
+            )
+        if self.config.max_concurrency is not None:
+            if self._total_slots is None:
+                self._total_slots = await self.pool.total_slots(self._http_client)
+            self._limiter = AdaptiveLimiter(
+                min_limit=self.config.min_concurrency,
+                max_limit=self.config.max_concurrency,
+                # start from what the servers decode in parallel
+                initial_limit=self._total_slots,
+                max_queue_size=self.config.max_queue_size,
+                queue_timeout=self.config.queue_timeout,
+                tolerance=self.config.latency_tolerance,
+            )
+        if self.config.embedding_batch_window_ms is not None:
+            self._embedding_coalescer = EmbeddingCoalescer(
+                self._embed,
+                window=self.config.embedding_batch_window_ms / 1000,
+                max_batch_size=self.config.embedding_max_batch_size,
+            )
+        if self.config.embedding_cache_size > 0:
+            self._embedding_cache = EmbeddingCache(
+                self.config.embedding_cache_size, self.config.embedding_cache_db_path
+            )
+            await self._embedding_cache.initialize()
+        if self.config.response_cache_size > 0:
+            self._response_cache = ResponseCache(
+                self.config.response_cache_size, self.config.response_cache_ttl
+            )
 
     async def shutdown(self) -> None:
-        pass
+        if self._health is not None:
+            await self._health.stop()
+        if self.catalog is not None:
+            await self.catalog.stop()
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+        # closing the connection pools closes the clients of every replica
+        for http_client in self._http_clients:
+            await http_client.aclose()
+        if self._embedding_cache is not None:
+            await self._embedding_cache.close()
+        if self._image_processor is not None:
+            await self._image_processor.close()
+
+    def _backend(self, url: str, http_client: httpx.AsyncClient) -> Backend:
+        from openai import AsyncOpenAI
+
+        client = AsyncOpenAI(
+            base_url=url,
+            api_key="NO KEY",
+            http_client=http_client,
+            timeout=http_client.timeout,
+            # failing over to another replica is the adapter's retry
+            max_retries=0,
+        )
+        breaker = CircuitBreaker(
+            self.config.circuit_failure_threshold,
+            self.config.circuit_reset_timeout,
+        )
+        return Backend(url, client, breaker)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return the counters of the adapter: the in-flight request count,
+        request count and error rate of every Ramalama replica, and the
+        state of the optional request optimizations.
+        """
+        stats: Dict[str, Any] = {
+            "backends": self.pool.stats(),
+            "cancellation": self.metrics.cancellation_stats(),
+        }
+        if self._embedding_coalescer is not None:
+            stats["embedding_batching"] = self._embedding_coalescer.stats()
+        if self._embedding_cache is not None:
+            stats["embedding_cache"] = self._embedding_cache.stats()
+        if self._response_cache is not None:
+            stats["response_cache"] = self._response_cache.stats()
+        if self._semantic_cache is not None:
+            stats["semantic_cache"] = self._semantic_cache.stats()
+        if self._single_flight is not None:
+            stats["single_flight"] = self._single_flight.stats()
+        if self._budget is not None:
+            stats["context_budget"] = self._budget.stats()
+        if self._affinity is not None:
+            stats["prefix_affinity"] = self._affinity.stats()
+        if self._message_cache is not None:
+            stats["message_cache"] = self._message_cache.stats()
+        if self._tool_cache is not None:
+            stats["tool_cache"] = self._tool_cache.stats()
+        if self._grammar_cache is not None:
+            stats["grammar_cache"] = self._grammar_cache.stats()
+        if self._image_processor is not None:
+            stats["images"] = self._image_processor.stats()
+        if self._limiter is not None:
+            stats["admission"] = self._limiter.stats()
+        if self._hedger is not None:
+            stats["hedging"] = self._hedger.stats()
+        return stats
+
+    def render_metrics(self) -> str:
+        """
+        Return the request metrics in the Prometheus text format.
+        """
+        admission = self._limiter.stats() if self._limiter is not None else None
+        return self.metrics.render(self.pool.stats(), admission)
+
+    async def _batch_concurrency(self) -> int:
+        if self.config.batch_concurrency is not None:
+            return self.config.batch_concurrency
+        if self._total_slots is None:
+            self._total_slots = await self.pool.total_slots(self._http_client)
+        return self._total_slots
+
+    async def _create(self, endpoint: str, params: Dict[str, Any]) -> Any:
+        """
+        Send a chat completion (`endpoint="chat"`) or completion
+        (`endpoint="completion"`) request upstream, answering it from the
+        response cache or the semantic cache when possible, or sharing the
+        identical request already in flight.
+        """
+        stream = bool(params.get("stream"))
+        deterministic = is_deterministic_request(params)
+        key = None
+        if self._response_cache is not None and deterministic:
+            key = response_cache_key(endpoint, params)
+            cached = self._response_cache.lookup(key, stream)
+            if cached is not None:
+                return cached
+        query = None
+        if self._semantic_cache is not None and endpoint == "chat":
+            query = await self._semantic_query(params)
+            if query is not None:
+                cached = self._semantic_cache.lookup(*query, stream)
+                if cached is not None:
+                    return cached
+
+        if self._single_flight is not None and deterministic:
+            flight_key = (key or response_cache_key(endpoint, params), stream)
+            if stream:
+                response = await self._single_flight.stream(
+                    flight_key, lambda: self._send(endpoint, params, stream)
+                )
+            else:
+                response = await self._single_flight.call(
+                    flight_key, lambda: self._send(endpoint, params, stream)
+                )
+        else:
+            response = await self._send(endpoint, params, stream)
+
+        if key is not None:
+            response = self._response_cache.store(key, response, stream)
+        if query is not None:
+            response = self._semantic_cache.store(*query, response, stream)
+        return response
+
+    async def _semantic_query(
+        self, params: Dict[str, Any]
+    ) -> Optional[Tuple[int, List[float]]]:
+        """
+        The context hash and the embedding of the last user turn of a chat
+        completion request, None if the semantic cache cannot answer it.
+        """
+        from .semantic_cache import semantic_query
+
+        query = semantic_query(params)
+        if query is None:
+            return None
+        context, text = query
+        model = self.config.semantic_cache_model
+        try:
+            if self._embedding_cache is not None:
+                [embedding] = await self._cached_embeddings(model, [text], {})
+            else:
+                [embedding] = await self._fetch_embeddings(model, [text], {})
+        except Exception as e:
+            # the cache is skipped, the request itself can still be answered
+            self._semantic_cache.embedding_errors += 1
+            logger.debug(f"Could not embed the prompt with `{model}`: {e}")
+            return None
+        return context, embedding
+
+    async def _send(self, endpoint: str, params: Dict[str, Any], stream: bool) -> Any:
+        """
+        Send a chat completion or completion request upstream, fitting it
+        into the context of the model first when budgeting is enabled.
+        """
+        prompt_tokens = None
+        if self._budget is not None:
+            params, prompt_tokens = await self._budget.fit(
+                endpoint, params, self.catalog.lookup(params["model"])
+            )
+
+        backend, slot = None, None
+        if self._affinity is not None and endpoint == "chat":
+            backend, slot = self._affinity.route(
+                params, self.catalog.lookup(params["model"])
+            )
+            params = with_slot(params, slot)
+
+        if endpoint == "chat":
+            return await self._request(
+                lambda client: client.chat.completions.create(**params),
+                endpoint,
+                params["model"],
+                stream=stream,
+                backend=backend,
+                slot=slot,
+                prompt_tokens=prompt_tokens,
+            )
+        return await self._request(
+            lambda client: client.completions.create(**params),
+            endpoint,
+            params["model"],
+            stream=stream,
+            prompt_tokens=prompt_tokens,
+        )
+
+    async def _request(
+        self,
+        call: Callable[["AsyncOpenAI"], Awaitable[Any]],
+        endpoint: str,
+        model: str,
+        stream: bool = False,
+        backend: Optional[Backend] = None,
+        slot: Optional[int] = None,
+        exclude: Sequence[Backend] = (),
+        hedge: bool = True,
+        prompt_tokens: Optional[int] = None,
+    ) -> Any:
+        """
+        Send `call` to `backend`, or else to the least loaded replica
+        serving `model` other than the `exclude`d ones, moving to another
+        replica when the server cannot be reached. Streams stay counted
+        against their replica, and against the admission limit, until they
+        are fully consumed.
+
+        Unless `hedge` is False, slow non-streaming requests are hedged on
+        a second replica when hedging is enabled. `prompt_tokens`, if
+        counted beforehand, is reported when the server reports no usage.
+        """
+        if hedge and not stream and self._hedger is not None:
+            return await self._hedged(
+                call, endpoint, model, backend, slot, prompt_tokens
+            )
+        admitted = None
+        if self._limiter is not None:
+            admitted = await self._limiter.acquire()
+        kind = (endpoint, stream)
+        if backend is not None and not backend.breaker.available:
+            # the replica holding the conversation went down meanwhile
+            backend, slot = None, None
+        among = self.catalog.lookup(model)
+        tried: List[Backend] = list(exclude)
+        while True:
+            try:
+                backend = self.pool.acquire(
+                    backend, among=among, slot=slot, exclude=tried
+                )
+            except BackendUnavailableError:
+                if admitted is not None:
+                    self._limiter.release(admitted, kind)
+                raise
+            timer = self.metrics.start(model, endpoint)
+            timer.prompt_tokens = prompt_tokens
+            try:
+                if stream and self.config.first_byte_timeout is not None:
+                    response = await asyncio.wait_for(
+                        call(backend.client), self.config.first_byte_timeout
+                    )
+                else:
+                    response = await call(backend.client)
+            except BaseException as e:
+                failed = isinstance(e, Exception)
+                self.pool.release(backend, failed=failed, slot=slot)
+                backend.breaker.record(e)
+                if failed:
+                    timer.fail(e)
+                else:
+                    timer.cancel()
+                tried.append(backend)
+                if failed and self._can_fail_over(e, among, tried):
+                    logger.warning(
+                        f"Ramalama at `{backend.url}` is unreachable, "
+                        f"retrying on another replica: {e}"
+                    )
+                    backend, slot = None, None
+                    continue
+                if admitted is not None:
+                    self._limiter.release(
+                        admitted, kind, congested=failed and is_congestion(e)
+                    )
+                logger.debug(f"Ramalama backends: {self.pool.stats()}")
+                raise
+            backend.breaker.record_success()
+            break
+
+        if stream:
+            response = self.pool.release_after_stream(
+                backend, instrument_stream(response, timer), slot=slot
+            )
+            if admitted is not None:
+                # the time to the first byte tells how loaded the server is
+                response = self._limiter.release_after_stream(
+                    response, admitted, kind, time.monotonic() - admitted
+                )
+            return response
+        self.pool.release(backend, slot=slot)
+        timer.finish(getattr(response, "usage", None))
+        if admitted is not None:
+            self._limiter.release(admitted, kind, time.monotonic() - admitted)
+        return response
+
+    async def _hedged(
+        self,
+        call: Callable[["AsyncOpenAI"], Awaitable[Any]],
+        endpoint: str,
+        model: str,
+        backend: Optional[Backend],
+        slot: Optional[int],
+        prompt_tokens: Optional[int] = None,
+    ) -> Any:
+        """
+        Send a non-streaming request, and a duplicate to another replica
+        if it is slower than usual, keeping whichever answers first.
+        """
+        among = self.catalog.lookup(model)
+        candidates = [b for b in among or self.pool.backends if b.breaker.available]
+        if len(candidates) < 2:
+            return await self._request(
+                call,
+                endpoint,
+                model,
+                backend=backend,
+                slot=slot,
+                hedge=False,
+                prompt_tokens=prompt_tokens,
+            )
+        # pick the replica up front, the hedge has to go elsewhere
+        primary = backend or self.pool.select(among=among)
+
+        def send(hedge: bool) -> Awaitable[Any]:
+            if hedge:
+                return self._request(
+                    call,
+                    endpoint,
+                    model,
+                    exclude=[primary],
+                    hedge=False,
+                    prompt_tokens=prompt_tokens,
+                )
+            return self._request(
+                call,
+                endpoint,
+                model,
+                backend=primary,
+                slot=slot,
+                hedge=False,
+                prompt_tokens=prompt_tokens,
+            )
+
+        def can_hedge() -> bool:
+            return any(b.breaker.available and b is not primary for b in candidates)
+
+        return await self._hedger.run(endpoint, send, can_hedge)
+
+    def _can_fail_over(
+        self, error: Exception, among: List[Backend], tried: List[Backend]
+    ) -> bool:
+        """
+        Whether a request that failed with `error` can be sent again to a
+        replica not `tried` yet. Only requests that did not reach a server
+        are; a timed out one may still be running upstream.
+        """
+        from openai import APIConnectionError, APITimeoutError
+
+        if not isinstance(error, APIConnectionError) or isinstance(
+            error, APITimeoutError
+        ):
+            return False
+        return any(
+            b.breaker.available and b not in tried for b in among or self.pool.backends
+        )
 
     async def unregister_model(self, model_id: str) -> None:
         pass
@@ -92,11 +630,15 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
                 response_format=response_format,
                 stream=stream,
                 logprobs=logprobs,
-            )
+            ),
+            grammar_cache=self._grammar_cache,
         )
 
-        response = await self.client.completions.create(**request)
-        if stream:
+        return await self._completion(request)
+
+    async def _completion(self, request: Dict[str, Any]) -> Any:
+        response = await self._create("completion", request)
+        if request["stream"]:
             return convert_openai_completion_stream(response)
         else:
             # we pass n=1 to get only one completion
@@ -130,14 +672,22 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
                 tool_config=tool_config,
             ),
             n=1,
+            message_cache=self._message_cache,
+            image_processor=self._image_processor,
+            tool_cache=self._tool_cache,
+            grammar_cache=self._grammar_cache,
         )
-        s = await self.client.chat.completions.create(**request)
+        s = await self._create("chat", request)
         if stream:
             return convert_openai_chat_completion_stream(
                 s, enable_incremental_tool_calls=True
             )
         else:
             # we pass n=1 to get only one completion
+            from llama_stack.providers.utils.inference.openai_compat import (
+                convert_openai_chat_completion_choice,
+            )
+
             return convert_openai_chat_completion_choice(s.choices[0])
 
     async def embeddings(
@@ -156,7 +706,9 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
             content.text if isinstance(content, TextContentItem) else content
             for content in flat_contents
         ]
-        model = self.get_provider_model_id(model_id)
+        model = (await self.model_store.get_model(model_id)).provider_resource_id
+        if self._budget is not None and text_truncation in (None, TextTruncation.none):
+            await self._budget.check_inputs(model, input, self.catalog.lookup(model))
 
         extra_body = {}
 
@@ -178,30 +730,105 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
             }
             extra_body["input_type"] = task_type_options[task_type]
 
+        if self._embedding_cache is not None:
+            embeddings = await self._cached_embeddings(model, input, extra_body)
+        else:
+            embeddings = await self._fetch_embeddings(model, input, extra_body)
+        return EmbeddingsResponse(embeddings=embeddings)
+
+    async def _cached_embeddings(
+        self, model: str, input: List[Any], extra_body: Dict[str, Any]
+    ) -> List[List[float]]:
+        keys = [embedding_key(model, content, extra_body) for content in input]
+        embeddings = await self._embedding_cache.get_many(keys)
+
+        # send every distinct missing input upstream once, in a single request
+        missing: Dict[str, Any] = {}
+        for key, content, embedding in zip(keys, input, embeddings):
+            if embedding is None:
+                missing.setdefault(key, content)
+        if not missing:
+            return embeddings
+
+        fetched = dict(
+            zip(
+                missing,
+                await self._fetch_embeddings(model, list(missing.values()), extra_body),
+            )
+        )
+        await self._embedding_cache.put_many(fetched)
+        return [
+            embedding if embedding is not None else fetched[key]
+            for key, embedding in zip(keys, embeddings)
+        ]
+
+    async def _fetch_embeddings(
+        self, model: str, input: List[Any], extra_body: Dict[str, Any]
+    ) -> List[List[float]]:
+        if self._single_flight is not None:
+            return await self._single_flight.call(
+                ("embeddings", digest([model, input, extra_body])),
+                lambda: self._embed_batched(model, input, extra_body),
+            )
+        return await self._embed_batched(model, input, extra_body)
+
+    async def _embed_batched(
+        self, model: str, input: List[Any], extra_body: Dict[str, Any]
+    ) -> List[List[float]]:
+        if self._embedding_coalescer is not None:
+            return await self._embedding_coalescer.embed(model, input, extra_body)
+        return await self._embed(model, input, extra_body)
+
+    async def _embed(
+        self, model: str, input: List[str], extra_body: Dict[str, Any]
+    ) -> List[List[float]]:
+        from openai import BadRequestError
+
         try:
-            response = await self._client.embeddings.create(
-                model=model,
-                input=input,
-                extra_body=extra_body,
+            response = await self._request(
+                lambda client: client.embeddings.create(
+                    model=model,
+                    input=input,
+                    extra_body=extra_body,
+                ),
+                "embeddings",
+                model,
             )
         except BadRequestError as e:
             raise ValueError(f"Failed to get embeddings: {e}") from e
 
-        return EmbeddingsResponse(
-            embeddings=[embedding.embedding for embedding in response.data]
-        )
+        return [embedding.embedding for embedding in response.data]
 
     async def register_model(self, model: Model) -> Model:
-        res = await self.client.models.list()
-        available_models = [m.id async for m in res]
-        # Ramalama handles paths on MacOS and Linux differently
-        if (model.provider_resource_id.split("/")[-1] not in available_models) and (
-            model.provider_resource_id not in available_models
-        ):
+        model_id = model.provider_resource_id
+        # requests name the provider resource id, `model_urls` may not
+        self.catalog.alias(model_id, model.identifier)
+        if not self.catalog.serves(model_id):
+            # the model may have been started since the catalog was refreshed
+            await self.catalog.refresh()
+        routed = self.catalog.route(model_id)
+        if routed and not self.catalog.serves(model_id):
+            raise ValueError(
+                f"Model {model_id} is routed to "
+                f"{', '.join(b.url for b in routed)}, but none of these Ramalama "
+                "servers could be reached."
+            )
+        if routed:
+            served = [m for b in routed for m in self.catalog.served_by(b)]
+            if not any(m.split("/")[-1] == model_id.split("/")[-1] for m in served):
+                # `ramalama serve` runs a single model, whatever it calls it
+                logger.warning(
+                    f"Model {model_id} is routed to servers reporting "
+                    f"{', '.join(served)}, sending its requests there anyway."
+                )
+        elif not self.catalog.serves(model_id):
             raise ValueError(
-                f"Model {model.provider_resource_id} is not being served by Ramalama. "
-                f"Available models: {', '.join(available_models)}"
+                f"Model {model_id} is not being served by Ramalama. "
+                f"Available models: {', '.join(self.catalog.models)}"
             )
+        context_length = (model.metadata or {}).get("context_length")
+        if self._budget is not None and context_length:
+            self._budget.register(model_id, int(context_length))
         return model
 
     async def openai_embeddings(
@@ -238,6 +865,10 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
         suffix: str | None = None,
     ) -> OpenAICompletion:
         model_obj = await self.model_store.get_model(model)
+        from llama_stack.providers.utils.inference.openai_compat import (
+            prepare_openai_completion_params,
+        )
+
         params = await prepare_openai_completion_params(
             model=model_obj.provider_resource_id,
             prompt=prompt,
@@ -258,7 +889,7 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
             user=user,
             suffix=suffix,
         )
-        return await self.client.completions.create(**params)  # type: ignore
+        return await self._create("completion", params)  # type: ignore
 
     async def openai_chat_completion(
         self,
@@ -285,8 +916,12 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
         top_logprobs: Optional[int] = None,
         top_p: Optional[float] = None,
         user: Optional[str] = None,
-    ) -> Union[OpenAIChatCompletion, AsyncIterator[OpenAIChatCompletionChunk]]:
+    ) -> Union[OpenAIChatCompletion, AsyncIterator["OpenAIChatCompletionChunk"]]:
         model_obj = await self.model_store.get_model(model)
+        from llama_stack.providers.utils.inference.openai_compat import (
+            prepare_openai_completion_params,
+        )
+
         params = await prepare_openai_completion_params(
             model=model_obj.provider_resource_id,
             messages=messages,
@@ -312,7 +947,7 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
             top_p=top_p,
             user=user,
         )
-        return await self.client.chat.completions.create(**params)  # type: ignore
+        return await self._create("chat", params)  # type: ignore
 
     async def batch_completion(
         self,
@@ -321,8 +956,58 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
         sampling_params: Optional[SamplingParams] = None,
         response_format: Optional[ResponseFormat] = None,
         logprobs: Optional[LogProbConfig] = None,
-    ):
-        raise NotImplementedError("Batch completion is not supported for Ramalama")
+    ) -> BatchCompletionResponse:
+        if sampling_params is None:
+            sampling_params = SamplingParams()
+        model = await self.model_store.get_model(model_id)
+        requests = [
+            convert_completion_request(
+                request=CompletionRequest(
+                    model=model.provider_resource_id,
+                    content=content,
+                    sampling_params=sampling_params,
+                    response_format=response_format,
+                    stream=False,
+                    logprobs=logprobs,
+                ),
+                grammar_cache=self._grammar_cache,
+            )
+            for content in content_batch
+        ]
+
+        # with deterministic sampling, identical prompts give identical
+        # completions: send each distinct prompt upstream only once
+        positions: Dict[str, int] = {}
+        unique_requests: List[Dict[str, Any]] = []
+        slots: List[int] = []
+        deduplicate = is_deterministic_sampling(sampling_params)
+        for request in requests:
+            key = payload_digest(request) if deduplicate else str(len(slots))
+            if key not in positions:
+                positions[key] = len(unique_requests)
+                unique_requests.append(request)
+            slots.append(positions[key])
+        if len(unique_requests) < len(requests):
+            logger.debug(
+                f"Batch completion: {len(requests) - len(unique_requests)} "
+                f"duplicate prompts out of {len(requests)}"
+            )
+
+        results = await map_bounded(
+            self._completion, unique_requests, await self._batch_concurrency()
+        )
+        batch = []
+        for i, slot in enumerate(slots):
+            result = results[slot]
+            if isinstance(result, Exception):
+                logger.warning(f"Batch completion item {i} failed: {result}")
+                result = CompletionResponse(
+                    content="",
+                    stop_reason=StopReason.end_of_turn,
+                    metrics=_error_metrics(result),
+                )
+            batch.append(result)
+        return BatchCompletionResponse(batch=batch)
 
     async def batch_chat_completion(
         self,
@@ -333,5 +1018,30 @@ class RamalamaInferenceAdapter(Inference, ModelsProtocolPrivate):
         tool_config: Optional[ToolConfig] = None,
         response_format: Optional[ResponseFormat] = None,
         logprobs: Optional[LogProbConfig] = None,
-    ):
-        raise NotImplementedError("Batch chat completion is not supported for Ramalama")
+    ) -> BatchChatCompletionResponse:
+        async def run(messages: List[Message]) -> ChatCompletionResponse:
+            return await self.chat_completion(
+                model_id=model_id,
+                messages=messages,
+                sampling_params=sampling_params,
+                response_format=response_format,
+                tools=tools,
+                tool_config=tool_config,
+                logprobs=logprobs,
+            )
+
+        results = await map_bounded(
+            run, messages_batch, await self._batch_concurrency()
+        )
+        batch = []
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning(f"Batch chat completion item {i} failed: {result}")
+                result = ChatCompletionResponse(
+                    completion_message=CompletionMessage(
+                        content="", stop_reason=StopReason.end_of_turn
+                    ),
+                    metrics=_error_metrics(result),
+                )
+            batch.append(result)
+        return BatchChatCompletionResponse(batch=batch)
@@ -0,0 +1,151 @@
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .hashing import payload_digest
+from .lru import LRUCache
+from .streams import GuardedStream
+
+# fields of a request payload that never change the generated content
+_IGNORED_KEY_FIELDS = ("stream", "stream_options", "user")
+
+
+def response_cache_key(endpoint: str, payload: Dict[str, Any]) -> str:
+    """
+    The cache key of a chat completion or completion request payload.
+    Streaming and non-streaming requests share their key.
+    """
+    return payload_digest(
+        {
+            "endpoint": endpoint,
+            **{k: v for k, v in payload.items() if k not in _IGNORED_KEY_FIELDS},
+        }
+    )
+
+
+class _CachedResponse:
+    def __init__(
+        self, response: Optional[Any] = None, chunks: Optional[List[Any]] = None
+    ) -> None:
+        self.response = response
+        self.chunks = chunks
+
+
+class ResponseCache:
+    """
+    Exact-match cache of upstream chat completion and completion responses,
+    bounded in size and age.
+
+    Only requests whose output is fully determined by their payload may be
+    cached. A streaming request hitting the cache is answered with a
+    replay of the recorded stream, or with a synthetic stream built from a
+    cached non-streaming response.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float]) -> None:
+        self.entries: LRUCache[_CachedResponse] = LRUCache(max_size, ttl)
+
+    def lookup(self, key: str, stream: bool) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if not stream:
+            # a recorded stream is not turned back into a full response
+            return with_new_id(entry.response) if entry.response else None
+        if entry.chunks is not None:
+            return _replay(entry.chunks)
+        return _replay(_response_to_chunks(entry.response))
+
+    def store(self, key: str, response: Any, stream: bool) -> Any:
+        """
+        Remember `response` under `key`. Streams are recorded as they are
+        consumed and only cached once complete, so the returned iterator
+        must be used in place of `response`.
+        """
+        if stream:
+            return self._record(key, response)
+        self.entries.put(key, _CachedResponse(response=response))
+        return response
+
+    def _record(self, key: str, stream: AsyncIterator[Any]) -> GuardedStream:
+        chunks: List[Any] = []
+
+        def done(error: Optional[BaseException]) -> None:
+            if error is None:
+                self.entries.put(key, _CachedResponse(chunks=chunks))
+
+        return GuardedStream(stream, on_chunk=chunks.append, done=done)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.entries.stats()
+
+
+def new_id(old_id: str) -> str:
+    prefix = old_id.split("-", 1)[0] if "-" in old_id else "cmpl"
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+def with_new_id(response: Any) -> Any:
+    # every answer must keep a unique id, the stack stores completions by id
+    return response.model_copy(update={"id": new_id(response.id)})
+
+
+async def _replay(chunks: List[Any]) -> AsyncIterator[Any]:
+    chunk_id = new_id(chunks[0].id) if chunks else None
+    for chunk in chunks:
+        yield chunk.model_copy(update={"id": chunk_id})
+
+
+def _response_to_chunks(response: Any) -> List[Any]:
+    """
+    Build the stream that would have produced a non-streaming response.
+    Completion streams are made of `Completion` objects already, chat
+    completions need their messages turned into deltas.
+    """
+    from openai.types.chat import ChatCompletion
+    from openai.types.chat.chat_completion_chunk import (
+        ChatCompletionChunk,
+        Choice as ChunkChoice,
+        ChoiceDelta,
+        ChoiceDeltaToolCall,
+        ChoiceDeltaToolCallFunction,
+    )
+
+    if not isinstance(response, ChatCompletion):
+        return [response]
+
+    choices = []
+    for choice in response.choices:
+        message = choice.message
+        tool_calls = None
+        if message.tool_calls:
+            tool_calls = [
+                ChoiceDeltaToolCall(
+                    index=i,
+                    id=tool_call.id,
+                    type="function",
+                    function=ChoiceDeltaToolCallFunction(
+                        name=tool_call.function.name,
+                        arguments=tool_call.function.arguments,
+                    ),
+                )
+                for i, tool_call in enumerate(message.tool_calls)
+            ]
+        choices.append(
+            ChunkChoice(
+                index=choice.index,
+                delta=ChoiceDelta(
+                    role="assistant", content=message.content, tool_calls=tool_calls
+                ),
+                finish_reason=choice.finish_reason,
+            )
+        )
+    return [
+        ChatCompletionChunk(
+            id=response.id,
+            choices=choices,
+            created=response.created,
+            model=response.model,
+            object="chat.completion.chunk",
+            usage=response.usage,
+        )
+    ]
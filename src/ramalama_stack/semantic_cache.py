@@ -0,0 +1,152 @@
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .hashing import payload_digest
+from .response_cache import ResponseCache
+
+# fields of a chat completion payload that never change the generated content
+_IGNORED_CONTEXT_FIELDS = ("messages", "stream", "stream_options", "user")
+
+
+def semantic_query(params: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    """
+    Split a chat completion payload into the hash of its context, which
+    must match exactly, and the text of its last user turn, which is
+    matched by meaning. The context is everything else: the system prompt
+    and earlier turns, the tools, the sampling parameters. None if the
+    request cannot be answered from the cache: it does not end with a text
+    user turn, or asks for several choices.
+    """
+    messages = params["messages"]
+    if not messages or (params.get("n") or 1) != 1:
+        return None
+    last = messages[-1]
+    if not isinstance(last, dict) or last.get("role") != "user":
+        return None
+    content = last.get("content")
+    if isinstance(content, list):
+        if any(
+            not isinstance(part, dict) or part.get("type") != "text" for part in content
+        ):
+            # images are not embedded
+            return None
+        content = "\n".join(part["text"] for part in content)
+    if not isinstance(content, str) or not content.strip():
+        return None
+    context = {
+        "history": messages[:-1],
+        **{k: v for k, v in params.items() if k not in _IGNORED_CONTEXT_FIELDS},
+    }
+    # converted requests carry transport fields, like bytes header names
+    return int(payload_digest(context)[:16], 16), content
+
+
+class SemanticCache:
+    """
+    Cache of chat completion responses looked up by the meaning of the
+    last user turn: a request whose context matches a cached one exactly,
+    and whose question is close enough to the cached question by cosine
+    similarity of their embeddings, is answered with the cached response.
+
+    The embeddings of the cached questions are kept normalized in a NumPy
+    matrix, searched in one product per lookup; the least recently used
+    entry is evicted when it is full. Responses are stored, and replayed
+    to streaming requests, like in the response cache.
+    """
+
+    def __init__(
+        self, max_size: int, threshold: float, ttl: Optional[float] = None
+    ) -> None:
+        self.max_size = max_size
+        self.threshold = threshold
+        self.responses = ResponseCache(max_size, ttl)
+        # allocated on the first insert, once the embedding size is known
+        self._vectors: Optional[np.ndarray] = None
+        self._contexts = np.zeros(max_size, dtype=np.uint64)
+        self._last_used = np.zeros(max_size, dtype=np.int64)
+        self._keys: List[Optional[str]] = [None] * max_size
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.embedding_errors = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _touch(self, slot: int) -> None:
+        self._clock += 1
+        self._last_used[slot] = self._clock
+
+    def _search(self, context: int, vector: np.ndarray) -> Optional[int]:
+        if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            return None
+        candidates = np.flatnonzero(
+            (self._contexts == np.uint64(context)) & (self._last_used > 0)
+        )
+        if not candidates.size:
+            return None
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return int(candidates[best])
+
+    def lookup(
+        self, context: int, vector: Sequence[float], stream: bool
+    ) -> Optional[Any]:
+        slot = self._search(context, self._normalize(vector))
+        response = None
+        if slot is not None:
+            # a stream still being recorded, or an expired response, is no answer
+            response = self.responses.lookup(self._keys[slot], stream)
+        if response is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(slot)
+        return response
+
+    def store(
+        self, context: int, vector: Sequence[float], response: Any, stream: bool
+    ) -> Any:
+        """
+        Remember `response` for the question embedded as `vector`. As in
+        the response cache, the returned iterator must be used in place of
+        a streamed `response`.
+        """
+        vector = self._normalize(vector)
+        if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            # a new embedding model makes the stored vectors incomparable
+            self._vectors = np.zeros((self.max_size, vector.shape[0]), np.float32)
+            self._last_used[:] = 0
+            self._keys = [None] * self.max_size
+        # the entry of the same question, whose response is gone, is replaced
+        slot = self._search(context, vector)
+        if slot is None:
+            slot = int(np.argmin(self._last_used))
+            if self._last_used[slot] > 0:
+                self.evictions += 1
+        key = uuid.uuid4().hex
+        self._vectors[slot] = vector
+        self._contexts[slot] = np.uint64(context)
+        self._keys[slot] = key
+        self._touch(slot)
+        return self.responses.store(key, response, stream)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": int(np.count_nonzero(self._last_used)),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "embedding_errors": self.embedding_errors,
+        }
@@ -0,0 +1,164 @@
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .response_cache import new_id, with_new_id
+from .streams import GuardedStream, close_stream
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Future] = None
+        self.subscribers = 0
+        # streams only: the chunks received so far, kept while in flight
+        self.started: Optional[asyncio.Future] = None
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def wake(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    Share one upstream call between the identical requests in flight at
+    the same time. Followers get the leader's response under a new id;
+    streams are fanned out to every subscriber, late ones first catching
+    up on the chunks already received.
+
+    Nothing is kept once the call completes: unlike the response cache,
+    this only deduplicates concurrent work, so it is meant for requests
+    whose output is fully determined by their payload. The upstream call
+    is cancelled once every caller has given up on it.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[_Flight, bool]:
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            return flight, True
+        flight = self._flights[key] = _Flight()
+        self.flights += 1
+        return flight, False
+
+    def _leave(self, key: Hashable, flight: _Flight) -> None:
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.task.done():
+            # nobody waits for the answer anymore
+            flight.task.cancel()
+            self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def call(self, key: Hashable, send: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of `send()`, or of the identical call in flight.
+        """
+        flight, follower = self._join(key)
+        if flight.task is None:
+            flight.task = asyncio.ensure_future(send())
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        flight.subscribers += 1
+        try:
+            response = await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+        if follower and hasattr(response, "id"):
+            return with_new_id(response)
+        return response
+
+    async def stream(
+        self, key: Hashable, send: Callable[[], Awaitable[AsyncIterator[Any]]]
+    ) -> AsyncIterator[Any]:
+        """
+        Return a stream of the chunks of `send()`, or of the identical
+        stream in flight. Errors raised before the stream starts are raised
+        here, like `send()` does.
+        """
+        flight, follower = self._join(key)
+        if flight.task is None:
+            flight.started = asyncio.get_running_loop().create_future()
+            # retrieved here, so a start failure nobody waits for is not logged
+            flight.started.add_done_callback(lambda f: f.cancelled() or f.exception())
+            flight.task = asyncio.ensure_future(self._pump(key, flight, send))
+        flight.subscribers += 1
+        try:
+            await asyncio.shield(flight.started)
+        except BaseException:
+            self._leave(key, flight)
+            raise
+        # leaves the flight even if closed before it is read
+        return GuardedStream(
+            self._subscribe(flight, follower),
+            done=lambda _: self._leave(key, flight),
+        )
+
+    async def _pump(
+        self,
+        key: Hashable,
+        flight: _Flight,
+        send: Callable[[], Awaitable[AsyncIterator[Any]]],
+    ) -> None:
+        stream = None
+        try:
+            stream = await send()
+            flight.started.set_result(None)
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                flight.wake()
+        except Exception as e:
+            if not flight.started.done():
+                flight.started.set_exception(e)
+            flight.error = e
+        finally:
+            if not flight.started.done():
+                flight.started.cancel()
+            self._forget(key, flight)
+            flight.done = True
+            flight.wake()
+            if stream is not None:
+                await close_stream(stream)
+
+    async def _subscribe(self, flight: _Flight, follower: bool) -> AsyncIterator[Any]:
+        chunk_id = None
+        received = 0
+        while True:
+            while received < len(flight.chunks):
+                chunk = flight.chunks[received]
+                received += 1
+                if follower and hasattr(chunk, "id"):
+                    if chunk_id is None:
+                        chunk_id = new_id(chunk.id)
+                    chunk = chunk.model_copy(update={"id": chunk_id})
+                yield chunk
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                return
+            await flight.changed.wait()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
@@ -0,0 +1,80 @@
+from typing import Any, AsyncIterator, Callable, Optional
+
+
+async def close_stream(stream: Any) -> None:
+    """
+    Close an upstream stream, or a wrapper re-yielding one, so that its
+    HTTP response is closed right away. Closing the connection is what
+    makes llama.cpp stop generating for a client that went away; left to
+    the garbage collector, the slot keeps decoding tokens nobody reads.
+
+    Every wrapper of a stream is a `GuardedStream`, which closes what it
+    wraps, so closing the outermost one closes the whole chain.
+    """
+    # async generators have `aclose()`, the OpenAI `AsyncStream` has `close()`
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is not None:
+        await close()
+
+
+class GuardedStream:
+    """
+    Re-yield `stream`, passing every chunk to `on_chunk`, and call `done`
+    exactly once when the stream ends, with the error that ended it: None
+    once exhausted, the exception it failed with, or `GeneratorExit` when
+    the consumer closed it early. `stream` is closed then, along with
+    `upstream` when `stream` is a generator reading from it.
+
+    This is not an async generator on purpose: a generator closed before
+    its first iteration never runs its `finally` block, so a client going
+    away before the first chunk would leave the upstream response open and
+    its request counted as in flight. `aclose()` here always cleans up.
+    """
+
+    def __init__(
+        self,
+        stream: AsyncIterator[Any],
+        on_chunk: Optional[Callable[[Any], None]] = None,
+        done: Optional[Callable[[Optional[BaseException]], None]] = None,
+        upstream: Optional[Any] = None,
+    ) -> None:
+        self._stream = stream
+        self._on_chunk = on_chunk
+        self._done = done
+        self._upstream = upstream
+        self._ended = False
+
+    def __aiter__(self) -> "GuardedStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._ended:
+            raise StopAsyncIteration
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            await self._end(None)
+            raise
+        except BaseException as e:
+            await self._end(e)
+            raise
+        if self._on_chunk is not None:
+            self._on_chunk(chunk)
+        return chunk
+
+    async def aclose(self) -> None:
+        await self._end(GeneratorExit())
+
+    async def _end(self, error: Optional[BaseException]) -> None:
+        if self._ended:
+            return
+        self._ended = True
+        try:
+            try:
+                await close_stream(self._stream)
+            finally:
+                if self._upstream is not None:
+                    await close_stream(self._upstream)
+        finally:
+            if self._done is not None:
+                self._done(error)
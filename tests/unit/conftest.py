@@ -0,0 +1,34 @@
+from typing import Callable, Optional
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from ramalama_stack.backends import Backend, CircuitBreaker
+
+
+@pytest.fixture
+def make_backend() -> Callable[..., Backend]:
+    """
+    Build backends whose client is never used, for tests of the routing
+    and bookkeeping code.
+    """
+
+    def make(
+        url: str = "http://ramalama:8080", breaker: Optional[CircuitBreaker] = None
+    ) -> Backend:
+        return Backend(url, AsyncOpenAI(base_url=url, api_key="NO KEY"), breaker)
+
+    return make
+
+
+@pytest.fixture
+def mock_http_client() -> Callable[..., httpx.AsyncClient]:
+    """
+    Build HTTP clients answered by a handler instead of a server.
+    """
+
+    def make(handler: Callable[[httpx.Request], httpx.Response]) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    return make
@@ -0,0 +1,430 @@
+"""
+The adapter end to end, against the stand-in for `ramalama serve` of
+`benchmarks/stub_server.py` running in a separate process.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+import pytest
+from llama_stack.apis.inference import (
+    SamplingParams,
+    ToolConfig,
+    ToolDefinition,
+    UserMessage,
+)
+from llama_stack.apis.models import Model, ModelType
+
+from ramalama_stack.budget import PromptTooLongError
+from ramalama_stack.config import RamalamaImplConfig
+from ramalama_stack.ramalama_adapter import RamalamaInferenceAdapter
+from stub_server import free_port, start_stub_server
+
+# the stub server generates " tok0 tok1 ..." up to MAX_TOKENS tokens, and
+# counts the words of a prompt as its tokens
+MAX_TOKENS = 4
+CONTEXT_LENGTH = 64
+STUB_OPTIONS = dict(
+    ttft=0,
+    tokens_per_second=10000,
+    max_tokens=MAX_TOKENS,
+    context_length=CONTEXT_LENGTH,
+    embedding_dim=8,
+)
+TEXT = "".join(f" tok{i}" for i in range(MAX_TOKENS))
+
+
+def _model(identifier: str, provider_resource_id: Optional[str] = None) -> Model:
+    return Model(
+        identifier=identifier,
+        provider_resource_id=provider_resource_id or identifier,
+        provider_id="ramalama",
+        model_type=ModelType.llm,
+    )
+
+
+class _ModelStore:
+    def __init__(self, resource_ids: Optional[Dict[str, str]] = None) -> None:
+        # the provider resource ids of models registered under another id
+        self.resource_ids = resource_ids or {}
+
+    async def get_model(self, model_id: str) -> Model:
+        return _model(model_id, self.resource_ids.get(model_id))
+
+
+@pytest.fixture(scope="module")
+def stub_url() -> Iterator[str]:
+    process, url = start_stub_server(**STUB_OPTIONS)
+    try:
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _run(
+    url: str,
+    test: Callable[[RamalamaInferenceAdapter], Awaitable[None]],
+    **config: Any,
+) -> None:
+    async def main() -> None:
+        adapter = RamalamaInferenceAdapter(RamalamaImplConfig(url=url, **config))
+        adapter.model_store = _ModelStore()
+        await adapter.initialize()
+        try:
+            await test(adapter)
+        finally:
+            await adapter.shutdown()
+
+    asyncio.run(main())
+
+
+async def _chat_text(adapter: RamalamaInferenceAdapter, stream: bool) -> str:
+    response = await adapter.chat_completion(
+        "stub", [UserMessage(content="hello")], stream=stream
+    )
+    if not stream:
+        return response.completion_message.content
+    return "".join(
+        [
+            chunk.event.delta.text
+            async for chunk in response
+            if getattr(chunk.event.delta, "text", None)
+        ]
+    )
+
+
+def test_shutdown_after_failed_initialize(stub_url: str) -> None:
+    async def main() -> None:
+        await RamalamaInferenceAdapter(RamalamaImplConfig(url=stub_url)).shutdown()
+
+        # the health prober and the catalog run by the time the metrics
+        # server fails to bind the port the stub server listens on
+        port = int(stub_url.rsplit(":", 1)[1])
+        adapter = RamalamaInferenceAdapter(
+            RamalamaImplConfig(url=stub_url, health_check_interval=1, metrics_port=port)
+        )
+        with pytest.raises(OSError):
+            await adapter.initialize()
+        await adapter.shutdown()
+        assert adapter._health._task is None
+        assert adapter.catalog._task is None
+        assert all(client.is_closed for client in adapter._http_clients)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_chat_completion(stub_url: str, stream: bool) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        assert await _chat_text(adapter, stream) == TEXT
+        [backend] = adapter.get_stats()["backends"]
+        assert (backend["requests"], backend["errors"]) == (1, 0)
+
+    _run(stub_url, test)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_completion(stub_url: str, stream: bool) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        response = await adapter.completion("stub", "hello", stream=stream)
+        if stream:
+            text = "".join([chunk.delta async for chunk in response])
+        else:
+            text = response.content
+        assert text == TEXT
+
+    _run(stub_url, test)
+
+
+def test_embeddings(stub_url: str) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        response = await adapter.embeddings("stub", ["a", "b", "a"])
+        a, b, again = response.embeddings
+        assert len(a) == 8
+        assert a == again
+        assert a != b
+
+    _run(stub_url, test)
+
+
+def test_openai_chat_completion(stub_url: str) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        response = await adapter.openai_chat_completion(
+            "stub", [{"role": "user", "content": "hello"}], max_completion_tokens=2
+        )
+        assert response.choices[0].message.content == " tok0 tok1"
+
+    _run(stub_url, test)
+
+
+def test_server_started_after_the_adapter() -> None:
+    port = free_port()
+    process = None
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        nonlocal process
+        process, _ = await asyncio.to_thread(
+            start_stub_server, port=port, **STUB_OPTIONS
+        )
+        # a server down at startup is tried right away once it is up
+        assert await _chat_text(adapter, stream=False) == TEXT
+
+    try:
+        _run(f"http://127.0.0.1:{port}", test)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+@pytest.mark.parametrize("tool_cache_size", [0, 8])
+def test_tool_cache(stub_url: str, tool_cache_size: int) -> None:
+    tools = [ToolDefinition(tool_name="clock", description="Tell the time.")]
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        for _ in range(2):
+            response = await adapter.chat_completion(
+                "stub",
+                [UserMessage(content="hello")],
+                tools=tools,
+                # filled in by the inference router of the stack
+                tool_config=ToolConfig(),
+            )
+            assert response.completion_message.content == TEXT
+        stats = adapter.get_stats()
+        if tool_cache_size:
+            assert stats["tool_cache"]["hits"] == 1
+        else:
+            assert "tool_cache" not in stats
+            assert adapter._tool_cache is None
+
+    _run(stub_url, test, tool_cache_size=tool_cache_size)
+
+
+def test_failed_batch_items_report_their_error(stub_url: str) -> None:
+    too_long = " ".join(["word"] * CONTEXT_LENGTH)
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        response = await adapter.batch_chat_completion(
+            "stub",
+            [[UserMessage(content="hello")], [UserMessage(content=too_long)]],
+        )
+        ok, failed = response.batch
+        assert ok.completion_message.content == TEXT
+        assert failed.completion_message.content == ""
+        [metric] = failed.metrics
+        assert metric.metric == "error"
+        assert "exceeds the available context size" in metric.unit
+
+    _run(stub_url, test)
+
+
+def test_context_budget(stub_url: str) -> None:
+    # 58 words and the chat template overhead leave 1 token of context
+    prompt = " ".join(["word"] * 58)
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        response = await adapter.openai_chat_completion(
+            "stub", [{"role": "user", "content": prompt}], max_completion_tokens=40
+        )
+        assert response.usage.completion_tokens == 1
+
+        response = await adapter.chat_completion(
+            "stub",
+            [UserMessage(content=prompt)],
+            sampling_params=SamplingParams(max_tokens=40),
+        )
+        assert response.completion_message.content == " tok0"
+
+        with pytest.raises(PromptTooLongError):
+            await adapter.chat_completion(
+                "stub", [UserMessage(content=prompt + " " + prompt)]
+            )
+        stats = adapter.get_stats()["context_budget"]
+        assert (stats["clamped"], stats["rejected"]) == (2, 1)
+        [backend] = adapter.get_stats()["backends"]
+        assert backend["requests"] == 2
+
+    _run(stub_url, test, context_budget=True)
+
+
+def test_identical_requests_in_flight_are_sent_once(stub_url: str) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        texts = await asyncio.gather(
+            _chat_text(adapter, stream=False),
+            _chat_text(adapter, stream=False),
+            _chat_text(adapter, stream=True),
+            _chat_text(adapter, stream=True),
+        )
+        assert texts == [TEXT] * 4
+        [backend] = adapter.get_stats()["backends"]
+        assert backend["requests"] == 2
+        assert adapter.get_stats()["single_flight"]["coalesced"] == 2
+
+    _run(stub_url, test, single_flight=True)
+
+
+@pytest.mark.parametrize(
+    "config",
+    [{}, {"response_cache_size": 8}, {"single_flight": True}],
+    ids=["plain", "response_cache", "single_flight"],
+)
+@pytest.mark.parametrize("read", [0, 1], ids=["unread", "after_start"])
+def test_abandoned_streams_release_their_request(
+    stub_url: str, config: Dict[str, Any], read: int
+) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        for _ in range(3):
+            response = await adapter.chat_completion(
+                "stub", [UserMessage(content="hello")], stream=True
+            )
+            # the first chunk is the `start` event, sent before any token
+            for _ in range(read):
+                await response.__anext__()
+            await response.aclose()
+        # a shared upstream stream is closed by the task reading it
+        await asyncio.sleep(0.1)
+
+        stats = adapter.get_stats()
+        [backend] = stats["backends"]
+        assert backend["in_flight"] == 0
+        assert stats["admission"]["in_flight"] == 0
+        assert not any(adapter.metrics.in_flight.values.values())
+        assert stats["cancellation"]["streams_cancelled"] == 3
+        # the two places of the limit are free again
+        assert await asyncio.wait_for(_chat_text(adapter, stream=True), 5) == TEXT
+
+    _run(stub_url, test, max_concurrency=2, queue_timeout=1, **config)
+
+
+def test_queued_requests_are_exported(stub_url: str) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        stream = await adapter.chat_completion(
+            "stub", [UserMessage(content="hello")], stream=True
+        )
+        waiting = asyncio.ensure_future(_chat_text(adapter, stream=False))
+        await asyncio.sleep(0.1)
+        assert "ramalama_admission_queued 1" in adapter.render_metrics().splitlines()
+
+        await stream.aclose()
+        assert await waiting == TEXT
+        assert "ramalama_admission_queued 0" in adapter.render_metrics().splitlines()
+
+    _run(stub_url, test, max_concurrency=1, queue_timeout=5)
+
+
+def test_semantic_cache(stub_url: str) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        for stream in (False, False, True):
+            assert await _chat_text(adapter, stream) == TEXT
+        stats = adapter.get_stats()
+        assert stats["semantic_cache"]["hits"] == 2
+        assert stats["semantic_cache"]["embedding_errors"] == 0
+        [backend] = stats["backends"]
+        # one chat completion, and the embedding of every question
+        assert backend["requests"] == 4
+
+    _run(stub_url, test, semantic_cache_size=8, semantic_cache_model="stub")
+
+
+def test_unknown_model_is_rejected(stub_url: str) -> None:
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        refreshes = []
+        refresh = adapter.catalog.refresh
+
+        async def counted_refresh() -> None:
+            refreshes.append(True)
+            await refresh()
+
+        adapter.catalog.refresh = counted_refresh
+        await adapter.register_model(_model("stub"))
+        # Ramalama reports model paths differently across platforms
+        await adapter.register_model(_model("/models/stub"))
+        assert refreshes == []
+
+        # the catalog is refreshed first, the model may have just started
+        with pytest.raises(ValueError, match="Available models: stub"):
+            await adapter.register_model(_model("granite"))
+        assert refreshes == [True]
+
+    _run(stub_url, test)
+
+
+@pytest.mark.parametrize("routed_by", ["identifier", "provider_resource_id"])
+def test_routed_model_is_registered(stub_url: str, routed_by: str) -> None:
+    model = _model("assistant", "stub")
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        adapter.model_store = _ModelStore({"assistant": "stub"})
+        await adapter.register_model(model)
+        response = await adapter.chat_completion(
+            "assistant", [UserMessage(content="hello")]
+        )
+        assert response.completion_message.content == TEXT
+
+    # a routed server only serves its routed models
+    _run(stub_url, test, model_urls={getattr(model, routed_by): stub_url})
+
+
+def test_routed_model_on_an_unreachable_server_is_rejected(stub_url: str) -> None:
+    dead_url = f"http://127.0.0.1:{free_port()}"
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        with pytest.raises(ValueError, match="could be reached"):
+            await adapter.register_model(_model("assistant", "stub"))
+
+    _run(stub_url, test, model_urls={"assistant": dead_url})
+
+
+def test_dead_replica_fails_over_without_delay(stub_url: str) -> None:
+    process, dying_url = start_stub_server(**STUB_OPTIONS)
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        process.terminate()
+        await asyncio.to_thread(process.wait)
+        for _ in range(4):
+            started = time.monotonic()
+            assert await _chat_text(adapter, stream=False) == TEXT
+            # the client does not retry the dead replica before failing over
+            assert time.monotonic() - started < 0.5
+        stats = {b["url"]: b for b in adapter.get_stats()["backends"]}
+        assert stats[dying_url]["errors"] > 0
+        assert stats[stub_url]["requests"] == 4
+
+    try:
+        _run(
+            stub_url,
+            test,
+            urls=[stub_url, dying_url],
+            # keep the dead replica in rotation, to go through it every time
+            circuit_failure_threshold=100,
+        )
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_dead_replica_does_not_slow_startup(stub_url: str) -> None:
+    dead_url = f"http://127.0.0.1:{free_port()}"
+
+    async def test(adapter: RamalamaInferenceAdapter) -> None:
+        assert await _chat_text(adapter, stream=False) == TEXT
+
+    started = time.monotonic()
+    _run(stub_url, test, urls=[stub_url, dead_url])
+    assert time.monotonic() - started < 1
+
+
+def test_import_does_not_load_the_openai_client() -> None:
+    check = (
+        "import sys, ramalama_stack.ramalama_adapter\n"
+        "assert 'openai' not in sys.modules"
+    )
+    # the provider as imported by this interpreter
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    subprocess.run([sys.executable, "-c", check], check=True, env=env)
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from llama_stack.distribution.server.server import translate_exception
+
+from ramalama_stack.admission import AdaptiveLimiter, OverloadedError
+
+
+def _limiter(**options) -> AdaptiveLimiter:
+    defaults = dict(
+        min_limit=1,
+        max_limit=8,
+        initial_limit=2,
+        max_queue_size=2,
+        queue_timeout=1.0,
+        tolerance=2.0,
+    )
+    return AdaptiveLimiter(**{**defaults, **options})
+
+
+def test_admits_up_to_the_limit_then_queues() -> None:
+    async def main() -> None:
+        limiter = _limiter()
+        first = await limiter.acquire()
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        assert limiter.stats()["queued"] == 1
+
+        limiter.release(first, "chat")
+        await asyncio.wait_for(waiting, 1)
+        assert limiter.stats()["in_flight"] == 2
+
+    asyncio.run(main())
+
+
+def test_rejects_when_the_queue_is_full() -> None:
+    async def main() -> None:
+        limiter = _limiter(initial_limit=1, max_queue_size=1)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        assert limiter.stats()["rejected"] == 1
+        waiting.cancel()
+
+    asyncio.run(main())
+
+
+def test_rejects_after_the_queue_timeout() -> None:
+    async def main() -> None:
+        limiter = _limiter(initial_limit=1, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        assert limiter.stats()["queued"] == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue() -> None:
+    async def main() -> None:
+        limiter = _limiter(initial_limit=1)
+        started = await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 0
+        limiter.release(started, "chat")
+        assert limiter.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_limit_grows_with_fast_requests_and_backs_off_on_slow_ones() -> None:
+    async def main() -> None:
+        limiter = _limiter(initial_limit=2)
+        for _ in range(10):
+            first = await limiter.acquire()
+            second = await limiter.acquire()
+            limiter.release(first, "chat", 0.1)
+            limiter.release(second, "chat", 0.1)
+        grown = limiter.limit
+        assert grown > 2
+
+        started = await limiter.acquire()
+        limiter.release(started, "chat", 10.0)
+        assert limiter.limit == pytest.approx(grown * limiter.backoff)
+        assert limiter.stats()["decreases"] == 1
+
+    asyncio.run(main())
+
+
+def test_requests_sent_before_a_decrease_do_not_decrease_again() -> None:
+    async def main() -> None:
+        limiter = _limiter(initial_limit=4)
+        first = await limiter.acquire()
+        second = await limiter.acquire()
+        limiter.release(first, "chat", congested=True)
+        limiter.release(second, "chat", congested=True)
+        assert limiter.stats()["decreases"] == 1
+
+    asyncio.run(main())
+
+
+def test_stream_keeps_its_place_until_closed() -> None:
+    async def main() -> None:
+        limiter = _limiter()
+
+        async def stream():
+            yield 1
+            yield 2
+
+        started = await limiter.acquire()
+        wrapped = limiter.release_after_stream(stream(), started, "chat", 0.1)
+        assert await wrapped.__anext__() == 1
+        assert limiter.stats()["in_flight"] == 1
+        await wrapped.aclose()
+        assert limiter.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_overloaded_is_not_a_server_fault() -> None:
+    # clients are told to come back later rather than of an internal error
+    assert translate_exception(OverloadedError("busy")).status_code == 504
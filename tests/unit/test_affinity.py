@@ -0,0 +1,109 @@
+from typing import Any, Callable, Dict, List
+
+from ramalama_stack.affinity import PrefixAffinity, prefix_fingerprint, with_slot
+from ramalama_stack.backends import Backend, BackendPool
+
+
+def _chat(first: str, *turns: str, system: str = "Be brief.") -> Dict[str, Any]:
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": first},
+    ]
+    for i, turn in enumerate(turns):
+        messages.append({"role": "assistant", "content": f"answer {i}"})
+        messages.append({"role": "user", "content": turn})
+    return {"model": "m", "messages": messages}
+
+
+def _backends(
+    make_backend: Callable[..., Backend], count: int, slots: int = 2
+) -> List[Backend]:
+    backends = [make_backend(f"http://ramalama-{i}:8080") for i in range(count)]
+    for backend in backends:
+        backend.slots = slots
+    return backends
+
+
+def test_turns_of_a_conversation_share_their_fingerprint() -> None:
+    fingerprint = prefix_fingerprint(_chat("Hi"))
+    assert prefix_fingerprint(_chat("Hi", "And then?", "Why?")) == fingerprint
+    assert prefix_fingerprint(_chat("Hello")) != fingerprint
+    assert prefix_fingerprint(_chat("Hi", system="Be verbose.")) != fingerprint
+    assert prefix_fingerprint({**_chat("Hi"), "model": "n"}) != fingerprint
+    assert prefix_fingerprint({**_chat("Hi"), "tools": [{"type": "x"}]}) != fingerprint
+    assert prefix_fingerprint({"model": "m", "messages": []}) is None
+
+
+def test_conversation_sticks_to_its_backend_and_slot(make_backend) -> None:
+    backends = _backends(make_backend, 2)
+    affinity = PrefixAffinity(BackendPool(backends), max_size=8)
+
+    backend, slot = affinity.route(_chat("Hi"))
+    assert slot == 0
+    for turn in ("And then?", "Why?"):
+        assert affinity.route(_chat("Hi", turn)) == (backend, slot)
+    assert affinity.route({"model": "m", "messages": []}) == (None, None)
+
+
+def test_new_conversations_spread_over_slots(make_backend) -> None:
+    [backend] = _backends(make_backend, 1, slots=2)
+    affinity = PrefixAffinity(BackendPool([backend]), max_size=8)
+    slots = [affinity.route(_chat(f"question {i}"))[1] for i in range(3)]
+    assert slots == [0, 1, 0]
+
+
+def test_busy_slot_is_not_pinned(make_backend) -> None:
+    backends = _backends(make_backend, 1)
+    pool = BackendPool(backends)
+    affinity = PrefixAffinity(pool, max_size=8)
+    backend, slot = affinity.route(_chat("Hi"))
+    pool.acquire(backend, slot=slot)
+
+    # the same conversation, sent again before the first request ended
+    assert affinity.route(_chat("Hi", "And then?")) == (backend, None)
+    pool.release(backend, slot=slot)
+    assert affinity.route(_chat("Hi", "And then?")) == (backend, slot)
+
+
+def test_conversation_moves_off_a_full_backend(make_backend) -> None:
+    first, second = _backends(make_backend, 2, slots=1)
+    pool = BackendPool([first, second])
+    affinity = PrefixAffinity(pool, max_size=8)
+    backend, _ = affinity.route(_chat("Hi"))
+    other = second if backend is first else first
+
+    pool.acquire(backend)
+    assert affinity.route(_chat("Hi", "And then?"))[0] is other
+    assert affinity.stats()["reroutes"] == 1
+
+    # stays put when every backend is full
+    pool.acquire(other)
+    assert affinity.route(_chat("Hi", "Why?"))[0] is other
+    assert affinity.stats()["reroutes"] == 1
+
+
+def test_least_recently_used_conversation_is_forgotten(make_backend) -> None:
+    [backend] = _backends(make_backend, 1, slots=4)
+    affinity = PrefixAffinity(BackendPool([backend]), max_size=2)
+    assert affinity.route(_chat("a"))[1] == 0
+    assert affinity.route(_chat("b"))[1] == 1
+    assert affinity.route(_chat("a", "more"))[1] == 0
+    assert affinity.route(_chat("c"))[1] == 2
+
+    # "b" was evicted, and is given the next slot as a new conversation
+    assert affinity.route(_chat("b", "more"))[1] == 3
+    assert affinity.route(_chat("c", "more"))[1] == 2
+    stats = affinity.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 2
+
+
+def test_with_slot() -> None:
+    payload = {"model": "m", "extra_body": {"n_probs": 2}}
+    assert with_slot(payload, 3)["extra_body"] == {
+        "n_probs": 2,
+        "cache_prompt": True,
+        "id_slot": 3,
+    }
+    assert with_slot({"model": "m"}, None)["extra_body"] == {"cache_prompt": True}
+    assert payload["extra_body"] == {"n_probs": 2}
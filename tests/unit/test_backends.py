@@ -0,0 +1,169 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import APIConnectionError, BadRequestError, InternalServerError
+
+from ramalama_stack.backends import (
+    BackendPool,
+    BackendUnavailableError,
+    CircuitBreaker,
+    is_backend_failure,
+)
+from ramalama_stack.health import HealthProber
+
+_REQUEST = httpx.Request("POST", "http://ramalama:8080/chat/completions")
+
+
+def _status_error(cls, status: int):
+    return cls("error", response=httpx.Response(status, request=_REQUEST), body=None)
+
+
+def test_backend_failures() -> None:
+    assert is_backend_failure(_status_error(InternalServerError, 500))
+    assert is_backend_failure(APIConnectionError(request=_REQUEST))
+    assert not is_backend_failure(_status_error(BadRequestError, 400))
+
+
+def test_breaker_opens_after_consecutive_failures() -> None:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    assert breaker.try_acquire()
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.available
+    assert not breaker.try_acquire()
+
+
+def test_breaker_lets_a_single_probe_through(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("ramalama_stack.backends.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.try_acquire()
+
+    now[0] += 31
+    assert breaker.try_acquire()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.try_acquire()
+
+    # a failed probe keeps it open for another reset timeout
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert not breaker.try_acquire()
+    now[0] += 31
+    assert breaker.try_acquire()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+
+
+def test_cancelled_probe_frees_the_probe(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("ramalama_stack.backends.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    now[0] += 31
+    assert breaker.try_acquire()
+    breaker.record_cancel()
+    assert breaker.try_acquire()
+
+
+def test_health_probe_does_not_wait_for_the_reset_timeout() -> None:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.trip()
+    assert breaker.try_probe()
+    assert not breaker.try_probe()
+    assert not breaker.try_acquire()
+    breaker.record_success()
+    assert breaker.try_acquire()
+
+
+def test_pool_picks_the_least_loaded_backend(make_backend) -> None:
+    a, b = make_backend("http://a"), make_backend("http://b")
+    pool = BackendPool([a, b])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first, second} == {a, b}
+    pool.release(first)
+    assert pool.acquire() is first
+
+
+def test_pool_skips_open_breakers(make_backend) -> None:
+    a, b = make_backend("http://a"), make_backend("http://b")
+    a.breaker.trip()
+    pool = BackendPool([a, b])
+    assert all(pool.select() is b for _ in range(4))
+    b.breaker.trip()
+    with pytest.raises(BackendUnavailableError):
+        pool.select()
+
+
+def test_pool_avoids_excluded_backends_unless_nothing_is_left(make_backend) -> None:
+    a, b = make_backend("http://a"), make_backend("http://b")
+    pool = BackendPool([a, b])
+    assert pool.select(exclude=[a]) is b
+    b.breaker.trip()
+    assert pool.select(exclude=[a]) is a
+
+
+def test_acquire_honours_a_claimed_probe(make_backend, monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("ramalama_stack.backends.time.monotonic", lambda: now[0])
+    backend = make_backend(breaker=CircuitBreaker(1, 30))
+    pool = BackendPool([backend])
+    backend.breaker.trip()
+    now[0] += 31
+    assert pool.acquire() is backend
+    # only one request probes a half-open breaker
+    with pytest.raises(BackendUnavailableError):
+        pool.acquire(backend)
+    with pytest.raises(BackendUnavailableError):
+        pool.acquire()
+    assert backend.in_flight == 1
+
+
+def test_pool_counts_slots_and_errors(make_backend) -> None:
+    backend = make_backend()
+    pool = BackendPool([backend])
+    pool.acquire(slot=2)
+    assert backend.busy_slots == {2}
+    pool.release(backend, failed=True, slot=2)
+    assert backend.busy_slots == set()
+    assert backend.stats()["error_rate"] == 1.0
+
+
+def _prober(make_backend, mock_http_client, healthy):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200 if healthy[0] else 503)
+
+    backend = make_backend(breaker=CircuitBreaker(1, 30))
+    pool = BackendPool([backend])
+    return backend, HealthProber(pool, mock_http_client(handler), interval=None)
+
+
+def test_startup_check_keeps_loading_servers_in_rotation(
+    make_backend, mock_http_client
+) -> None:
+    healthy = [False]
+    backend, prober = _prober(make_backend, mock_http_client, healthy)
+    asyncio.run(prober.check_all())
+    assert backend.breaker.state == backend.breaker.CLOSED
+    assert backend.breaker.available
+
+
+def test_probe_takes_servers_out_and_puts_them_back(
+    make_backend, mock_http_client
+) -> None:
+    healthy = [False]
+    backend, prober = _prober(make_backend, mock_http_client, healthy)
+    asyncio.run(prober.probe())
+    assert backend.breaker.state == backend.breaker.OPEN
+
+    # back at the next probe, without waiting for the reset timeout
+    healthy[0] = True
+    asyncio.run(prober.probe())
+    assert backend.breaker.state == backend.breaker.CLOSED
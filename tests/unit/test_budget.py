@@ -0,0 +1,105 @@
+import asyncio
+import json
+from typing import List
+
+import httpx
+import pytest
+
+from ramalama_stack.budget import (
+    MESSAGE_OVERHEAD,
+    ContextBudget,
+    PromptTooLongError,
+    TokenCounter,
+)
+
+CONTEXT_LENGTH = 100
+
+
+@pytest.fixture
+def budget(mock_http_client, make_backend):
+    tokenized: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/props":
+            return httpx.Response(
+                200,
+                json={
+                    "total_slots": 1,
+                    "default_generation_settings": {"n_ctx": CONTEXT_LENGTH},
+                },
+            )
+        if request.url.path == "/tokenize":
+            content = json.loads(request.content)["content"]
+            tokenized.append(content)
+            # one token per word
+            return httpx.Response(200, json={"tokens": content.split()})
+        return httpx.Response(404)
+
+    budget = ContextBudget(TokenCounter(mock_http_client(handler), 16))
+    budget.tokenized = tokenized
+    budget.backends = [make_backend()]
+    return budget
+
+
+def _chat(words: int, **params) -> dict:
+    return {
+        "model": "m",
+        "messages": [{"role": "user", "content": " ".join(["word"] * words)}],
+        **params,
+    }
+
+
+def _fit(budget: ContextBudget, params: dict):
+    return asyncio.run(budget.fit("chat", params, budget.backends))
+
+
+def test_short_prompts_are_not_counted(budget) -> None:
+    params = _chat(3, max_tokens=10)
+    assert _fit(budget, params) == (params, None)
+    assert budget.tokenized == []
+    assert budget.stats()["skipped"] == 1
+
+
+def test_max_tokens_is_lowered_to_the_room_left(budget) -> None:
+    params, prompt_tokens = _fit(budget, _chat(40, max_tokens=90))
+    assert prompt_tokens == 40 + MESSAGE_OVERHEAD
+    assert params["max_tokens"] == CONTEXT_LENGTH - prompt_tokens
+    assert budget.stats()["clamped"] == 1
+
+
+def test_max_completion_tokens_is_lowered_to_the_room_left(budget) -> None:
+    params, prompt_tokens = _fit(budget, _chat(40, max_completion_tokens=90))
+    assert params["max_completion_tokens"] == CONTEXT_LENGTH - prompt_tokens
+    assert "max_tokens" not in params
+
+
+def test_fitting_max_completion_tokens_is_kept(budget) -> None:
+    params, prompt_tokens = _fit(budget, _chat(40, max_completion_tokens=30))
+    assert params["max_completion_tokens"] == 30
+    assert prompt_tokens == 40 + MESSAGE_OVERHEAD
+
+
+def test_prompts_that_do_not_fit_are_rejected(budget) -> None:
+    with pytest.raises(PromptTooLongError):
+        _fit(budget, _chat(CONTEXT_LENGTH))
+    assert budget.stats()["rejected"] == 1
+
+
+def test_token_counts_are_cached(budget) -> None:
+    _fit(budget, _chat(40, max_tokens=90))
+    _fit(budget, _chat(40, max_tokens=90))
+    assert len(budget.tokenized) == 1
+    assert budget.stats()["token_counts"]["tokenize_requests"] == 1
+
+
+def test_metadata_context_length_wins_when_smaller(budget) -> None:
+    budget.register("m", 50)
+    with pytest.raises(PromptTooLongError):
+        _fit(budget, _chat(60))
+
+
+def test_embeddings_inputs_that_do_not_fit_are_rejected(budget) -> None:
+    long_input = " ".join(["word"] * (CONTEXT_LENGTH + 1))
+    with pytest.raises(PromptTooLongError):
+        asyncio.run(budget.check_inputs("m", [long_input], budget.backends))
+    asyncio.run(budget.check_inputs("m", ["short"], budget.backends))
@@ -0,0 +1,154 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from ramalama_stack.backends import Backend, BackendPool
+from ramalama_stack.catalog import ModelCatalog
+
+
+class _Servers:
+    """
+    Answers `/models` with the models listed for each server, or with a
+    connection error for servers listing None.
+    """
+
+    def __init__(self, models: Dict[str, Optional[List[str]]]) -> None:
+        self.models = models
+        self.listed = 0
+
+    def backend(self, url: str) -> Backend:
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(self._handle))
+        client = AsyncOpenAI(
+            base_url=url, api_key="NO KEY", http_client=http_client, max_retries=0
+        )
+        return Backend(url, client)
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.listed += 1
+        url = str(request.url).removesuffix("/models")
+        if self.models[url] is None:
+            raise httpx.ConnectError("refused", request=request)
+        data = [{"id": m, "object": "model", "owned_by": "r"} for m in self.models[url]]
+        return httpx.Response(200, json={"object": "list", "data": data})
+
+
+def _catalog(
+    servers: _Servers, routes: Optional[Dict[str, List[str]]] = None, ttl: float = 60
+) -> ModelCatalog:
+    backends = {url: servers.backend(url) for url in servers.models}
+    return ModelCatalog(
+        BackendPool(list(backends.values())),
+        ttl,
+        {
+            model: [backends[url] for url in urls]
+            for model, urls in (routes or {}).items()
+        },
+    )
+
+
+def _urls(backends: List[Backend]) -> List[str]:
+    return [backend.url for backend in backends]
+
+
+def test_models_are_found_by_id_and_basename() -> None:
+    async def main() -> None:
+        servers = _Servers(
+            {"http://a": ["/models/llama3.2:3b"], "http://b": ["llama3.2:3b", "bge"]}
+        )
+        catalog = _catalog(servers)
+        assert not catalog.serves("llama3.2:3b")
+        await catalog.refresh()
+
+        assert catalog.models == ["/models/llama3.2:3b", "llama3.2:3b", "bge"]
+        assert _urls(catalog.lookup("/models/llama3.2:3b")) == ["http://a"]
+        assert _urls(catalog.lookup("llama3.2:3b")) == ["http://a", "http://b"]
+        assert _urls(catalog.lookup("/other/path/bge")) == ["http://b"]
+        assert catalog.lookup("granite") == []
+        assert not catalog.serves("granite")
+
+    asyncio.run(main())
+
+
+def test_unreachable_server_keeps_its_last_listing() -> None:
+    async def main() -> None:
+        servers = _Servers({"http://a": ["llama3.2:3b"]})
+        catalog = _catalog(servers)
+        await catalog.refresh()
+        servers.models["http://a"] = None
+        await catalog.refresh()
+        assert catalog.serves("llama3.2:3b")
+
+        servers.models["http://a"] = ["granite"]
+        await catalog.refresh()
+        assert not catalog.serves("llama3.2:3b")
+        assert catalog.served_by(catalog.pool.backends[0]) == ["granite"]
+
+    asyncio.run(main())
+
+
+def test_catalog_is_refreshed_every_ttl() -> None:
+    async def main() -> None:
+        servers = _Servers({"http://a": ["llama3.2:3b"]})
+        catalog = _catalog(servers, ttl=0.01)
+        catalog.start()
+        try:
+            servers.models["http://a"] = ["granite"]
+            await asyncio.sleep(0.1)
+            assert catalog.serves("granite")
+        finally:
+            await catalog.stop()
+        listed = servers.listed
+        await asyncio.sleep(0.05)
+        assert servers.listed == listed
+
+    asyncio.run(main())
+
+
+def test_routed_models_are_served_by_their_route_only() -> None:
+    async def main() -> None:
+        servers = _Servers(
+            {
+                "http://a": ["/models/llama3.2:3b"],
+                "http://b": ["llama3.2:3b", "bge"],
+                "http://c": ["bge"],
+                "http://dead": None,
+            }
+        )
+        catalog = _catalog(
+            servers,
+            {
+                "llama3.2:3b": ["http://a"],
+                "guard": ["http://c"],
+                "gone": ["http://dead"],
+            },
+        )
+        await catalog.refresh()
+
+        assert _urls(catalog.lookup("llama3.2:3b")) == ["http://a"]
+        assert _urls(catalog.lookup("/models/llama3.2:3b")) == ["http://a"]
+        # served by a reachable server of its route, whatever it lists
+        assert _urls(catalog.lookup("guard")) == ["http://c"]
+        assert catalog.serves("guard")
+        assert not catalog.serves("gone")
+        # the routed servers are not used for other models
+        assert _urls(catalog.lookup("bge")) == ["http://b"]
+
+    asyncio.run(main())
+
+
+def test_alias_routes_by_registered_id() -> None:
+    async def main() -> None:
+        servers = _Servers({"http://a": ["llama3.2:3b"], "http://b": ["llama3.2:3b"]})
+        catalog = _catalog(servers, {"assistant": ["http://b"]})
+        await catalog.refresh()
+        assert _urls(catalog.lookup("llama3.2:3b")) == ["http://a"]
+
+        catalog.alias("llama3.2:3b", "assistant")
+        assert _urls(catalog.lookup("llama3.2:3b")) == ["http://b"]
+        # nothing to follow for an identifier without a route
+        catalog.alias("bge", "embedder")
+        assert catalog.route("bge") is None
+
+    asyncio.run(main())
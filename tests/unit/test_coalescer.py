@@ -0,0 +1,138 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+import pytest
+
+from ramalama_stack.coalescer import EmbeddingCoalescer
+
+
+class _FakeEmbedder:
+    """
+    Embeds every text as `[len(text)]`, recording the upstream requests,
+    and fails those containing "bad", or every request with `error`.
+    """
+
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.calls: List[Tuple[str, List[str], Dict[str, Any]]] = []
+        self.error = error
+
+    async def __call__(
+        self, model: str, inputs: List[str], extra_body: Dict[str, Any]
+    ) -> List[List[float]]:
+        self.calls.append((model, inputs, extra_body))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        if "bad" in inputs:
+            raise ValueError("bad input")
+        return [[float(len(text))] for text in inputs]
+
+
+def _status_error(status: int) -> openai.APIStatusError:
+    request = httpx.Request("POST", "http://localhost/v1/embeddings")
+    response = httpx.Response(status, request=request)
+    return openai.APIStatusError("failed", response=response, body=None)
+
+
+def test_concurrent_requests_share_one_upstream_call() -> None:
+    async def main() -> None:
+        embedder = _FakeEmbedder()
+        coalescer = EmbeddingCoalescer(embedder, window=0.01, max_batch_size=64)
+        results = await asyncio.gather(
+            coalescer.embed("m", ["a"], {}),
+            coalescer.embed("m", ["bb", "ccc"], {}),
+        )
+        assert results == [[[1.0]], [[2.0], [3.0]]]
+        assert embedder.calls == [("m", ["a", "bb", "ccc"], {})]
+        stats = coalescer.stats()
+        assert stats["batches"] == 1
+        assert stats["requests"] == 2
+        assert stats["max_batch_inputs"] == 3
+
+    asyncio.run(main())
+
+
+def test_models_and_options_are_batched_apart() -> None:
+    async def main() -> None:
+        embedder = _FakeEmbedder()
+        coalescer = EmbeddingCoalescer(embedder, window=0.01, max_batch_size=64)
+        await asyncio.gather(
+            coalescer.embed("m", ["a"], {}),
+            coalescer.embed("n", ["a"], {}),
+            coalescer.embed("m", ["a"], {"dimensions": 8}),
+        )
+        assert len(embedder.calls) == 3
+
+    asyncio.run(main())
+
+
+def test_full_batch_is_sent_without_waiting() -> None:
+    async def main() -> None:
+        embedder = _FakeEmbedder()
+        coalescer = EmbeddingCoalescer(embedder, window=60, max_batch_size=2)
+        result = await asyncio.wait_for(coalescer.embed("m", ["a", "b"], {}), 1)
+        assert result == [[1.0], [1.0]]
+
+    asyncio.run(main())
+
+
+def test_failed_batch_is_retried_per_request() -> None:
+    async def main() -> None:
+        embedder = _FakeEmbedder()
+        coalescer = EmbeddingCoalescer(embedder, window=0.01, max_batch_size=64)
+        good, bad = await asyncio.gather(
+            coalescer.embed("m", ["good"], {}),
+            coalescer.embed("m", ["bad"], {}),
+            return_exceptions=True,
+        )
+        assert good == [[4.0]]
+        assert isinstance(bad, ValueError)
+        assert len(embedder.calls) == 3
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "error",
+    [ConnectionError("refused"), asyncio.TimeoutError(), _status_error(503)],
+    ids=["connection", "timeout", "unavailable"],
+)
+def test_server_failure_fails_the_whole_batch(error: Exception) -> None:
+    async def main() -> None:
+        embedder = _FakeEmbedder(error)
+        coalescer = EmbeddingCoalescer(embedder, window=0.01, max_batch_size=64)
+        results = await asyncio.gather(
+            coalescer.embed("m", ["a"], {}),
+            coalescer.embed("m", ["b"], {}),
+            return_exceptions=True,
+        )
+        assert results == [error, error]
+        # not sent again request by request
+        assert len(embedder.calls) == 1
+
+    asyncio.run(main())
+
+
+def test_rejected_batch_is_retried_per_request() -> None:
+    async def main() -> None:
+        embedder = _FakeEmbedder(_status_error(400))
+        coalescer = EmbeddingCoalescer(embedder, window=0.01, max_batch_size=64)
+        await asyncio.gather(
+            coalescer.embed("m", ["a"], {}),
+            coalescer.embed("m", ["b"], {}),
+            return_exceptions=True,
+        )
+        assert len(embedder.calls) == 3
+
+    asyncio.run(main())
+
+
+def test_single_request_failure_is_raised() -> None:
+    async def main() -> None:
+        coalescer = EmbeddingCoalescer(_FakeEmbedder(), window=0.01, max_batch_size=64)
+        with pytest.raises(ValueError):
+            await coalescer.embed("m", ["bad"], {})
+
+    asyncio.run(main())
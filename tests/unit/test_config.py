@@ -0,0 +1,33 @@
+from ramalama_stack.config import DEFAULT_RAMALAMA_URL, RamalamaImplConfig
+
+
+def test_endpoints() -> None:
+    assert RamalamaImplConfig().endpoints() == [DEFAULT_RAMALAMA_URL]
+    config = RamalamaImplConfig(url="http://a:8080, http://b:8080,")
+    assert config.endpoints() == ["http://a:8080", "http://b:8080"]
+    # `urls` wins over `url`
+    config = RamalamaImplConfig(url="http://a:8080", urls=["http://c:8080"])
+    assert config.endpoints() == ["http://c:8080"]
+
+
+def test_routed_models_do_not_use_the_default_url() -> None:
+    routes = {"llama3.2:3b": "http://a:8080"}
+    assert RamalamaImplConfig(model_urls=routes).endpoints() == []
+    config = RamalamaImplConfig(url="http://b:8080", model_urls=routes)
+    assert config.endpoints() == ["http://b:8080"]
+    config = RamalamaImplConfig(urls=["http://c:8080"], model_urls=routes)
+    assert config.endpoints() == ["http://c:8080"]
+
+
+def test_routes() -> None:
+    config = RamalamaImplConfig(
+        model_urls={
+            "llama3.2:3b": "http://a:8080,http://b:8080",
+            "all-minilm:latest": ["http://c:8080"],
+        }
+    )
+    assert config.routes() == {
+        "llama3.2:3b": ["http://a:8080", "http://b:8080"],
+        "all-minilm:latest": ["http://c:8080"],
+    }
+    assert RamalamaImplConfig().routes() == {}
@@ -0,0 +1,150 @@
+import asyncio
+import json
+from typing import List
+
+from llama_stack.apis.common.content_types import TextContentItem
+from llama_stack.apis.inference import (
+    ChatCompletionRequest,
+    CompletionMessage,
+    Message,
+    StopReason,
+    SystemMessage,
+    ToolCall,
+    ToolDefinition,
+    ToolParamDefinition,
+    ToolResponseMessage,
+    UserMessage,
+)
+
+from ramalama_stack.conversion_cache import (
+    MessageConversionCache,
+    ToolConversionCache,
+    content_key,
+    convert_message,
+)
+from ramalama_stack.openai_compat import convert_chat_completion_request
+
+
+def _conversation(turns: int) -> List[Message]:
+    messages: List[Message] = [SystemMessage(content="You are a helpful agent.")]
+    for i in range(turns):
+        messages += [
+            UserMessage(
+                content=[
+                    TextContentItem(text=f"Question {i}"),
+                    TextContentItem(text="?"),
+                ]
+            ),
+            CompletionMessage(
+                content="",
+                stop_reason=StopReason.end_of_turn,
+                tool_calls=[
+                    ToolCall(
+                        call_id=f"call-{i}",
+                        tool_name="search",
+                        arguments={"query": f"question {i}"},
+                    )
+                ],
+            ),
+            ToolResponseMessage(call_id=f"call-{i}", content=f"Result {i}"),
+            CompletionMessage(
+                content=f"Answer {i}", stop_reason=StopReason.end_of_turn
+            ),
+        ]
+    return messages
+
+
+def test_cached_conversion_matches_uncached() -> None:
+    async def main() -> None:
+        cache = MessageConversionCache(64)
+        for message in _conversation(2):
+            expected = await convert_message(message)
+            assert await cache.convert(message) == expected
+            # and again, from the cache
+            assert await cache.convert(message) == expected
+
+        request = ChatCompletionRequest(model="m", messages=_conversation(2))
+        assert await convert_chat_completion_request(
+            request, message_cache=MessageConversionCache(64)
+        ) == await convert_chat_completion_request(request)
+
+    asyncio.run(main())
+
+
+def test_history_is_converted_once() -> None:
+    async def main() -> None:
+        cache = MessageConversionCache(64)
+        for turns in (1, 2, 3):
+            request = ChatCompletionRequest(model="m", messages=_conversation(turns))
+            await convert_chat_completion_request(request, message_cache=cache)
+
+        stats = cache.stats()
+        # the system prompt and 4 messages per turn, each converted once
+        assert stats["size"] == stats["misses"] == 1 + 4 * 3
+        # every turn resent the conversation so far
+        assert stats["hits"] == (1 + 4) + (1 + 4 * 2)
+
+    asyncio.run(main())
+
+
+def test_messages_are_keyed_by_type_and_content() -> None:
+    assert content_key(UserMessage(content="hi")) == content_key(
+        UserMessage(content="hi")
+    )
+    assert content_key(UserMessage(content="hi")) != content_key(
+        SystemMessage(content="hi")
+    )
+    assert content_key(UserMessage(content="hi")) != content_key(
+        UserMessage(content="hi!")
+    )
+
+
+def _tools() -> List[ToolDefinition]:
+    return [
+        ToolDefinition(
+            tool_name="search",
+            description="Search the web.",
+            parameters={
+                "query": ToolParamDefinition(param_type="string", required=True),
+                "limit": ToolParamDefinition(param_type="int", required=False),
+            },
+        ),
+        ToolDefinition(tool_name="clock", description="Tell the time."),
+    ]
+
+
+def test_repeated_tool_sets_are_sent_identically() -> None:
+    async def main() -> None:
+        cache = ToolConversionCache(8)
+        payloads = [
+            await convert_chat_completion_request(
+                ChatCompletionRequest(
+                    model="m", messages=_conversation(1), tools=_tools()
+                ),
+                tool_cache=cache,
+            )
+            for _ in range(2)
+        ]
+        first, second = (payload["tools"] for payload in payloads)
+        # the very same objects, serialized byte for byte the same
+        assert first is second
+        assert json.dumps(first).encode() == json.dumps(second).encode()
+
+        uncached = await convert_chat_completion_request(
+            ChatCompletionRequest(model="m", messages=_conversation(1), tools=_tools())
+        )
+        assert uncached["tools"] == first
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    asyncio.run(main())
+
+
+def test_changed_tool_set_is_converted_again() -> None:
+    cache = ToolConversionCache(8)
+    tools = _tools()
+    converted = cache.convert(tools)
+    tools[1] = ToolDefinition(tool_name="clock", description="Tell the date.")
+    assert cache.convert(tools) is not converted
+    assert cache.convert(tools[:1]) is not converted
+    assert cache.stats()["size"] == 3
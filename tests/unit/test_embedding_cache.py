@@ -0,0 +1,54 @@
+import asyncio
+
+from ramalama_stack.embedding_cache import EmbeddingCache, embedding_key
+from ramalama_stack.lru import LRUCache
+
+
+def test_key_depends_on_model_content_and_options() -> None:
+    key = embedding_key("m", "text", {})
+    assert key == embedding_key("m", "text", {})
+    assert key != embedding_key("n", "text", {})
+    assert key != embedding_key("m", "other", {})
+    assert key != embedding_key("m", "text", {"dimensions": 8})
+
+
+def test_memory_cache_returns_stored_embeddings() -> None:
+    async def main() -> None:
+        cache = EmbeddingCache(2)
+        await cache.initialize()
+        await cache.put_many({"a": [1.0], "b": [2.0]})
+        assert await cache.get_many(["a", "b", "c"]) == [[1.0], [2.0], None]
+
+    asyncio.run(main())
+
+
+def test_sqlite_tier_survives_restarts(tmp_path) -> None:
+    db_path = str(tmp_path / "embeddings.db")
+
+    async def main() -> None:
+        cache = EmbeddingCache(1, db_path)
+        await cache.initialize()
+        await cache.put_many({"a": [0.5, 1.5], "b": [2.0]})
+        await cache.close()
+
+        cache = EmbeddingCache(1, db_path)
+        await cache.initialize()
+        assert await cache.get_many(["a", "b", "a"]) == [[0.5, 1.5], [2.0], [0.5, 1.5]]
+        assert cache.stats()["db_hits"] == 2
+        await cache.close()
+
+    asyncio.run(main())
+
+
+def test_lru_evicts_the_least_recently_used_entry() -> None:
+    cache: LRUCache[int] = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
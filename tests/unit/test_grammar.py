@@ -0,0 +1,319 @@
+import json
+from typing import Any, Dict, FrozenSet, Tuple
+
+import pytest
+from llama_stack.apis.inference import GrammarResponseFormat
+from llama_stack.apis.inference.inference import JsonSchemaResponseFormat
+
+from ramalama_stack.grammar import (
+    GrammarCache,
+    UnsupportedSchemaError,
+    bnf_to_grammar,
+    compile_json_schema,
+    json_schema_to_grammar,
+)
+from ramalama_stack.openai_compat import _constrained_decoding
+
+
+class _Gbnf:
+    """
+    A backtracking recognizer for the subset of GBNF the compiler emits:
+    literals, character classes, rule references, groups, alternatives
+    and the `?`, `*`, `+` and `{m,n}` repetitions.
+    """
+
+    def __init__(self, grammar: str) -> None:
+        self.rules: Dict[str, Any] = {}
+        for line in grammar.splitlines():
+            name, body = line.split("::=", 1)
+            self._text, self._pos = body, 0
+            self.rules[name.strip()] = self._alternatives()
+            self._skip_spaces()
+            assert self._pos == len(body), f"cannot parse {line!r}"
+        for node in self.rules.values():
+            self._check_refs(node)
+
+    def _check_refs(self, node: Tuple) -> None:
+        if node[0] == "ref":
+            assert node[1] in self.rules, f"undefined rule {node[1]}"
+        elif node[0] in ("alt", "seq"):
+            for child in node[1]:
+                self._check_refs(child)
+        elif node[0] == "rep":
+            self._check_refs(node[1])
+
+    def _peek(self) -> str:
+        return self._text[self._pos] if self._pos < len(self._text) else ""
+
+    def _skip_spaces(self) -> None:
+        while self._peek() in (" ", "\t"):
+            self._pos += 1
+
+    def _alternatives(self) -> Tuple:
+        sequences = [self._sequence()]
+        while self._peek() == "|":
+            self._pos += 1
+            sequences.append(self._sequence())
+        return ("alt", sequences)
+
+    def _sequence(self) -> Tuple:
+        items = []
+        while True:
+            self._skip_spaces()
+            if self._peek() in ("", "|", ")"):
+                return ("seq", items)
+            items.append(self._repetition(self._atom()))
+
+    def _char(self) -> str:
+        c = self._text[self._pos]
+        self._pos += 1
+        if c != "\\":
+            return c
+        c = self._text[self._pos]
+        self._pos += 1
+        if c == "x":
+            self._pos += 2
+            return chr(int(self._text[self._pos - 2 : self._pos], 16))
+        return {"n": "\n", "t": "\t", "r": "\r"}.get(c, c)
+
+    def _atom(self) -> Tuple:
+        c = self._peek()
+        if c == '"':
+            self._pos += 1
+            literal = ""
+            while self._peek() != '"':
+                literal += self._char()
+            self._pos += 1
+            return ("lit", literal)
+        if c == "[":
+            self._pos += 1
+            negated = self._peek() == "^"
+            self._pos += negated
+            ranges = []
+            while self._peek() != "]":
+                low = high = self._char()
+                if self._peek() == "-" and self._text[self._pos + 1] != "]":
+                    self._pos += 1
+                    high = self._char()
+                ranges.append((low, high))
+            self._pos += 1
+            return ("cls", negated, ranges)
+        if c == "(":
+            self._pos += 1
+            node = self._alternatives()
+            assert self._peek() == ")"
+            self._pos += 1
+            return node
+        start = self._pos
+        while self._peek().isalnum() or self._peek() == "-":
+            self._pos += 1
+        assert self._pos > start, f"unexpected {c!r}"
+        return ("ref", self._text[start : self._pos])
+
+    def _repetition(self, node: Tuple) -> Tuple:
+        c = self._peek()
+        if c in ("?", "*", "+"):
+            self._pos += 1
+            return ("rep", node, int(c == "+"), 1 if c == "?" else None)
+        if c == "{":
+            end = self._text.index("}", self._pos)
+            low, _, high = self._text[self._pos + 1 : end].partition(",")
+            self._pos = end + 1
+            return ("rep", node, int(low), int(high) if high else None)
+        return node
+
+    def matches(self, text: str) -> bool:
+        self._input = text
+        self._memo: Dict[Tuple[int, int], FrozenSet[int]] = {}
+        return len(text) in self._ends(self.rules["root"], 0)
+
+    def _ends(self, node: Tuple, i: int) -> FrozenSet[int]:
+        key = (id(node), i)
+        if key in self._memo:
+            return self._memo[key]
+        self._memo[key] = frozenset()
+        kind = node[0]
+        ends = set()
+        if kind == "lit":
+            if self._input.startswith(node[1], i):
+                ends.add(i + len(node[1]))
+        elif kind == "cls":
+            if i < len(self._input):
+                c = self._input[i]
+                if any(low <= c <= high for low, high in node[2]) != node[1]:
+                    ends.add(i + 1)
+        elif kind == "ref":
+            ends = set(self._ends(self.rules[node[1]], i))
+        elif kind == "alt":
+            for sequence in node[1]:
+                ends |= self._ends(sequence, i)
+        elif kind == "seq":
+            ends = {i}
+            for item in node[1]:
+                ends = {e for p in ends for e in self._ends(item, p)}
+        else:
+            _, item, low, high = node
+            frontier, seen, count = {i}, {i}, 0
+            if low == 0:
+                ends.add(i)
+            while frontier and (high is None or count < high):
+                frontier = {e for p in frontier for e in self._ends(item, p)}
+                count += 1
+                if count >= low:
+                    ends |= frontier
+                    frontier -= seen
+                seen |= frontier
+        self._memo[key] = frozenset(ends)
+        return self._memo[key]
+
+
+def _accepts(schema: Dict[str, Any], value: Any) -> bool:
+    grammar = _Gbnf(json_schema_to_grammar(schema))
+    return grammar.matches(json.dumps(value)) and grammar.matches(
+        json.dumps(value, indent=2)
+    )
+
+
+PERSON = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string", "minLength": 1, "maxLength": 5},
+        "age": {"type": "integer"},
+        "height": {"type": "number"},
+        "tags": {
+            "type": "array",
+            "items": {"enum": ["a", "b"]},
+            "minItems": 1,
+            "maxItems": 2,
+        },
+        "alive": {"type": "boolean"},
+    },
+    "required": ["name"],
+}
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {"name": "Ann"},
+        {"name": "Ann", "age": -3},
+        {"name": "Ann", "height": 1.75, "alive": True},
+        {"name": "Ann", "age": 3, "height": 2e3, "tags": ["a", "b"], "alive": False},
+        {"name": 'a"\\'},
+    ],
+)
+def test_schema_accepts_valid_documents(value: Any) -> None:
+    assert _accepts(PERSON, value)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        {},
+        {"age": 3},
+        {"name": ""},
+        {"name": "too long"},
+        {"name": "Ann", "age": 1.5},
+        {"name": "Ann", "tags": []},
+        {"name": "Ann", "tags": ["a", "b", "a"]},
+        {"name": "Ann", "tags": ["c"]},
+        {"name": "Ann", "other": 1},
+        # properties come in schema order
+        {"age": 3, "name": "Ann"},
+        ["Ann"],
+    ],
+)
+def test_schema_rejects_invalid_documents(value: Any) -> None:
+    assert not _accepts(PERSON, value)
+
+
+def test_optional_properties_without_required_ones() -> None:
+    schema = {
+        "type": "object",
+        "properties": {"a": {"type": "integer"}, "b": {"type": "null"}},
+    }
+    for value in ({}, {"a": 1}, {"b": None}, {"a": 1, "b": None}):
+        assert _accepts(schema, value)
+    assert not _accepts(schema, {"b": None, "a": 1})
+
+
+def test_recursive_refs() -> None:
+    schema = {
+        "$defs": {
+            "node": {
+                "type": "object",
+                "properties": {
+                    "value": {"type": "integer"},
+                    "next": {"anyOf": [{"$ref": "#/$defs/node"}, {"type": "null"}]},
+                },
+                "required": ["value", "next"],
+            }
+        },
+        "$ref": "#/$defs/node",
+    }
+    assert _accepts(schema, {"value": 1, "next": {"value": 2, "next": None}})
+    assert not _accepts(schema, {"value": 1, "next": {"value": 2}})
+
+
+def test_unions_consts_and_untyped_values() -> None:
+    schema = {
+        "type": "object",
+        "properties": {
+            "kind": {"const": "point"},
+            "id": {"type": ["string", "integer"]},
+            "data": {},
+        },
+        "required": ["kind", "id", "data"],
+    }
+    assert _accepts(schema, {"kind": "point", "id": 1, "data": {"x": [1, None]}})
+    assert _accepts(schema, {"kind": "point", "id": "p", "data": "x"})
+    assert not _accepts(schema, {"kind": "line", "id": 1, "data": 1})
+
+
+def test_definitions_named_like_primitives_do_not_clash() -> None:
+    schema = {
+        "$defs": {"string": {"type": "integer"}},
+        "type": "object",
+        "properties": {
+            "a": {"$ref": "#/$defs/string"},
+            "b": {"type": "string"},
+        },
+        "required": ["a", "b"],
+    }
+    assert _accepts(schema, {"a": 1, "b": "x"})
+    assert not _accepts(schema, {"a": "x", "b": "x"})
+
+
+def test_unsupported_keywords_fall_back_to_llama_cpp() -> None:
+    schema = {"type": "string", "pattern": "^a+$"}
+    with pytest.raises(UnsupportedSchemaError):
+        json_schema_to_grammar(schema)
+    assert compile_json_schema(schema) == {"json_schema": schema}
+
+
+def test_bnf_grammars() -> None:
+    assert bnf_to_grammar({"grammar": 'root ::= "yes"'}) == 'root ::= "yes"'
+    rules = bnf_to_grammar({"root": 'answer "!"', "answer": '"yes" | "no"'})
+    assert _Gbnf(rules).matches("no!")
+    with pytest.raises(ValueError):
+        bnf_to_grammar({"answer": '"yes"'})
+
+
+def test_cache_compiles_each_schema_once() -> None:
+    cache = GrammarCache(8)
+    first = cache.json_schema(PERSON)
+    assert cache.json_schema(dict(PERSON)) is first
+    cache.json_schema({"type": "string", "pattern": "a"})
+    stats = cache.stats()
+    assert stats["compiled"] == 1
+    assert stats["passed_through"] == 1
+    assert stats["hits"] == 1
+
+
+def test_response_formats_become_llama_cpp_parameters() -> None:
+    params = _constrained_decoding(
+        JsonSchemaResponseFormat(json_schema=PERSON), GrammarCache(8)
+    )
+    assert _Gbnf(params["grammar"]).matches('{"name": "Ann"}')
+    params = _constrained_decoding(GrammarResponseFormat(bnf={"root": '"yes"'}), None)
+    assert params == {"grammar": 'root ::= "yes"'}
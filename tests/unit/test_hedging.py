@@ -0,0 +1,100 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from ramalama_stack.hedging import MIN_SAMPLES, Hedger
+
+
+def _warmed_up(latency: float = 0.01, budget: float = 1.0) -> Hedger:
+    hedger = Hedger(percentile=90, budget=budget)
+    for _ in range(MIN_SAMPLES):
+        hedger.record("chat", latency)
+    return hedger
+
+
+def test_delay_is_the_latency_percentile() -> None:
+    hedger = Hedger(percentile=90, budget=0.1)
+    for i in range(1, MIN_SAMPLES):
+        hedger.record("chat", i / 100)
+    assert hedger.delay("chat") is None
+    hedger.record("chat", MIN_SAMPLES / 100)
+    assert hedger.delay("chat") == pytest.approx(0.18)
+    assert hedger.delay("completion") is None
+
+
+def test_budget_caps_hedges() -> None:
+    hedger = Hedger(percentile=90, budget=0.5)
+    hedger.requests = 4
+    assert hedger.try_hedge()
+    assert hedger.try_hedge()
+    assert not hedger.try_hedge()
+
+
+def _send(delays: dict, errors: dict, cancelled: List[bool]):
+    async def send(hedge: bool) -> str:
+        try:
+            await asyncio.sleep(delays[hedge])
+        except asyncio.CancelledError:
+            cancelled.append(hedge)
+            raise
+        if hedge in errors:
+            raise errors[hedge]
+        return "hedge" if hedge else "primary"
+
+    return send
+
+
+def test_fast_request_is_not_hedged() -> None:
+    async def main() -> None:
+        hedger = _warmed_up()
+        send = _send({False: 0, True: 0}, {}, [])
+        assert await hedger.run("chat", send, lambda: True) == "primary"
+        assert hedger.stats()["hedges"] == 0
+
+    asyncio.run(main())
+
+
+def test_slow_request_is_hedged_and_the_loser_cancelled() -> None:
+    async def main() -> None:
+        hedger = _warmed_up()
+        cancelled: List[bool] = []
+        send = _send({False: 10, True: 0}, {}, cancelled)
+        assert await hedger.run("chat", send, lambda: True) == "hedge"
+        await asyncio.sleep(0)
+        assert cancelled == [False]
+        stats = hedger.stats()
+        assert stats["hedges"] == 1
+        assert stats["hedge_wins"] == 1
+
+    asyncio.run(main())
+
+
+def test_no_hedge_without_another_replica() -> None:
+    async def main() -> None:
+        hedger = _warmed_up()
+        send = _send({False: 0.05, True: 0}, {}, [])
+        assert await hedger.run("chat", send, lambda: False) == "primary"
+        assert hedger.stats()["hedges"] == 0
+
+    asyncio.run(main())
+
+
+def test_failed_hedge_leaves_the_primary_answer() -> None:
+    async def main() -> None:
+        hedger = _warmed_up()
+        send = _send({False: 0.05, True: 0}, {True: ConnectionError("down")}, [])
+        assert await hedger.run("chat", send, lambda: True) == "primary"
+
+    asyncio.run(main())
+
+
+def test_primary_error_is_raised_when_both_fail() -> None:
+    async def main() -> None:
+        hedger = _warmed_up()
+        errors = {False: ValueError("primary"), True: ConnectionError("hedge")}
+        send = _send({False: 0.05, True: 0}, errors, [])
+        with pytest.raises(ValueError):
+            await hedger.run("chat", send, lambda: True)
+
+    asyncio.run(main())
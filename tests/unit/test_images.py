@@ -0,0 +1,153 @@
+import asyncio
+import base64
+import io
+from typing import List, Tuple
+
+import httpx
+import pytest
+from PIL import Image as PIL_Image
+
+from llama_stack.apis.common.content_types import URL, ImageContentItem, TextContentItem
+from llama_stack.apis.inference import UserMessage
+
+from ramalama_stack.images import ImageProcessor
+
+
+def _image_bytes(size: Tuple[int, int], mode: str = "RGB", fmt: str = "PNG") -> bytes:
+    out = io.BytesIO()
+    PIL_Image.new(mode, size).save(out, format=fmt)
+    return out.getvalue()
+
+
+def _item(content: bytes) -> ImageContentItem:
+    return ImageContentItem(image={"data": base64.b64encode(content).decode()})
+
+
+def _url_item(url: str) -> ImageContentItem:
+    return ImageContentItem(image={"url": URL(uri=url)})
+
+
+def _decode(data_url: str) -> PIL_Image.Image:
+    _, _, data = data_url.partition(",")
+    return PIL_Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def _serve(processor: ImageProcessor, images: dict) -> List[str]:
+    """
+    Answer the image fetches of `processor` from `images`, by URL.
+    """
+    fetched: List[str] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        fetched.append(str(request.url))
+        content = images.get(str(request.url))
+        if content is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=content)
+
+    processor._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    return fetched
+
+
+def test_large_images_are_downscaled() -> None:
+    async def main() -> None:
+        processor = ImageProcessor(max_size=50, cache_size=8)
+        data_url = await processor.to_data_url(_item(_image_bytes((200, 100))))
+        assert data_url.startswith("data:image/jpeg;base64,")
+        assert _decode(data_url).size == (50, 25)
+
+        # transparency is kept
+        content = _image_bytes((100, 200), mode="RGBA")
+        data_url = await processor.to_data_url(_item(content))
+        assert data_url.startswith("data:image/png;base64,")
+        assert _decode(data_url).size == (25, 50)
+        assert processor.stats()["bytes_in"] > 0
+
+    asyncio.run(main())
+
+
+def test_small_images_are_sent_as_they_are() -> None:
+    async def main() -> None:
+        content = _image_bytes((20, 10))
+        for processor in (
+            ImageProcessor(max_size=50, cache_size=8),
+            ImageProcessor(max_size=None, cache_size=8),
+        ):
+            data_url = await processor.to_data_url(_item(content))
+            assert data_url == "data:image/png;base64," + base64.b64encode(
+                content
+            ).decode("utf-8")
+
+        # formats llama.cpp may not read are converted
+        processor = ImageProcessor(max_size=None, cache_size=8)
+        data_url = await processor.to_data_url(_item(_image_bytes((20, 10), fmt="BMP")))
+        assert data_url.startswith("data:image/jpeg;base64,")
+
+    asyncio.run(main())
+
+
+def test_images_are_cached_by_url_and_content() -> None:
+    async def main() -> None:
+        content = _image_bytes((200, 100))
+        processor = ImageProcessor(max_size=50, cache_size=8)
+        fetched = _serve(
+            processor, {"http://img/a.png": content, "http://img/b.png": content}
+        )
+
+        first = await processor.to_data_url(_url_item("http://img/a.png"))
+        assert await processor.to_data_url(_url_item("http://img/a.png")) == first
+        assert fetched == ["http://img/a.png"]
+
+        # the same image under another URL is fetched but not encoded again
+        bytes_out = processor.stats()["bytes_out"]
+        assert await processor.to_data_url(_url_item("http://img/b.png")) == first
+        assert await processor.to_data_url(_item(content)) == first
+        assert fetched == ["http://img/a.png", "http://img/b.png"]
+        assert processor.stats()["bytes_out"] == bytes_out
+        assert processor.stats()["fetches"] == 2
+        await processor.close()
+
+    asyncio.run(main())
+
+
+def test_messages_get_their_images_inlined() -> None:
+    async def main() -> None:
+        processor = ImageProcessor(max_size=50, cache_size=8)
+        _serve(processor, {"http://img/a.png": _image_bytes((200, 100))})
+        text = TextContentItem(text="What is this?")
+        message = UserMessage(content=[text, _url_item("http://img/a.png")])
+
+        processed = await processor.process_message(message)
+        kept, image = processed.content
+        assert kept == text
+        assert image.image.url.uri.startswith("data:image/jpeg;base64,")
+        assert message.content[1].image.url.uri == "http://img/a.png"
+
+        plain = UserMessage(content="hello")
+        assert await processor.process_message(plain) is plain
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("content", [b"not an image", _image_bytes((200, 100))[:60]])
+def test_invalid_images_are_rejected(content: bytes) -> None:
+    processor = ImageProcessor(max_size=50, cache_size=8)
+    with pytest.raises(ValueError, match="Invalid image"):
+        asyncio.run(processor.to_data_url(_item(content)))
+
+
+def test_decompression_bombs_are_rejected(monkeypatch) -> None:
+    monkeypatch.setattr(PIL_Image, "MAX_IMAGE_PIXELS", 1000)
+    processor = ImageProcessor(max_size=50, cache_size=8)
+    with pytest.raises(ValueError, match="Invalid image"):
+        asyncio.run(processor.to_data_url(_item(_image_bytes((200, 100)))))
+
+
+def test_failed_fetch_is_rejected() -> None:
+    async def main() -> None:
+        processor = ImageProcessor(max_size=50, cache_size=8)
+        _serve(processor, {})
+        with pytest.raises(ValueError, match="Failed to fetch image"):
+            await processor.to_data_url(_url_item("http://img/missing.png"))
+
+    asyncio.run(main())
@@ -0,0 +1,192 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+import pytest
+
+from ramalama_stack.metrics import (
+    Counter,
+    Histogram,
+    InferenceMetrics,
+    MetricsServer,
+    instrument_stream,
+)
+from stub_server import free_port
+
+LABELS = ("m", "chat")
+
+
+def _count(histogram: Histogram) -> int:
+    counts, _ = histogram.values.get(LABELS, ((), ()))
+    return sum(counts)
+
+
+def _sum(histogram: Histogram) -> float:
+    return histogram.values[LABELS][1][0]
+
+
+async def _chunks(count: int, error: Optional[Exception] = None):
+    for i in range(count):
+        usage = SimpleNamespace(prompt_tokens=3, completion_tokens=count)
+        yield SimpleNamespace(usage=usage if i == count - 1 else None)
+    if error is not None:
+        raise error
+
+
+def test_finished_request() -> None:
+    metrics = InferenceMetrics()
+    timer = metrics.start(*LABELS)
+    assert metrics.in_flight.values[LABELS] == 1
+    timer.finish(SimpleNamespace(prompt_tokens=7, completion_tokens=20))
+
+    assert metrics.requests.values[LABELS] == 1
+    assert metrics.in_flight.values[LABELS] == 0
+    assert _count(metrics.latency) == 1
+    assert _sum(metrics.prompt_tokens) == 7
+    assert _sum(metrics.completion_tokens) == 20
+    assert _count(metrics.tokens_per_second) == 1
+    # no chunks, no streaming timings
+    assert _count(metrics.time_to_first_token) == 0
+
+
+def test_streamed_request_without_usage() -> None:
+    metrics = InferenceMetrics()
+    timer = metrics.start(*LABELS)
+    timer.prompt_tokens = 5
+    for _ in range(3):
+        timer.chunk()
+    timer.finish()
+
+    assert _count(metrics.time_to_first_token) == 1
+    assert _count(metrics.inter_token_latency) == 2
+    assert _sum(metrics.prompt_tokens) == 5
+    # one token per chunk
+    assert _sum(metrics.completion_tokens) == 3
+
+
+def test_failed_and_cancelled_requests() -> None:
+    metrics = InferenceMetrics()
+    metrics.start(*LABELS).fail(ConnectionError("refused"))
+    metrics.start(*LABELS).fail(asyncio.TimeoutError())
+    metrics.start(*LABELS).cancel()
+
+    assert metrics.in_flight.values[LABELS] == 0
+    assert metrics.errors.values == {
+        LABELS + ("ConnectionError",): 1,
+        LABELS + ("timeout",): 1,
+    }
+    assert _count(metrics.latency) == 0
+
+
+def test_abandoned_stream_estimates_the_tokens_saved() -> None:
+    metrics = InferenceMetrics()
+    metrics.start(*LABELS).finish(SimpleNamespace(completion_tokens=10))
+    timer = metrics.start(*LABELS)
+    timer.chunk()
+    timer.abandon()
+
+    assert metrics.in_flight.values[LABELS] == 0
+    assert metrics.cancellation_stats() == {"streams_cancelled": 1, "tokens_saved": 9}
+
+
+@pytest.mark.parametrize("outcome", ["finished", "failed", "closed"])
+def test_instrument_stream(outcome: str) -> None:
+    async def main() -> None:
+        metrics = InferenceMetrics()
+        error = ConnectionError("lost") if outcome == "failed" else None
+        stream = instrument_stream(_chunks(4, error), metrics.start(*LABELS))
+        read: List[Any] = []
+        try:
+            async for chunk in stream:
+                read.append(chunk)
+                if outcome == "closed" and len(read) == 2:
+                    await stream.aclose()
+                    break
+        except ConnectionError:
+            pass
+
+        assert metrics.in_flight.values[LABELS] == 0
+        assert _count(metrics.time_to_first_token) == 1
+        finished = outcome == "finished"
+        if finished:
+            # usage is taken from the last chunk
+            assert _sum(metrics.completion_tokens) == 4
+        assert _count(metrics.latency) == int(finished)
+        assert sum(metrics.errors.values.values()) == int(outcome == "failed")
+        cancelled = metrics.cancellation_stats()["streams_cancelled"]
+        assert cancelled == int(outcome == "closed")
+
+    asyncio.run(main())
+
+
+def test_render() -> None:
+    metrics = InferenceMetrics()
+    metrics.start('m"1', "chat").finish(SimpleNamespace(completion_tokens=20))
+    text = metrics.render(
+        [{"url": "http://a:8080", "in_flight": 2, "requests": 5, "errors": 1}],
+        {"queued": 3, "limit": 8, "rejected": 4},
+    )
+    lines = text.splitlines()
+
+    assert "# TYPE ramalama_requests_total counter" in lines
+    # label values are escaped
+    assert 'ramalama_requests_total{model="m\\"1",endpoint="chat"} 1' in lines
+    # histogram buckets are cumulative
+    buckets = [
+        line for line in lines if line.startswith("ramalama_completion_tokens_bucket")
+    ]
+    assert buckets[0].endswith('le="16.0"} 0')
+    assert buckets[1].endswith('le="64.0"} 1')
+    assert buckets[-1].endswith('le="+Inf"} 1')
+    assert 'ramalama_completion_tokens_sum{model="m\\"1",endpoint="chat"} 20.0' in lines
+    assert 'ramalama_backend_in_flight{backend="http://a:8080"} 2' in lines
+    assert 'ramalama_backend_errors_total{backend="http://a:8080"} 1' in lines
+    assert "# TYPE ramalama_admission_queued gauge" in lines
+    assert "ramalama_admission_queued 3" in lines
+    assert "ramalama_admission_limit 8" in lines
+    assert "ramalama_admission_rejected_total 4" in lines
+    assert text.endswith("\n")
+
+    assert "ramalama_admission" not in metrics.render()
+
+
+def test_unlabelled_metrics() -> None:
+    counter = Counter("c_total", "A counter.")
+    counter.inc()
+    assert counter.render()[-1] == "c_total 1"
+    histogram = Histogram("h", "A histogram.", buckets=(1,))
+    histogram.observe((), 1)
+    assert histogram.render()[2:] == [
+        'h_bucket{le="1.0"} 1',
+        'h_bucket{le="+Inf"} 1',
+        "h_sum 1.0",
+        "h_count 1",
+    ]
+
+
+def test_metrics_server() -> None:
+    async def get(port: int, path: str) -> bytes:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def main() -> None:
+        port = free_port()
+        server = MetricsServer(lambda: "up 1\n", "127.0.0.1", port)
+        await server.start()
+        try:
+            response = await get(port, "/metrics?name=up")
+            head, body = response.split(b"\r\n\r\n", 1)
+            assert head.startswith(b"HTTP/1.1 200 OK")
+            assert b"Content-Length: 5" in head
+            assert body == b"up 1\n"
+            assert (await get(port, "/")).startswith(b"HTTP/1.1 404")
+        finally:
+            await server.stop()
+        with pytest.raises(ConnectionError):
+            await get(port, "/metrics")
+
+    asyncio.run(main())
@@ -0,0 +1,192 @@
+import asyncio
+import warnings
+from typing import Any, List, Optional
+
+import pytest
+from llama_stack.providers.utils.inference.openai_compat import (
+    convert_openai_chat_completion_stream as upstream_chat_stream,
+)
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk,
+    Choice,
+    ChoiceDelta,
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction,
+    ChoiceLogprobs,
+)
+from openai.types.chat.chat_completion_token_logprob import (
+    ChatCompletionTokenLogprob,
+    TopLogprob,
+)
+from openai.types.completion import Completion
+from openai.types.completion_choice import CompletionChoice
+
+from ramalama_stack.openai_compat import (
+    convert_openai_chat_completion_stream,
+    convert_openai_completion_stream,
+)
+
+
+def _chunk(
+    content: Optional[str] = None,
+    finish_reason: Optional[str] = None,
+    tool_calls: Optional[List[ChoiceDeltaToolCall]] = None,
+    logprobs: Optional[ChoiceLogprobs] = None,
+) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="chatcmpl-test",
+        created=0,
+        model="test",
+        object="chat.completion.chunk",
+        choices=[
+            Choice(
+                index=0,
+                delta=ChoiceDelta(content=content, tool_calls=tool_calls),
+                finish_reason=finish_reason,
+                logprobs=logprobs,
+            )
+        ],
+    )
+
+
+def _tool_call(
+    index: int,
+    id: Optional[str] = None,
+    name: Optional[str] = None,
+    arguments: Optional[str] = None,
+) -> ChoiceDeltaToolCall:
+    return ChoiceDeltaToolCall(
+        index=index,
+        id=id,
+        type="function",
+        function=ChoiceDeltaToolCallFunction(name=name, arguments=arguments),
+    )
+
+
+async def _aiter(items: List[Any]):
+    for item in items:
+        yield item
+
+
+def _collect(converter, chunks: List[Any], *args: Any) -> List[Any]:
+    """
+    The events of a converted stream, ending with the name of the error
+    the conversion raised, if any.
+    """
+
+    async def collect() -> List[Any]:
+        events: List[Any] = []
+        try:
+            async for chunk in converter(_aiter(chunks), *args):
+                events.append(chunk.model_dump(mode="json"))
+        except Exception as e:
+            events.append(type(e).__name__)
+        return events
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return asyncio.run(collect())
+
+
+_LOGPROBS = ChoiceLogprobs(
+    content=[
+        ChatCompletionTokenLogprob(
+            token=" a",
+            logprob=-0.1,
+            top_logprobs=[TopLogprob(token=" a", logprob=-0.1)],
+        )
+    ]
+)
+
+STREAMS = {
+    "text": [_chunk(" a"), _chunk(" b"), _chunk(finish_reason="stop")],
+    "no_finish_reason": [_chunk(" a"), _chunk(" b")],
+    "finish_reason_then_usage": [_chunk(" a", finish_reason="length"), _chunk()],
+    "empty_content": [_chunk(""), _chunk(None), _chunk(" a", finish_reason="stop")],
+    "logprobs": [_chunk(" a", logprobs=_LOGPROBS), _chunk(finish_reason="stop")],
+    "tool_call": [
+        _chunk(tool_calls=[_tool_call(0, "call-1", "get_weather")]),
+        _chunk(tool_calls=[_tool_call(0, arguments='{"city": ')]),
+        _chunk(tool_calls=[_tool_call(0, arguments='"Paris"}')]),
+        _chunk(finish_reason="tool_calls"),
+    ],
+    "content_and_tool_call": [
+        _chunk("thinking", tool_calls=[_tool_call(0, "call-1", "f", "{}")]),
+        _chunk(finish_reason="tool_calls"),
+    ],
+    "bad_tool_arguments": [
+        _chunk(tool_calls=[_tool_call(0, "call-1", "f", "{not json")]),
+        _chunk(finish_reason="tool_calls"),
+    ],
+    "parallel_tool_calls": [
+        _chunk(
+            tool_calls=[
+                _tool_call(0, "call-1", "f", "{}"),
+                _tool_call(1, "call-2", "g", "{}"),
+            ]
+        ),
+    ],
+    "empty": [],
+}
+
+
+@pytest.mark.parametrize("name", sorted(STREAMS))
+@pytest.mark.parametrize("incremental", [True, False])
+def test_chat_stream_matches_upstream(name: str, incremental: bool) -> None:
+    chunks = STREAMS[name]
+    assert _collect(convert_openai_chat_completion_stream, chunks, incremental) == (
+        _collect(upstream_chat_stream, chunks, incremental)
+    )
+
+
+def test_chat_stream_defaults_to_end_of_turn() -> None:
+    events = _collect(
+        convert_openai_chat_completion_stream, STREAMS["no_finish_reason"], True
+    )
+    assert events[-1]["event"]["stop_reason"] == "end_of_turn"
+
+
+def _completion(text: str, finish_reason: Optional[str]) -> Completion:
+    return Completion(
+        id="cmpl-test",
+        created=0,
+        model="test",
+        object="text_completion",
+        choices=[CompletionChoice(index=0, text=text, finish_reason="stop")],
+    ).model_copy(
+        update={
+            "choices": [
+                CompletionChoice.model_construct(
+                    index=0, text=text, finish_reason=finish_reason, logprobs=None
+                )
+            ]
+        }
+    )
+
+
+def test_completion_stream_reports_stop_reasons() -> None:
+    chunks = [_completion(" a", None), _completion(" b", "length")]
+    assert [
+        (c["delta"], c["stop_reason"])
+        for c in _collect(convert_openai_completion_stream, chunks)
+    ] == [(" a", "end_of_turn"), (" b", "out_of_tokens")]
+
+
+def test_stream_is_closed_when_abandoned() -> None:
+    closed = []
+
+    async def stream():
+        try:
+            yield _chunk(" a")
+            yield _chunk(" b")
+        finally:
+            closed.append(True)
+
+    async def read_one() -> None:
+        converted = convert_openai_chat_completion_stream(stream(), True)
+        await converted.__anext__()
+        await converted.__anext__()
+        await converted.aclose()
+
+    asyncio.run(read_one())
+    assert closed == [True]
@@ -0,0 +1,115 @@
+import asyncio
+from typing import Any, List
+
+from openai.types.chat import ChatCompletion
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk,
+    Choice as ChunkChoice,
+    ChoiceDelta,
+)
+
+from ramalama_stack.response_cache import ResponseCache, response_cache_key
+
+
+def _response(content: str = "hello") -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "created": 0,
+            "model": "m",
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+        }
+    )
+
+
+def _chunks(*texts: str) -> List[ChatCompletionChunk]:
+    return [
+        ChatCompletionChunk(
+            id="chatcmpl-2",
+            created=0,
+            model="m",
+            object="chat.completion.chunk",
+            choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=text))],
+        )
+        for text in texts
+    ]
+
+
+async def _aiter(items: List[Any]):
+    for item in items:
+        yield item
+
+
+async def _read(stream) -> List[Any]:
+    return [chunk async for chunk in stream]
+
+
+def test_key_ignores_transport_fields() -> None:
+    payload = {"model": "m", "messages": [], "temperature": 0}
+    key = response_cache_key("chat", payload)
+    assert key == response_cache_key("chat", {**payload, "stream": True})
+    assert key != response_cache_key("completion", payload)
+    assert key != response_cache_key("chat", {**payload, "seed": 1})
+
+
+def test_hit_has_a_new_id() -> None:
+    cache = ResponseCache(4, None)
+    assert cache.lookup("k", stream=False) is None
+    cache.store("k", _response(), stream=False)
+    hit = cache.lookup("k", stream=False)
+    assert hit.choices[0].message.content == "hello"
+    assert hit.id != "chatcmpl-1"
+    assert hit.id.startswith("chatcmpl-")
+
+
+def test_streaming_hit_replays_a_response() -> None:
+    cache = ResponseCache(4, None)
+    cache.store("k", _response(), stream=False)
+    chunks = asyncio.run(_read(cache.lookup("k", stream=True)))
+    assert [c.choices[0].delta.content for c in chunks] == ["hello"]
+
+
+def test_stream_is_cached_once_complete() -> None:
+    async def main() -> None:
+        cache = ResponseCache(4, None)
+        recording = cache.store("k", _aiter(_chunks("a", "b")), stream=True)
+        assert await recording.__anext__() is not None
+        # not complete yet
+        assert cache.lookup("k", stream=True) is None
+        await _read(recording)
+
+        replay = await _read(cache.lookup("k", stream=True))
+        assert [c.choices[0].delta.content for c in replay] == ["a", "b"]
+        assert len({c.id for c in replay}) == 1
+        assert replay[0].id != "chatcmpl-2"
+        # a recorded stream is not turned back into a full response
+        assert cache.lookup("k", stream=False) is None
+
+    asyncio.run(main())
+
+
+def test_abandoned_stream_is_not_cached() -> None:
+    async def main() -> None:
+        cache = ResponseCache(4, None)
+        recording = cache.store("k", _aiter(_chunks("a", "b")), stream=True)
+        await recording.__anext__()
+        await recording.aclose()
+        assert cache.lookup("k", stream=True) is None
+
+    asyncio.run(main())
+
+
+def test_entries_expire(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("ramalama_stack.lru.time.monotonic", lambda: now[0])
+    cache = ResponseCache(4, ttl=10)
+    cache.store("k", _response(), stream=False)
+    now[0] += 11
+    assert cache.lookup("k", stream=False) is None
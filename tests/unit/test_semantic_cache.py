@@ -0,0 +1,152 @@
+import asyncio
+from typing import Any, Dict, List
+
+from openai.types.chat import ChatCompletion
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk,
+    Choice as ChunkChoice,
+    ChoiceDelta,
+)
+
+from ramalama_stack.semantic_cache import SemanticCache, semantic_query
+
+
+def _response(content: str = "hello") -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "created": 0,
+            "model": "m",
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+        }
+    )
+
+
+async def _chunks(*texts: str):
+    for text in texts:
+        yield ChatCompletionChunk(
+            id="chatcmpl-2",
+            created=0,
+            model="m",
+            object="chat.completion.chunk",
+            choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=text))],
+        )
+
+
+async def _read(stream) -> List[Any]:
+    return [chunk async for chunk in stream]
+
+
+def _params(question: Any, **options: Any) -> Dict[str, Any]:
+    return {
+        "model": "m",
+        "messages": [
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": question},
+        ],
+        **options,
+    }
+
+
+def test_query_splits_context_and_question() -> None:
+    context, question = semantic_query(_params("What is a cat?"))
+    assert question == "What is a cat?"
+    assert semantic_query(_params("Define cat", stream=True))[0] == context
+    assert semantic_query(_params("What is a cat?", temperature=0))[0] != context
+
+    params = _params("What is a cat?")
+    params["messages"][0]["content"] = "Be verbose."
+    assert semantic_query(params)[0] != context
+
+
+def test_query_joins_text_parts() -> None:
+    parts = [{"type": "text", "text": "What is"}, {"type": "text", "text": "a cat?"}]
+    assert semantic_query(_params(parts))[1] == "What is\na cat?"
+
+
+def test_requests_the_cache_cannot_answer() -> None:
+    image = {"type": "image_url", "image_url": {"url": "data:image/png;base64,"}}
+    assert semantic_query(_params([image])) is None
+    assert semantic_query(_params("  ")) is None
+    assert semantic_query(_params("What is a cat?", n=2)) is None
+    assert semantic_query({"model": "m", "messages": []}) is None
+    assistant_last = _params("What is a cat?")
+    assistant_last["messages"].append({"role": "assistant", "content": "A pet."})
+    assert semantic_query(assistant_last) is None
+
+
+def test_close_questions_hit() -> None:
+    cache = SemanticCache(4, threshold=0.9)
+    cache.store(1, [1.0, 0.0], _response(), stream=False)
+
+    hit = cache.lookup(1, [0.99, 0.05], stream=False)
+    assert hit.choices[0].message.content == "hello"
+    assert hit.id != "chatcmpl-1"
+    # unrelated question, or same question in another context
+    assert cache.lookup(1, [0.0, 1.0], stream=False) is None
+    assert cache.lookup(2, [1.0, 0.0], stream=False) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    cache = SemanticCache(2, threshold=0.9)
+    cache.store(1, [1.0, 0.0, 0.0], _response("a"), stream=False)
+    cache.store(1, [0.0, 1.0, 0.0], _response("b"), stream=False)
+    assert cache.lookup(1, [1.0, 0.0, 0.0], stream=False) is not None
+    cache.store(1, [0.0, 0.0, 1.0], _response("c"), stream=False)
+
+    assert cache.lookup(1, [0.0, 1.0, 0.0], stream=False) is None
+    assert cache.lookup(1, [1.0, 0.0, 0.0], stream=False) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_same_question_replaces_its_entry() -> None:
+    cache = SemanticCache(4, threshold=0.9)
+    cache.store(1, [1.0, 0.0], _response("old"), stream=False)
+    cache.store(1, [1.0, 0.01], _response("new"), stream=False)
+    assert cache.stats()["size"] == 1
+    hit = cache.lookup(1, [1.0, 0.0], stream=False)
+    assert hit.choices[0].message.content == "new"
+
+
+def test_new_embedding_size_resets_the_cache() -> None:
+    cache = SemanticCache(4, threshold=0.9)
+    cache.store(1, [1.0, 0.0], _response(), stream=False)
+    assert cache.lookup(1, [1.0, 0.0, 0.0], stream=False) is None
+    cache.store(1, [1.0, 0.0, 0.0], _response(), stream=False)
+    assert cache.stats()["size"] == 1
+    assert cache.lookup(1, [1.0, 0.0], stream=False) is None
+
+
+def test_stream_is_answered_once_recorded() -> None:
+    async def main() -> None:
+        cache = SemanticCache(4, threshold=0.9)
+        recording = cache.store(1, [1.0, 0.0], _chunks("a", "b"), stream=True)
+        await recording.__anext__()
+        assert cache.lookup(1, [1.0, 0.0], stream=True) is None
+        await _read(recording)
+
+        replay = await _read(cache.lookup(1, [1.0, 0.0], stream=True))
+        assert [c.choices[0].delta.content for c in replay] == ["a", "b"]
+
+    asyncio.run(main())
+
+
+def test_entries_expire(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr("ramalama_stack.lru.time.monotonic", lambda: now[0])
+    cache = SemanticCache(4, threshold=0.9, ttl=10)
+    cache.store(1, [1.0, 0.0], _response(), stream=False)
+    now[0] += 11
+    assert cache.lookup(1, [1.0, 0.0], stream=False) is None
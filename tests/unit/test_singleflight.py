@@ -0,0 +1,251 @@
+import asyncio
+from typing import Any, AsyncIterator, List
+
+import pytest
+from openai.types.chat import ChatCompletion
+from openai.types.chat.chat_completion_chunk import (
+    ChatCompletionChunk,
+    Choice as ChunkChoice,
+    ChoiceDelta,
+)
+
+from ramalama_stack.singleflight import SingleFlight
+
+
+def _response() -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-1",
+            "created": 0,
+            "model": "m",
+            "object": "chat.completion",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "hello"},
+                }
+            ],
+        }
+    )
+
+
+def _chunk(content: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="chatcmpl-1",
+        created=0,
+        model="m",
+        object="chat.completion.chunk",
+        choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=content))],
+    )
+
+
+class _Upstream:
+    """
+    Answers once `release` is set, counting the calls and recording
+    whether they were cancelled or their streams closed.
+    """
+
+    def __init__(self, chunks: int = 3) -> None:
+        self.release = asyncio.Event()
+        self.calls = 0
+        self.cancelled = False
+        self.closed = False
+        self.chunks = chunks
+
+    async def call(self) -> ChatCompletion:
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return _response()
+
+    async def stream(self) -> AsyncIterator[ChatCompletionChunk]:
+        self.calls += 1
+        return self._chunks()
+
+    async def _chunks(self) -> AsyncIterator[ChatCompletionChunk]:
+        try:
+            for i in range(self.chunks):
+                yield _chunk(str(i))
+                await self.release.wait()
+        finally:
+            self.closed = True
+
+
+async def _settle() -> None:
+    # let cancellations and closes run through the tasks they cross
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _read(stream: AsyncIterator[Any]) -> List[Any]:
+    return [chunk async for chunk in stream]
+
+
+def test_concurrent_calls_share_one_upstream_call() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+        upstream = _Upstream()
+        calls = [
+            asyncio.ensure_future(flight.call("k", upstream.call)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        leader, *followers = await asyncio.gather(*calls)
+
+        assert upstream.calls == 1
+        ids = {leader.id} | {f.id for f in followers}
+        assert len(ids) == 3
+        assert all(f.choices == leader.choices for f in followers)
+        assert flight.stats() == {"flights": 1, "coalesced": 2, "in_flight": 0}
+
+    asyncio.run(main())
+
+
+def test_completed_calls_are_not_kept() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+        upstream = _Upstream()
+        upstream.release.set()
+        await flight.call("k", upstream.call)
+        await flight.call("k", upstream.call)
+        assert upstream.calls == 2
+        assert flight.stats()["coalesced"] == 0
+
+    asyncio.run(main())
+
+
+def test_errors_reach_every_caller() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+
+        async def fail() -> None:
+            await asyncio.sleep(0)
+            raise ValueError("bad request")
+
+        results = await asyncio.gather(
+            flight.call("k", fail), flight.call("k", fail), return_exceptions=True
+        )
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_call_is_cancelled_once_every_caller_gave_up() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+        upstream = _Upstream()
+        first = asyncio.ensure_future(flight.call("k", upstream.call))
+        second = asyncio.ensure_future(flight.call("k", upstream.call))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await _settle()
+        assert not upstream.cancelled
+        upstream.release.set()
+        assert (await second).choices[0].message.content == "hello"
+
+        upstream.release.clear()
+        third = asyncio.ensure_future(flight.call("k", upstream.call))
+        await asyncio.sleep(0)
+        third.cancel()
+        await _settle()
+        assert upstream.cancelled
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_streams_are_fanned_out_to_late_subscribers() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+        upstream = _Upstream()
+        leader = await flight.stream("k", upstream.stream)
+        first = await leader.__anext__()
+        follower = await flight.stream("k", upstream.stream)
+        reading = asyncio.ensure_future(_read(follower))
+        upstream.release.set()
+        rest = await _read(leader)
+        followed = await reading
+
+        assert upstream.calls == 1
+        contents = [c.choices[0].delta.content for c in [first, *rest]]
+        assert [c.choices[0].delta.content for c in followed] == contents
+        # a follower's chunks share one id, different from the leader's
+        assert len({c.id for c in followed}) == 1
+        assert followed[0].id != first.id
+        assert upstream.closed
+
+    asyncio.run(main())
+
+
+def test_stream_start_errors_are_raised_by_stream() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+
+        async def fail() -> AsyncIterator[Any]:
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await flight.stream("k", fail)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_stream_errors_reach_every_subscriber() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+
+        async def chunks() -> AsyncIterator[ChatCompletionChunk]:
+            yield _chunk("a")
+            await asyncio.sleep(0)
+            raise ConnectionError("lost")
+
+        async def send() -> AsyncIterator[ChatCompletionChunk]:
+            return chunks()
+
+        streams = [await flight.stream("k", send) for _ in range(2)]
+        results = await asyncio.gather(
+            *(_read(s) for s in streams), return_exceptions=True
+        )
+        assert [type(r) for r in results] == [ConnectionError, ConnectionError]
+
+    asyncio.run(main())
+
+
+def test_abandoned_stream_is_closed() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+        upstream = _Upstream()
+        first = await flight.stream("k", upstream.stream)
+        second = await flight.stream("k", upstream.stream)
+        await first.__anext__()
+        await second.__anext__()
+        await first.aclose()
+        await _settle()
+        assert not upstream.closed
+
+        await second.aclose()
+        await _settle()
+        assert upstream.closed
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
+
+
+def test_unread_stream_is_closed() -> None:
+    async def main() -> None:
+        flight = SingleFlight()
+        upstream = _Upstream()
+        stream = await flight.stream("k", upstream.stream)
+        await stream.aclose()
+        await _settle()
+        assert upstream.closed
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, List, Optional
+
+import pytest
+
+from ramalama_stack.streams import GuardedStream
+
+
+class _Upstream:
+    def __init__(self, items: List[Any], error: Optional[Exception] = None) -> None:
+        self.items = items
+        self.error = error
+        self.closed = False
+
+    def __aiter__(self) -> "_Upstream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self.items:
+            return self.items.pop(0)
+        if self.error is not None:
+            raise self.error
+        raise StopAsyncIteration
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def _guard(upstream: _Upstream, ended: List[Any]) -> GuardedStream:
+    return GuardedStream(upstream, done=ended.append)
+
+
+def test_exhausted_stream() -> None:
+    async def main() -> None:
+        upstream, ended, seen = _Upstream([1, 2]), [], []
+        stream = GuardedStream(upstream, on_chunk=seen.append, done=ended.append)
+        assert [chunk async for chunk in stream] == [1, 2]
+        assert seen == [1, 2]
+        assert ended == [None]
+        assert upstream.closed
+        await stream.aclose()
+        assert ended == [None]
+
+    asyncio.run(main())
+
+
+def test_failed_stream() -> None:
+    async def main() -> None:
+        upstream, ended = _Upstream([1], ConnectionError("lost")), []
+        with pytest.raises(ConnectionError):
+            async for _ in _guard(upstream, ended):
+                pass
+        assert [type(e) for e in ended] == [ConnectionError]
+        assert upstream.closed
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("read", [0, 1])
+def test_stream_closed_early(read: int) -> None:
+    async def main() -> None:
+        upstream, ended = _Upstream([1, 2]), []
+        stream = _guard(upstream, ended)
+        for _ in range(read):
+            await stream.__anext__()
+        await stream.aclose()
+        assert [type(e) for e in ended] == [GeneratorExit]
+        assert upstream.closed
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+
+    asyncio.run(main())
+
+
+def test_generator_and_its_upstream_are_closed() -> None:
+    async def main() -> None:
+        upstream = _Upstream([1, 2])
+        converted_closed = []
+
+        async def convert():
+            try:
+                async for item in upstream:
+                    yield item * 10
+            finally:
+                converted_closed.append(True)
+
+        # closed before the generator ever started
+        stream = GuardedStream(convert(), upstream=upstream)
+        await stream.aclose()
+        assert upstream.closed
+
+        upstream = _Upstream([1, 2])
+        stream = GuardedStream(convert(), upstream=upstream)
+        assert await stream.__anext__() == 10
+        await stream.aclose()
+        assert upstream.closed
+        assert converted_closed == [True]
+
+    asyncio.run(main())